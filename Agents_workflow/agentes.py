@@ -1,45 +1,84 @@
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
 from agno.models.ollama import Ollama
-from clases import JudgeDecision, TextoAnonimizado, CaseStatus
-from instrucciones import get_anonymizer_instructions, get_judge_anonymizer_instructions, get_reviewer_instructions, get_judge_reviewer_instructions
+from clases import BatchJudgeDecision, JudgeDecision, TextoAnonimizado, CaseStatus
+from instrucciones import get_anonymizer_instructions, get_judge_anonymizer_instructions, get_reviewer_instructions, get_judge_reviewer_instructions, get_batch_judge_instructions
 
-def create_anonymizer_agent(model_name: str) -> Agent:
+PROVIDERS = ("ollama", "openai")
+
+def create_model(provider: str, model_name: str, timeout: float | None = None, max_retries: int | None = None):
+    """
+    Crea el modelo de agno del proveedor indicado ("ollama" u "openai").
+    `timeout` se aplica a los dos clientes y `max_retries` solo al de OpenAI (None = valores por defecto del cliente).
+    """
+    if provider == "ollama":
+        return Ollama(id=model_name, timeout=timeout)
+    if provider == "openai":
+        return OpenAIChat(id=model_name, timeout=timeout, max_retries=max_retries)
+    raise ValueError(f"Proveedor de modelos no soportado: {provider}")
+
+def create_anonymizer_agent(model_name: str, provider: str = "ollama", timeout: float | None = None, max_retries: int | None = None) -> Agent:
     """Crea y devuelve el agente anonimizador."""
     return Agent(
         name="Anonimizador",
         role="Tu tarea es anonimizar el texto que se te proporciona.",
-        model=Ollama(id=model_name), response_model=TextoAnonimizado,
+        model=create_model(provider, model_name, timeout, max_retries), response_model=TextoAnonimizado,
         description="Eres un AgnoAnom, un anonimizador de texto en idioma español.",
         instructions=[get_anonymizer_instructions()]
     )
 
-def create_judge_agent(model_name: str) -> Agent:
+def create_judge_agent(model_name: str, provider: str = "ollama", timeout: float | None = None, max_retries: int | None = None) -> Agent:
     """Crea y devuelve el juez de anonimización."""
     return Agent(
         name="JuezDeAnonimizacion",
         role="Tu tarea es evaluar el trabajo del Anonimizador.",
-        model=Ollama(id=model_name), response_model=JudgeDecision,
+        model=create_model(provider, model_name, timeout, max_retries), response_model=JudgeDecision,
         description="Eres AgnoJuez, tu tarea es comparar un texto original con su versión anonimizada.",
         instructions=get_judge_anonymizer_instructions()
     )
 
-def create_case_reviewer_agent(department_descriptions: str, model_name: str) -> Agent:
-    """Crea y devuelve un agente revisor de casos con las descripciones de departamento incluidas."""
+def create_case_reviewer_agent(department_descriptions: str, model_name: str, provider: str = "openai", timeout: float | None = None, max_retries: int | None = None) -> Agent:
+    """
+    Crea y devuelve un agente revisor de casos con las descripciones de departamento incluidas.
+    `timeout` y `max_retries` se pasan al cliente de OpenAI (None = valores por defecto del cliente).
+    """
     return Agent(
         name="RevisorDeCasos",
         role="Tu tarea es analizar el estado de un caso y determinar las acciones necesarias.",
-        model=OpenAIChat(id=model_name), response_model=CaseStatus,
+        model=create_model(provider, model_name, timeout, max_retries), response_model=CaseStatus,
         description="Eres un experto en análisis de casos de soporte.",
         instructions=[get_reviewer_instructions(department_descriptions)]
     )
 
-def create_case_review_judge_agent(department_descriptions: str, model_name: str) -> Agent:
-    """Crea y devuelve un agente juez de revisión con las descripciones de departamento incluidas."""
+def create_case_review_judge_agent(department_descriptions: str, model_name: str, provider: str = "openai", timeout: float | None = None, max_retries: int | None = None) -> Agent:
+    """
+    Crea y devuelve un agente juez de revisión con las descripciones de departamento incluidas.
+    `timeout` y `max_retries` se pasan al cliente de OpenAI (None = valores por defecto del cliente).
+    """
     return Agent(
         name="JuezDeRevisionDeCasos",
         role="Tu tarea es evaluar el análisis de un caso de soporte.",
-        model=OpenAIChat(id=model_name), response_model=JudgeDecision,
+        model=create_model(provider, model_name, timeout, max_retries), response_model=JudgeDecision,
         description="Eres un auditor experto que evalúa la clasificación de un caso.",
         instructions=[get_judge_reviewer_instructions(department_descriptions)]
-    ) 
\ No newline at end of file
+    )
+
+def create_batch_judge_agent(model_name: str, provider: str = "ollama", timeout: float | None = None, max_retries: int | None = None) -> Agent:
+    """Crea y devuelve el juez de anonimización por lotes, que evalúa varias anonimizaciones en una sola llamada."""
+    return Agent(
+        name="JuezDeAnonimizacionPorLotes",
+        role="Tu tarea es evaluar el trabajo del Anonimizador en varios textos a la vez.",
+        model=create_model(provider, model_name, timeout, max_retries), response_model=BatchJudgeDecision,
+        description="Eres AgnoJuez, tu tarea es comparar textos originales con sus versiones anonimizadas.",
+        instructions=get_judge_anonymizer_instructions() + get_batch_judge_instructions()
+    )
+
+def create_batch_case_review_judge_agent(department_descriptions: str, model_name: str, provider: str = "openai", timeout: float | None = None, max_retries: int | None = None) -> Agent:
+    """Crea y devuelve el juez de revisión por lotes, con las descripciones de departamento incluidas una sola vez por lote."""
+    return Agent(
+        name="JuezDeRevisionDeCasosPorLotes",
+        role="Tu tarea es evaluar el análisis de varios casos de soporte a la vez.",
+        model=create_model(provider, model_name, timeout, max_retries), response_model=BatchJudgeDecision,
+        description="Eres un auditor experto que evalúa la clasificación de varios casos.",
+        instructions=[get_judge_reviewer_instructions(department_descriptions)] + get_batch_judge_instructions()
+    )
@@ -0,0 +1,200 @@
+import json
+import logging
+import threading
+import time
+import urllib.request
+from ollama import Client as OllamaClient
+from concurrencia import CaseDeadlineExceeded, case_deadline
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """Indica si el error es un fallo de conexión con el servidor, recorriendo también las causas encadenadas."""
+    while error is not None:
+        if isinstance(error, ConnectionError) or type(error).__name__ in ("ConnectError", "ConnectTimeout", "RemoteProtocolError"):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class OllamaEndpoint:
+    """Un servidor de Ollama del pool, con su cliente y sus contadores."""
+    def __init__(self, host: str, timeout: float | None = None):
+        self.host = host.rstrip("/")
+        # El cliente usa un httpx.Client, que se puede compartir entre hilos y reutiliza las conexiones
+        self.client = OllamaClient(host=self.host, timeout=timeout)
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.removals = 0
+
+    def summary(self) -> dict:
+        return {
+            "disponible": self.healthy,
+            "en_curso": self.outstanding,
+            "peticiones": self.requests,
+            "fallos": self.failures,
+            "expulsiones": self.removals,
+        }
+
+
+class OllamaPool:
+    """
+    Pool de servidores de Ollama con reparto por menor número de peticiones en curso.
+
+    Cada llamada se envía al servidor disponible con menos peticiones en curso (los empates se reparten por
+    turnos) y cada servidor atiende como mucho `max_per_host` peticiones a la vez; si todos están ocupados,
+    la llamada espera a que se libere un hueco. Un servidor que falla al conectar se expulsa del pool. Un hilo
+    en segundo plano comprueba cada `health_interval` segundos el endpoint `/api/tags` de todos los servidores:
+    expulsa los que no responden o no tienen los modelos `model_names` y vuelve a admitir los que se recuperan.
+
+    Si no queda ningún servidor disponible, las llamadas esperan hasta `unavailable_wait` segundos a que
+    se readmita alguno antes de fallar con `ConnectionError`.
+    """
+    def __init__(self, hosts: list[str], max_per_host: int, model_names: list[str] | None = None, timeout: float | None = None,
+                 health_interval: float = 10.0, health_timeout: float = 2.0, unavailable_wait: float = 60.0):
+        if not hosts:
+            raise ValueError("El pool de Ollama necesita al menos un servidor")
+        self.endpoints = [OllamaEndpoint(host, timeout) for host in hosts]
+        self.max_per_host = max_per_host
+        self.model_names = list(model_names or [])
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.unavailable_wait = unavailable_wait
+        self._next = 0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Comprueba el estado de los servidores y arranca las comprobaciones periódicas en segundo plano."""
+        self.check_health()
+        self._thread = threading.Thread(target=self._health_loop, name="salud-ollama", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Detiene las comprobaciones periódicas."""
+        self._stop.set()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def _probe(self, endpoint: OllamaEndpoint) -> bool:
+        try:
+            with urllib.request.urlopen(f"{endpoint.host}/api/tags", timeout=self.health_timeout) as response:
+                tags = json.loads(response.read())
+        except Exception:
+            return False
+        available = {model.get("name") for model in tags.get("models", [])} | {model.get("model") for model in tags.get("models", [])}
+        return all(name in available or f"{name}:latest" in available for name in self.model_names)
+
+    def check_health(self):
+        """Comprueba todos los servidores y actualiza cuáles están disponibles."""
+        for endpoint in self.endpoints:
+            healthy = self._probe(endpoint)
+            with self._condition:
+                if healthy and not endpoint.healthy:
+                    logging.info(f"Servidor de Ollama {endpoint.host} disponible de nuevo, se readmite en el pool.")
+                    endpoint.healthy = True
+                    self._condition.notify_all()
+                elif not healthy and endpoint.healthy:
+                    self._remove_locked(endpoint, "no responde a la comprobación de estado")
+
+    def _remove_locked(self, endpoint: OllamaEndpoint, reason: str):
+        endpoint.healthy = False
+        endpoint.removals += 1
+        logging.warning(f"Servidor de Ollama {endpoint.host} {reason}, se expulsa del pool.")
+
+    def acquire(self) -> OllamaEndpoint:
+        """
+        Reserva un hueco en el servidor disponible con menos peticiones en curso, esperando si hace falta.
+
+        Raises:
+            ConnectionError: Si no hay ningún servidor disponible durante `unavailable_wait` segundos.
+            CaseDeadlineExceeded: Si se agota el tiempo máximo del caso en curso mientras espera.
+        """
+        deadline = case_deadline.get()
+        unavailable_since = None
+        with self._condition:
+            while True:
+                candidates = [e for e in self.endpoints if e.healthy and e.outstanding < self.max_per_host]
+                if candidates:
+                    count = len(self.endpoints)
+                    endpoint = min(candidates, key=lambda e: (e.outstanding, (self.endpoints.index(e) - self._next) % count))
+                    self._next = (self.endpoints.index(endpoint) + 1) % count
+                    endpoint.outstanding += 1
+                    endpoint.requests += 1
+                    return endpoint
+
+                now = time.monotonic()
+                wait_seconds = None
+                if not any(e.healthy for e in self.endpoints):
+                    unavailable_since = unavailable_since or now
+                    if now - unavailable_since >= self.unavailable_wait:
+                        raise ConnectionError(f"Ningún servidor de Ollama del pool está disponible tras {self.unavailable_wait:g} s")
+                    wait_seconds = self.unavailable_wait - (now - unavailable_since)
+                else:
+                    unavailable_since = None
+                if deadline is not None:
+                    if now >= deadline:
+                        raise CaseDeadlineExceeded("Tiempo máximo del caso agotado esperando a un servidor de Ollama")
+                    wait_seconds = min(wait_seconds or deadline - now, deadline - now)
+                self._condition.wait(wait_seconds)
+
+    def release(self, endpoint: OllamaEndpoint, error: BaseException | None = None):
+        """Libera el hueco del servidor; si la llamada falló al conectar, el servidor se expulsa del pool."""
+        with self._condition:
+            endpoint.outstanding -= 1
+            if error is not None and is_connection_error(error):
+                endpoint.failures += 1
+                if endpoint.healthy:
+                    self._remove_locked(endpoint, f"ha fallado al conectar ({error})")
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Devuelve los contadores de cada servidor del pool."""
+        with self._condition:
+            return {endpoint.host: endpoint.summary() for endpoint in self.endpoints}
+
+
+class PooledOllamaAgent:
+    """
+    Envoltorio de un agente de Ollama que envía cada llamada a un servidor del `OllamaPool`.
+
+    Antes de cada llamada se asigna al modelo de la instancia del hilo actual el cliente del servidor elegido.
+    Si la llamada falla al conectar, el servidor se expulsa y la llamada se repite en otro servidor. Si la
+    llamada se abandona por timeout (`pending_call` de la excepción), su hueco en el servidor se libera
+    cuando la petición termina de verdad, no al abandonarla.
+    """
+    def __init__(self, agent, pool: OllamaPool):
+        self._wrapped = agent
+        self._pool = pool
+        self.name = getattr(agent, "name", None) or getattr(agent, "agent").name
+
+    @property
+    def agent(self):
+        """Devuelve el agente de agno que hay debajo del envoltorio."""
+        return getattr(self._wrapped, "agent", self._wrapped)
+
+    def run(self, message: str, **kwargs):
+        """Ejecuta el agente en el servidor disponible con menos peticiones en curso."""
+        for attempt in range(len(self._pool.endpoints)):
+            endpoint = self._pool.acquire()
+            model = self.agent.model
+            model.host, model.client = endpoint.host, endpoint.client
+            try:
+                response = self._wrapped.run(message, **kwargs)
+            except Exception as e:
+                pending_call = getattr(e, "pending_call", None)
+                if pending_call is not None:
+                    # La llamada se ha abandonado por timeout pero sigue en curso: el servidor sigue ocupado hasta que termine
+                    pending_call.add_done_callback(lambda call, endpoint=endpoint: self._pool.release(endpoint, call.exception()))
+                else:
+                    self._pool.release(endpoint, e)
+                if not is_connection_error(e) or attempt == len(self._pool.endpoints) - 1:
+                    raise
+                logging.warning(f"{self.name}: el servidor {endpoint.host} no responde, se repite la llamada en otro servidor.")
+            else:
+                self._pool.release(endpoint)
+                return response
@@ -0,0 +1,219 @@
+"""
+Benchmark del workflow completo sin modelos reales.
+
+Genera un `cases.json` y un `departments.json` sintéticos del tamaño indicado en un directorio de trabajo,
+arranca servidores falsos (`servidor_llm_falso.py`) en puertos libres, uno compatible con OpenAI y uno o
+varios compatibles con Ollama, y ejecuta `main()` en un subproceso contra ellos. Los servidores simulan la
+latencia (con la distribución elegida), los rechazos de los jueces, los errores 429 y las peticiones colgadas;
+con `--semilla`, dos ejecuciones con los mismos parámetros reciben las mismas respuestas.
+
+Informa de los casos por segundo, los percentiles del tiempo por caso de cada fase (a partir de
+`agent_metrics.jsonl`), el resumen por agente, las peticiones que han recibido los servidores y el pico de
+memoria (RSS) del proceso del workflow. La configuración del workflow (MAX_CONCURRENT_CASES, PIPELINE_MODE,
+BATCH_JUDGE...) se toma de las variables de entorno, como en `main.py`.
+
+Uso:
+    python benchmark.py --casos 200 --latencia-ollama-ms 50 --latencia-openai-ms 20
+    MAX_CONCURRENT_CASES=8 python benchmark.py --casos 500 --servidores-ollama 2 --prob-rechazo 0.2 --semilla 1
+    PIPELINE_MODE=true python benchmark.py --casos 500 --prob-429 0.05 --prob-timeout 0.01 --timeout-llamada-s 5
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from metricas import percentile
+
+WORKFLOW_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Agentes de cada fase en agent_metrics.jsonl
+PHASE_AGENTS = {
+    "anonimizacion": ("Anonimizador", "JuezDeAnonimizacion", "JuezDeAnonimizacionPorLotes"),
+    "revision": ("RevisorDeCasos", "JuezDeRevisionDeCasos", "JuezDeRevisionDeCasosPorLotes"),
+}
+
+FIRST_NAMES = ["Ana", "Luis", "Marta", "Javier", "Lucía", "Carlos", "Elena", "Pablo"]
+LAST_NAMES = ["García", "Martínez", "López", "Sánchez", "Pérez", "Gómez", "Fernández", "Ruiz"]
+CITIES = ["Madrid", "Sevilla", "Valencia", "Bilbao", "Zaragoza", "Málaga"]
+SENTENCES = [
+    "El router que compró no enciende desde ayer.",
+    "Solicita la devolución del importe de la última factura.",
+    "El técnico no se presentó a la cita acordada.",
+    "La aplicación muestra un error al iniciar sesión.",
+    "Pide que se revise el cargo duplicado en su cuenta.",
+    "La conexión se corta varias veces al día.",
+]
+
+# Se ejecuta en el subproceso del workflow: importa main.py desde WORKFLOW_DIR y escribe el pico de memoria
+CHILD_CODE = """
+import json, resource, sys
+sys.path.insert(0, sys.argv[1])
+import main
+main.main()
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"rss_pico_mb": round(peak / 1_000_000 if sys.platform == "darwin" else peak / 1000, 1)}))
+"""
+
+
+def generate_inputs(directory: str, n_cases: int, report_chars: int, n_departments: int, seed: int | None):
+    """Escribe `cases.json` y `departments.json` sintéticos en `directory`, con datos personales en los informes."""
+    rng = random.Random(seed)
+    with open(os.path.join(directory, "cases.json"), "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i in range(n_cases):
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            report = (f"{name} llamó desde {rng.choice(CITIES)} (teléfono 6{rng.randint(10_000_000, 99_999_999)}, "
+                      f"correo {name.split()[0].lower()}{i}@example.com).")
+            while len(report) < report_chars:
+                report += " " + rng.choice(SENTENCES)
+            case = json.dumps({"caseID": str(i).zfill(3), "report": report}, ensure_ascii=False)
+            f.write(case + (",\n" if i < n_cases - 1 else "\n"))
+        f.write("]\n")
+    departments = [{"departmentID": f"DEP{i:02d}", "description": f"Departamento {i}: incidencias de tipo {i}"}
+                   for i in range(n_departments)]
+    with open(os.path.join(directory, "departments.json"), "w", encoding="utf-8") as f:
+        json.dump(departments, f, ensure_ascii=False)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, args, latency_ms: float, parallel: int = 0) -> subprocess.Popen:
+    """Arranca un servidor falso en `port` y espera a que responda."""
+    command = [sys.executable, os.path.join(WORKFLOW_DIR, "servidor_llm_falso.py"), "--puerto", str(port),
+               "--latencia-ms", str(latency_ms), "--distribucion-latencia", args.distribucion,
+               "--prob-rechazo", str(args.prob_rechazo), "--prob-429", str(args.prob_429), "--rpm", str(args.rpm),
+               "--prob-timeout", str(args.prob_timeout), "--espera-timeout-s", str(args.timeout_llamada_s * 2),
+               "--paralelas", str(parallel)]
+    if args.semilla is not None:
+        command += ["--semilla", str(args.semilla)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/v1/stats", timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise Exception(f"El servidor falso del puerto {port} no ha arrancado")
+
+
+def server_stats(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/v1/stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def phase_latencies(metrics_path: str) -> tuple[dict, dict]:
+    """
+    Lee `agent_metrics.jsonl` y devuelve los percentiles del tiempo por caso de cada fase (desde el inicio de
+    la primera llamada de la fase hasta el final de la última, con reintentos) y el resumen por agente.
+    """
+    spans = {phase: {} for phase in PHASE_AGENTS}
+    summary = {}
+    if not os.path.isfile(metrics_path):
+        return {}, summary
+    with open(metrics_path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("tipo") == "resumen":
+                summary = record.get("agentes", {})
+                continue
+            phase = next((name for name, agents in PHASE_AGENTS.items() if record.get("agente") in agents), None)
+            if phase is None or record.get("caso") is None:
+                continue
+            start = datetime.fromisoformat(record["fecha"]).timestamp()
+            end = start + record.get("ms", 0) / 1000
+            first, last = spans[phase].get(record["caso"], (start, end))
+            spans[phase][record["caso"]] = (min(first, start), max(last, end))
+
+    latencies = {}
+    for phase, per_case in spans.items():
+        values = sorted((last - first) * 1000 for first, last in per_case.values())
+        if values:
+            latencies[phase] = {"casos": len(values), **{f"p{p}_ms": round(percentile(values, p), 1) for p in (50, 95, 99)}}
+    return latencies, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del workflow completo con servidores de modelos falsos.")
+    parser.add_argument("--casos", type=int, default=100, help="Número de casos sintéticos.")
+    parser.add_argument("--caracteres", type=int, default=600, help="Longitud aproximada de cada informe.")
+    parser.add_argument("--departamentos", type=int, default=8, help="Número de departamentos sintéticos.")
+    parser.add_argument("--servidores-ollama", type=int, default=1, help="Servidores falsos de Ollama (más de uno usa OLLAMA_HOSTS).")
+    parser.add_argument("--paralelas-ollama", type=int, default=1, help="Peticiones que atiende a la vez cada servidor de Ollama (0 = sin límite).")
+    parser.add_argument("--latencia-ollama-ms", type=float, default=100, help="Latencia media de los servidores de Ollama.")
+    parser.add_argument("--latencia-openai-ms", type=float, default=50, help="Latencia media del servidor de OpenAI.")
+    parser.add_argument("--distribucion", choices=["exponencial", "constante", "lognormal"], default="exponencial",
+                        help="Distribución de la latencia de los servidores.")
+    parser.add_argument("--prob-rechazo", type=float, default=0.1, help="Probabilidad de que un juez rechace una respuesta.")
+    parser.add_argument("--prob-429", type=float, default=0.0, help="Probabilidad de que el servidor de OpenAI responda 429.")
+    parser.add_argument("--rpm", type=int, default=0, help="Límite de peticiones por minuto del servidor de OpenAI (0 = sin límite).")
+    parser.add_argument("--prob-timeout", type=float, default=0.0, help="Probabilidad de que una petición se quede colgada.")
+    parser.add_argument("--timeout-llamada-s", type=float, default=10, help="Timeout de cada llamada a un agente en el workflow.")
+    parser.add_argument("--semilla", type=int, default=None, help="Semilla de los datos sintéticos y de los servidores.")
+    parser.add_argument("--directorio", default=None, help="Directorio de trabajo (por defecto uno temporal que se borra al terminar).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        directory = os.path.abspath(args.directorio or tmp_dir)
+        os.makedirs(directory, exist_ok=True)
+        generate_inputs(directory, args.casos, args.caracteres, args.departamentos, args.semilla)
+
+        openai_port = free_port()
+        ollama_ports = [free_port() for _ in range(args.servidores_ollama)]
+        servers = [start_server(openai_port, args, args.latencia_openai_ms)]
+        try:
+            servers += [start_server(port, args, args.latencia_ollama_ms, args.paralelas_ollama) for port in ollama_ports]
+            ollama_hosts = [f"http://127.0.0.1:{port}" for port in ollama_ports]
+            env = {
+                **os.environ,
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+                "OPENAI_API_KEY": "falsa",
+                "CACHE_ENABLED": "false",
+                "AGENT_CALL_TIMEOUT_SECONDS": str(args.timeout_llamada_s),
+                "OPENAI_TIMEOUT_SECONDS": str(args.timeout_llamada_s),
+            }
+            if len(ollama_hosts) > 1:
+                env["OLLAMA_HOSTS"] = ",".join(ollama_hosts)
+            else:
+                env["OLLAMA_HOST"] = ollama_hosts[0]
+
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, "-c", CHILD_CODE, WORKFLOW_DIR], cwd=directory, env=env,
+                                       capture_output=True, text=True)
+            seconds = time.perf_counter() - start
+            if completed.returncode != 0:
+                raise Exception(f"Error al ejecutar el workflow:\n{completed.stderr[-2000:]}")
+            memory = json.loads(completed.stdout.strip().splitlines()[-1])
+            stats = {"openai": server_stats(openai_port), "ollama": [server_stats(port) for port in ollama_ports]}
+        finally:
+            for server in servers:
+                server.terminate()
+                server.wait()
+
+        from journal import read_done_ids
+        done = len(read_done_ids(os.path.join(directory, "processed_cases.journal")))
+        latencies, summary = phase_latencies(os.path.join(directory, os.getenv("METRICS_FILE", "agent_metrics.jsonl")))
+        print(json.dumps({
+            "casos": args.casos,
+            "casos_completados": done,
+            "segundos": round(seconds, 2),
+            "casos_por_segundo": round(done / seconds, 2) if seconds else 0,
+            **memory,
+            "fases": latencies,
+            "agentes": summary,
+            "servidores": stats,
+        }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
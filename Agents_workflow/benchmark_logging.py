@@ -0,0 +1,123 @@
+"""
+Benchmark del coste del logging por caso.
+
+Simula los registros de un caso del workflow (mensajes de progreso, el texto anonimizado de cada intento y la
+salida final) desde varios hilos a la vez y mide, para cada configuración, el tiempo que pasan los hilos de los
+casos en las llamadas a `logging`, el tiempo hasta que todo está escrito y el tamaño del log:
+
+-   `antes`: la configuración anterior, con `FileHandler` y `StreamHandler` síncronos y los textos completos.
+-   `despues`: la de `registro.py`, con cola, JSONL, textos redactados según `--payload` y rotación.
+
+La consola se redirige a /dev/null para medir solo el coste de formatear y escribir.
+
+Uso:
+    python benchmark_logging.py --casos 2000 --hilos 4
+    python benchmark_logging.py --casos 2000 --payload truncado --muestreo-info 0.1
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrencia import CaseIdFilter, current_case_id
+from registro import PAYLOAD_MODES, TEXT_FORMAT, setup_logging
+
+SAMPLE_TEXT = ("Buenos días, soy [NOMBRE] y escribo desde [LUGAR]. El router que compré no enciende desde ayer "
+               "y el servicio técnico no me da cita hasta dentro de dos semanas. ")
+
+
+def log_case(case_id: str, text_chars: int, attempts: int, full_payload_in_message: bool) -> float:
+    """Emite los registros de un caso y devuelve los segundos que ha pasado en las llamadas a logging."""
+    current_case_id.set(case_id)
+    text = (SAMPLE_TEXT * (text_chars // len(SAMPLE_TEXT) + 1))[:text_chars]
+    output = {"status": "open", "actions": "Revisar el router", "info": text[:300], "department": "Soporte", "caseID": case_id}
+    start = time.perf_counter()
+    logging.info(f"\n--- Procesando caso (ID: {case_id}) ---")
+    logging.info("--- FASE 1: Iniciando Proceso Secuencial de Anonimización ---")
+    for attempt in range(1, attempts + 1):
+        logging.info(f"\nIntento de anonimización {attempt}/5...")
+        if full_payload_in_message:
+            logging.info(f"Texto anonimizado (intento {attempt}):\n{text}")
+        else:
+            logging.info(f"Texto anonimizado (intento {attempt}):", extra={"payload": text})
+        logging.info("El Juez ha aprobado la anonimización." if attempt == attempts else "El Juez ha rechazado la anonimización. Reintentando...")
+    logging.info("--- FASE 2: Revisión de Caso ---")
+    logging.info("Intento 1/5")
+    logging.info("El Juez ha aprobado la revisión.")
+    logging.info("\n--- Proceso completado para el caso ---")
+    if full_payload_in_message:
+        logging.info("\n--- Salida JSON Final ---")
+        logging.info(json.dumps(output, indent=2, ensure_ascii=False))
+    else:
+        logging.info("\n--- Salida JSON Final ---", extra={"payload": output})
+    return time.perf_counter() - start
+
+
+def configure_before(path: str, console):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in (logging.FileHandler(path, encoding="utf-8"), logging.StreamHandler(console)):
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handler.addFilter(CaseIdFilter())
+        root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def run(config: str, args, directory: str) -> dict:
+    path = os.path.join(directory, f"{config}.log")
+    console = open(os.devnull, "w", encoding="utf-8")
+    listener = None
+    if config == "antes":
+        configure_before(path, console)
+    else:
+        listener = setup_logging(path, payload_mode=args.payload, sample_rates={logging.INFO: args.muestreo_info},
+                                 max_bytes=args.max_mb * 1_000_000, stream=console)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.hilos) as executor:
+        in_logging = list(executor.map(lambda i: log_case(f"{i:06d}", args.caracteres, args.intentos, config == "antes"),
+                                       range(args.casos)))
+    producers_done = time.perf_counter() - start
+    if listener is not None:
+        listener.stop()
+        atexit.unregister(listener.stop)
+    total = time.perf_counter() - start
+
+    for handler in list(logging.getLogger().handlers):
+        handler.close()
+        logging.getLogger().removeHandler(handler)
+    console.close()
+    log_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.startswith(f"{config}.log"))
+    in_logging.sort()
+    return {
+        "configuracion": config,
+        "ms_logging_por_caso_media": round(sum(in_logging) / len(in_logging) * 1000, 3),
+        "ms_logging_por_caso_p95": round(in_logging[int(0.95 * (len(in_logging) - 1))] * 1000, 3),
+        "segundos_hilos_de_casos": round(producers_done, 3),
+        "segundos_hasta_escrito": round(total, 3),
+        "bytes_log_por_caso": round(log_bytes / args.casos),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del coste del logging por caso.")
+    parser.add_argument("--casos", type=int, default=2000, help="Casos simulados.")
+    parser.add_argument("--hilos", type=int, default=4, help="Casos que registran a la vez.")
+    parser.add_argument("--caracteres", type=int, default=3000, help="Longitud del texto de cada caso.")
+    parser.add_argument("--intentos", type=int, default=2, help="Intentos de anonimización por caso.")
+    parser.add_argument("--payload", choices=PAYLOAD_MODES, default="hash", help="Tratamiento de los textos en la configuración nueva.")
+    parser.add_argument("--muestreo-info", type=float, default=1.0, help="Fracción de casos con registros INFO en la configuración nueva.")
+    parser.add_argument("--max-mb", type=int, default=50, help="Tamaño de rotación del log en la configuración nueva.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [run(config, args, directory) for config in ("antes", "despues")]
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
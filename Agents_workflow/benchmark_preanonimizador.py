@@ -0,0 +1,85 @@
+"""
+Benchmark de la pre-anonimización con reglas.
+
+Ejecuta la fase 1 sobre un corpus de casos dos veces, sin y con `pre_anonymize`, y cuenta cuántos intentos
+del anonimizador necesita cada caso. Con `--solo-reglas` no llama a ningún modelo y solo informa de las
+sustituciones que hacen las reglas en cada caso.
+
+Uso:
+    python benchmark_preanonimizador.py --corpus cases.json
+    python benchmark_preanonimizador.py --corpus cases.json --solo-reglas
+"""
+import argparse
+import json
+from statistics import mean
+from agentes import create_anonymizer_agent, create_judge_agent
+from herramientas import load_json_file
+from main import MODEL_OLLAMA_NAME, run_anonymization_process
+from preanonimizador import pre_anonymize
+
+
+class CallCounter:
+    """Envoltorio de un agente que cuenta las llamadas a `run`."""
+    def __init__(self, agent):
+        self.agent = agent
+        self.calls = 0
+
+    def run(self, message: str, **kwargs):
+        self.calls += 1
+        return self.agent.run(message, **kwargs)
+
+
+def count_attempts(text: str, anonymizer, judge, max_retries: int, use_rules: bool) -> tuple[int, bool]:
+    """Devuelve el número de intentos de anonimización de un texto y si el juez terminó aprobando alguno."""
+    counter = CallCounter(anonymizer)
+    result = run_anonymization_process(text, counter, judge, max_retries=max_retries, use_rules=use_rules)
+    return counter.calls, result is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la pre-anonimización con reglas.")
+    parser.add_argument("--corpus", default="cases.json", help="Fichero JSON con la lista de casos ('caseID' y 'report').")
+    parser.add_argument("--max-retries", type=int, default=5, help="Intentos máximos por caso.")
+    parser.add_argument("--solo-reglas", action="store_true", help="No llama a los modelos, solo cuenta las sustituciones de las reglas.")
+    args = parser.parse_args()
+
+    cases = [case for case in load_json_file(args.corpus) if case.get("report")]
+
+    if args.solo_reglas:
+        per_case = [{"caseID": case.get("caseID"), "sustituciones": pre_anonymize(case["report"])[1]} for case in cases]
+        total = sum(sum(row["sustituciones"].values()) for row in per_case)
+        print(json.dumps({"casos": len(per_case),
+                          "casos_con_sustituciones": sum(1 for row in per_case if row["sustituciones"]),
+                          "sustituciones_totales": total,
+                          "detalle": per_case}, indent=2, ensure_ascii=False))
+        return
+
+    anonymizer = create_anonymizer_agent(model_name=MODEL_OLLAMA_NAME)
+    judge = create_judge_agent(model_name=MODEL_OLLAMA_NAME)
+
+    per_case = []
+    for case in cases:
+        attempts_llm, ok_llm = count_attempts(case["report"], anonymizer, judge, args.max_retries, use_rules=False)
+        attempts_rules, ok_rules = count_attempts(case["report"], anonymizer, judge, args.max_retries, use_rules=True)
+        per_case.append({
+            "caseID": case.get("caseID"),
+            "intentos_sin_reglas": attempts_llm,
+            "intentos_con_reglas": attempts_rules,
+            "reintentos_ahorrados": attempts_llm - attempts_rules,
+            "aprobado_sin_reglas": ok_llm,
+            "aprobado_con_reglas": ok_rules,
+        })
+
+    print(json.dumps({
+        "casos": len(per_case),
+        "intentos_medios_sin_reglas": round(mean(row["intentos_sin_reglas"] for row in per_case), 2) if per_case else 0,
+        "intentos_medios_con_reglas": round(mean(row["intentos_con_reglas"] for row in per_case), 2) if per_case else 0,
+        "reintentos_ahorrados_por_caso": round(mean(row["reintentos_ahorrados"] for row in per_case), 2) if per_case else 0,
+        "agotados_sin_reglas": sum(1 for row in per_case if not row["aprobado_sin_reglas"]),
+        "agotados_con_reglas": sum(1 for row in per_case if not row["aprobado_con_reglas"]),
+        "detalle": per_case,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark de memoria de la lectura incremental de casos.
+
+Genera un fichero de casos sintéticos (array JSON o JSON Lines) y mide el pico de memoria (RSS) de leerlo
+con `iter_cases`, filtrando los casos ya procesados con un `CaseJournal`, frente a cargarlo entero con
+`load_json_file`. Cada lectura se ejecuta en un subproceso para medir su pico de memoria por separado.
+
+Uso:
+    python benchmark_streaming.py --casos 1000000
+    python benchmark_streaming.py --casos 1000000 --formato jsonl --sin-comparar
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def generate_cases(path: str, n_cases: int, fmt: str, report_chars: int):
+    """Escribe `n_cases` casos sintéticos en `path` como array JSON o como JSON Lines."""
+    filler = ("El cliente informa de una incidencia con su pedido y solicita que se revise. " * (report_chars // 78 + 1))[:report_chars]
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            f.write("[\n")
+        for i in range(n_cases):
+            case = json.dumps({"caseID": str(i).zfill(3), "report": f"Caso {i}. {filler}"}, ensure_ascii=False)
+            if fmt == "json":
+                f.write(case + (",\n" if i < n_cases - 1 else "\n"))
+            else:
+                f.write(case + "\n")
+        if fmt == "json":
+            f.write("]\n")
+
+
+def peak_rss_mb() -> float:
+    """Pico de memoria residente del proceso actual en MB (Linux devuelve KB, macOS bytes)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1_000_000 if sys.platform == "darwin" else peak / 1000
+
+
+def measure(path: str, mode: str, journal_path: str | None):
+    """Lee el fichero en el modo indicado y escribe en stdout un JSON con el resultado (se ejecuta en un subproceso)."""
+    from herramientas import iter_cases, load_json_file
+    from journal import CaseJournal
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    journal = CaseJournal(journal_path) if journal_path else None
+    if mode == "streaming":
+        pending = sum(1 for case in iter_cases(path) if journal is None or not journal.is_done(case.get("caseID")))
+    else:
+        pending = sum(1 for case in load_json_file(path) if journal is None or not journal.is_done(case.get("caseID")))
+    print(json.dumps({
+        "modo": mode,
+        "casos_pendientes": pending,
+        "segundos": round(time.perf_counter() - start, 2),
+        "rss_pico_mb": round(peak_rss_mb(), 1),
+        "rss_pico_sobre_base_mb": round(peak_rss_mb() - baseline, 1),
+    }))
+
+
+def run_measure(path: str, mode: str, journal_path: str) -> dict:
+    """Ejecuta `measure` en un subproceso nuevo y devuelve su resultado."""
+    output = subprocess.run(
+        [sys.executable, __file__, "--medir", mode, "--fichero", path, "--journal", journal_path],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memoria de la lectura incremental de casos.")
+    parser.add_argument("--casos", type=int, default=1_000_000, help="Número de casos sintéticos.")
+    parser.add_argument("--formato", choices=["json", "jsonl"], default="json", help="Formato del fichero de entrada.")
+    parser.add_argument("--caracteres", type=int, default=500, help="Longitud aproximada de cada informe.")
+    parser.add_argument("--procesados", type=float, default=0.5, help="Fracción de casos que se marcan como ya procesados en el journal.")
+    parser.add_argument("--sin-comparar", action="store_true", help="No mide la carga completa con load_json_file.")
+    # Argumentos internos para las mediciones en subprocesos
+    parser.add_argument("--medir", choices=["streaming", "completo"], help=argparse.SUPPRESS)
+    parser.add_argument("--fichero", help=argparse.SUPPRESS)
+    parser.add_argument("--journal", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        measure(args.fichero, args.medir, args.journal)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f"cases.{args.formato}")
+        journal_path = os.path.join(tmp_dir, "processed_cases.journal")
+        generate_cases(path, args.casos, args.formato, args.caracteres)
+        with open(journal_path, "w", encoding="utf-8") as f:
+            for i in range(int(args.casos * args.procesados)):
+                f.write(f"done\t{str(i).zfill(3)}\n")
+
+        results = {"casos": args.casos, "megabytes_fichero": round(os.path.getsize(path) / 1_000_000, 1),
+                   "mediciones": [run_measure(path, "streaming", journal_path)]}
+        if not args.sin_comparar:
+            results["mediciones"].append(run_measure(path, "completo", journal_path))
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
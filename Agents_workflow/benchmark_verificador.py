@@ -0,0 +1,81 @@
+"""
+Benchmark de la verificación rápida de la anonimización.
+
+Sobre una muestra etiquetada de pares (texto original, texto anonimizado, correcto), calcula para cada umbral
+de confianza qué fracción de llamadas al juez se evitaría y cuánto coincide la verificación rápida con el juez
+de anonimización y con las etiquetas. Con `--sin-juez` no llama a ningún modelo y solo compara con las etiquetas.
+
+Formato de la muestra (JSON): [{"original": "...", "anonimizado": "...", "correcto": true}, ...]
+
+Uso:
+    python benchmark_verificador.py --muestra muestra_verificador.json
+    python benchmark_verificador.py --muestra muestra_verificador.json --umbrales 0.25,0.5,1 --sin-juez
+"""
+import argparse
+import json
+from agentes import create_judge_agent
+from herramientas import load_json_file
+from main import MODEL_OLLAMA_NAME
+from verificador import scan_residual_pii
+
+
+def judge_verdict(judge, original: str, anonymized: str) -> bool:
+    """Pide al juez de anonimización su veredicto, con el mismo mensaje que `run_anonymization_process`."""
+    response = judge.run(
+        f"Evalúa si la siguiente anonimización es correcta.\n"
+        f"Texto Original:\n---\n{original}\n---\n\n"
+        f"Texto Anonimizado:\n---\n{anonymized}\n---"
+    )
+    return bool(response.content.is_correct)
+
+
+def agreement(pairs: list) -> float | None:
+    """Fracción de pares (a, b) en los que a y b coinciden, o None si no hay pares."""
+    return round(sum(1 for a, b in pairs if a == b) / len(pairs), 3) if pairs else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la verificación rápida de la anonimización.")
+    parser.add_argument("--muestra", default="muestra_verificador.json", help="Fichero JSON con la muestra etiquetada.")
+    parser.add_argument("--umbrales", default="0.25,0.5,1.0", help="Umbrales de confianza a evaluar, separados por comas.")
+    parser.add_argument("--sin-juez", action="store_true", help="No llama al juez, solo compara con las etiquetas.")
+    args = parser.parse_args()
+
+    sample = load_json_file(args.muestra)
+    thresholds = [float(value) for value in args.umbrales.split(",")]
+
+    rows = []
+    judge = None if args.sin_juez else create_judge_agent(model_name=MODEL_OLLAMA_NAME)
+    for item in sample:
+        confidence, findings = scan_residual_pii(item["original"], item["anonimizado"])
+        rows.append({
+            "confianza": round(confidence, 3),
+            "hallazgos": findings,
+            "correcto": item.get("correcto"),
+            "juez": judge_verdict(judge, item["original"], item["anonimizado"]) if judge is not None else None,
+        })
+
+    results = []
+    for threshold in thresholds:
+        skipped = [row for row in rows if row["confianza"] >= threshold]
+        result = {
+            "umbral": threshold,
+            "fraccion_juez_omitido": round(len(skipped) / len(rows), 3) if rows else 0.0,
+            # Casos que la verificación rápida aprobaría pero que la etiqueta marca como mal anonimizados
+            "aprobados_incorrectos": sum(1 for row in skipped if row["correcto"] is False),
+            "acuerdo_con_etiquetas": agreement([(row["confianza"] >= threshold, row["correcto"])
+                                                for row in rows if row["correcto"] is not None]),
+        }
+        if judge is not None:
+            result["acuerdo_con_juez"] = agreement([(row["confianza"] >= threshold, row["juez"]) for row in rows])
+            result["acuerdo_con_juez_en_omitidos"] = agreement([(True, row["juez"]) for row in skipped])
+        results.append(result)
+
+    report = {"muestra": len(rows), "umbrales": results, "detalle": rows}
+    if judge is not None:
+        report["acuerdo_juez_con_etiquetas"] = agreement([(row["juez"], row["correcto"]) for row in rows if row["correcto"] is not None])
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from agno.agent import Agent
+from agno.run.response import RunResponse
+
+
+class AgentCache:
+    """
+    Caché persistente en disco (SQLite) de las respuestas de los agentes, direccionada por contenido.
+
+    Cuando el tamaño total de las respuestas guardadas supera `max_bytes`, se eliminan las entradas
+    usadas hace más tiempo (LRU). Es segura para varios hilos.
+    """
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Varios procesos (particiones en la misma máquina) pueden compartir el fichero: se espera a que se libere el bloqueo
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS respuestas ("
+            "clave TEXT PRIMARY KEY, agente TEXT, valor TEXT NOT NULL, tamano INTEGER NOT NULL, ultimo_uso REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_uso ON respuestas (ultimo_uso)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM respuestas").fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        """Devuelve el valor guardado para `key` (actualizando su último uso) o None si no existe."""
+        with self._lock:
+            row = self._conn.execute("SELECT valor FROM respuestas WHERE clave = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE respuestas SET ultimo_uso = ? WHERE clave = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str, agent_name: str = ""):
+        """Guarda `value` para `key` y elimina las entradas más antiguas si se supera el tamaño máximo."""
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            previous = self._conn.execute("SELECT tamano FROM respuestas WHERE clave = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, agente, valor, tamano, ultimo_uso) VALUES (?, ?, ?, ?, ?)",
+                (key, agent_name, value, size, time.time()),
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Elimina por lotes las entradas menos usadas hasta quedar por debajo del tamaño máximo
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute("SELECT clave, tamano FROM respuestas ORDER BY ultimo_uso LIMIT 100").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM respuestas WHERE clave = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Devuelve los contadores de aciertos y fallos de la caché."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "aciertos": self.hits,
+                "fallos": self.misses,
+                "tasa_aciertos": round(self.hits / lookups, 3) if lookups else 0.0,
+                "expulsiones": self.evictions,
+                "entradas": entries,
+                "megabytes": round(self._total_bytes / 1_000_000, 2),
+            }
+
+    def close(self):
+        """Cierra la conexión con la base de datos."""
+        with self._lock:
+            self._conn.close()
+
+
+def agent_fingerprint(agent: Agent) -> str:
+    """
+    Devuelve un hash de todo lo que determina la respuesta de un agente aparte del mensaje:
+    las instrucciones de `instrucciones.py`, la descripción y el rol, el modelo y el esquema de respuesta.
+    """
+    instructions = agent.instructions if isinstance(agent.instructions, list) else [agent.instructions]
+    schema = agent.response_model.model_json_schema() if agent.response_model is not None else None
+    payload = json.dumps({
+        "instrucciones": [str(i) for i in instructions],
+        "descripcion": agent.description,
+        "rol": agent.role,
+        "proveedor": agent.model.provider,
+        "modelo": agent.model.id,
+        "esquema": schema,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CachedAgent:
+    """
+    Envoltorio de un agente (o de un `LimitedAgent`) que guarda sus respuestas en un `AgentCache`.
+
+    La clave es el hash del mensaje, de la huella del agente (`agent_fingerprint`) y del número de veces
+    que se ha enviado ese mismo mensaje en esta ejecución. Así los reintentos de un caso no devuelven
+    siempre la primera respuesta: el intento k de una ejecución reutiliza el intento k de la anterior.
+    """
+    def __init__(self, agent, cache: AgentCache):
+        self._wrapped = agent
+        self._cache = cache
+        base_agent = getattr(agent, "agent", agent)
+        self.name = base_agent.name
+        self._response_model = base_agent.response_model
+        self._fingerprint = agent_fingerprint(base_agent)
+        self._occurrences = {}
+        self._lock = threading.Lock()
+
+    @property
+    def agent(self) -> Agent:
+        """Devuelve el agente de agno que hay debajo del envoltorio."""
+        return getattr(self._wrapped, "agent", self._wrapped)
+
+    def _key(self, message: str) -> str:
+        message_hash = hashlib.sha256(f"{self._fingerprint}\n{message}".encode("utf-8")).hexdigest()
+        with self._lock:
+            occurrence = self._occurrences.get(message_hash, 0)
+            self._occurrences[message_hash] = occurrence + 1
+        return f"{message_hash}:{occurrence}"
+
+    def run(self, message: str, **kwargs):
+        """Devuelve la respuesta guardada si existe; si no, ejecuta el agente y guarda su respuesta."""
+        key = self._key(message)
+        cached = self._cache.get(key)
+        if cached is not None:
+            logging.info(f"Respuesta de {self.name} recuperada de la caché.")
+            content = self._response_model.model_validate_json(cached) if self._response_model else json.loads(cached)
+            # Se marca como acierto de caché para que las métricas no la cuenten como una llamada al modelo
+            return RunResponse(content=content, metrics={"cache_hit": True})
+
+        response = self._wrapped.run(message, **kwargs)
+        content = response.content
+        if self._response_model is not None and not isinstance(content, self._response_model):
+            # La respuesta no se ajusta al esquema: no se guarda para no repetirla en la próxima ejecución
+            return response
+        value = content.model_dump_json() if hasattr(content, "model_dump_json") else json.dumps(content, ensure_ascii=False)
+        self._cache.put(key, value, agent_name=self.name)
+        return response
@@ -0,0 +1,73 @@
+import json
+import sqlite3
+import threading
+import time
+
+# Etapas del workflow que se guardan por caso
+STAGE_ANONYMIZATION = "anonimizacion"
+STAGE_REVIEW = "revision"
+STAGES = (STAGE_ANONYMIZATION, STAGE_REVIEW)
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+
+
+class StageCheckpointStore:
+    """
+    Resultados intermedios de cada caso y etapa, guardados en SQLite.
+
+    Cuando una etapa termina bien se guarda su resultado (por ejemplo, el texto anonimizado aprobado y el
+    veredicto del juez), y cuando falla se guarda el error. Al volver a procesar un caso, las etapas con
+    resultado se recuperan de aquí en vez de repetirse. Es segura para varios hilos.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Varios procesos (particiones en la misma máquina) pueden compartir el fichero: se espera a que se libere el bloqueo
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS etapas ("
+            "case_id TEXT NOT NULL, etapa TEXT NOT NULL, estado TEXT NOT NULL, resultado TEXT, error TEXT, "
+            "actualizado REAL NOT NULL, PRIMARY KEY (case_id, etapa))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_etapa_estado ON etapas (etapa, estado)")
+        self._conn.commit()
+
+    def get(self, case_id: str, stage: str) -> dict | None:
+        """Devuelve el resultado guardado de la etapa si terminó bien, o None si no existe o falló."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resultado FROM etapas WHERE case_id = ? AND etapa = ? AND estado = ?",
+                (str(case_id), stage, STATUS_OK),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, case_id: str, stage: str, result: dict):
+        """Guarda el resultado de una etapa terminada con éxito."""
+        self._upsert(case_id, stage, STATUS_OK, json.dumps(result, ensure_ascii=False), None)
+
+    def mark_failed(self, case_id: str, stage: str, error: str):
+        """Registra que la etapa ha fallado para el caso, con el motivo."""
+        self._upsert(case_id, stage, STATUS_FAILED, None, error)
+
+    def _upsert(self, case_id: str, stage: str, status: str, result: str | None, error: str | None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO etapas (case_id, etapa, estado, resultado, error, actualizado) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(case_id), stage, status, result, error, time.time()),
+            )
+            self._conn.commit()
+
+    def failed_ids(self, stage: str) -> set:
+        """Devuelve los caseID cuya última ejecución de la etapa terminó en fallo."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT case_id FROM etapas WHERE etapa = ? AND estado = ?", (stage, STATUS_FAILED)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def close(self):
+        """Cierra la conexión con la base de datos."""
+        with self._lock:
+            self._conn.close()
@@ -10,4 +10,11 @@ class CaseStatus(BaseModel):
     status: str
     actions: str
     info: str
-    department: str 
\ No newline at end of file
+    department: str
+
+class CaseJudgeDecision(BaseModel):
+    case_id: str
+    is_correct: bool
+
+class BatchJudgeDecision(BaseModel):
+    decisiones: list[CaseJudgeDecision]
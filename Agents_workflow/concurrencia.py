@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+from agno.agent import Agent
+
+# caseID del caso que se está procesando en el hilo actual (se usa para etiquetar los logs)
+current_case_id: ContextVar[str] = ContextVar("current_case_id", default="-")
+# Instante (time.monotonic) en que vence el tiempo máximo del caso en curso, o None si no tiene límite
+case_deadline: ContextVar[float | None] = ContextVar("case_deadline", default=None)
+
+
+class AgentCallTimeout(Exception):
+    """
+    Una llamada a un agente ha superado su tiempo máximo. Cuenta como un intento fallido.
+
+    Si la llamada se ha abandonado mientras seguía en curso, `pending_call` es el Future que se completa
+    cuando termina de verdad.
+    """
+    def __init__(self, message: str, pending_call: Future | None = None):
+        super().__init__(message)
+        self.pending_call = pending_call
+
+
+class CaseDeadlineExceeded(Exception):
+    """
+    Se ha agotado el tiempo máximo del caso en curso. El caso se da por fallido.
+
+    Como en `AgentCallTimeout`, `pending_call` es el Future de la llamada abandonada, si la hay.
+    """
+    def __init__(self, message: str, pending_call: Future | None = None):
+        super().__init__(message)
+        self.pending_call = pending_call
+
+
+@contextmanager
+def case_time_limit(seconds: float, deadline: float | None = None):
+    """
+    Fija el tiempo máximo del caso en curso para las llamadas a los agentes que se hagan dentro del bloque.
+
+    Si ya hay un tiempo máximo fijado (por ejemplo, para las dos fases del caso) se mantiene ese.
+    Con `deadline` se usa ese instante (time.monotonic) en lugar de contar `seconds` desde ahora, para
+    continuar en otro hilo el tiempo máximo de un caso ya empezado. Con `seconds` igual a 0 y sin
+    `deadline` el caso no tiene límite.
+    """
+    if case_deadline.get() is not None or (deadline is None and not seconds):
+        yield
+        return
+    token = case_deadline.set(deadline if deadline is not None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        case_deadline.reset(token)
+
+
+class TimeoutStats:
+    """Contadores de las llamadas a agentes y de los casos que han superado su tiempo máximo."""
+    def __init__(self):
+        self.calls = {}
+        self.cases = 0
+        self._lock = threading.Lock()
+
+    def record_call(self, agent_name: str):
+        with self._lock:
+            self.calls[agent_name] = self.calls.get(agent_name, 0) + 1
+
+    def record_case(self):
+        with self._lock:
+            self.cases += 1
+
+    def stats(self) -> dict:
+        """Devuelve las llamadas expiradas por agente y los casos que agotaron su tiempo máximo."""
+        with self._lock:
+            return {"llamadas_expiradas": dict(self.calls), "casos_expirados": self.cases}
+
+
+class CaseIdFilter(logging.Filter):
+    """
+    Añade el atributo 'case_id' a cada registro de log con el caso que se está procesando,
+    para que los logs de varios casos en paralelo se puedan leer por caso.
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.case_id = current_case_id.get()
+        return True
+
+
+class LimitedAgent:
+    """
+    Envoltorio de un agente que limita las llamadas simultáneas a su backend (Ollama u OpenAI).
+
+    Los agentes de agno guardan el estado de la ejecución en curso, por lo que no se pueden
+    compartir entre hilos: cada hilo crea su propia instancia con `agent_factory`.
+    Todas las instancias que usan el mismo backend comparten el mismo semáforo.
+
+    Con `call_timeout`, cada llamada se ejecuta en un hilo auxiliar y, si no termina en `call_timeout`
+    segundos o antes del tiempo máximo del caso en curso (`case_deadline`), se lanza `AgentCallTimeout`
+    (o `CaseDeadlineExceeded`) sin esperarla. La llamada abandonada termina con el timeout del cliente del
+    modelo y hasta entonces sigue ocupando su hueco en el backend; la excepción lleva en `pending_call` el
+    Future que se completa cuando termina. La instancia del agente se descarta para que el siguiente intento
+    no la comparta con ella.
+    """
+    def __init__(self, agent_factory: Callable[[], Agent], semaphore: threading.Semaphore, call_timeout: float | None = None,
+                 timeout_stats: TimeoutStats | None = None):
+        self._agent_factory = agent_factory
+        self._semaphore = semaphore
+        self.call_timeout = call_timeout
+        self._timeout_stats = timeout_stats
+        self._local = threading.local()
+
+    @property
+    def agent(self) -> Agent:
+        """Devuelve la instancia del agente del hilo actual, creándola si no existe."""
+        if not hasattr(self._local, "agent"):
+            self._local.agent = self._agent_factory()
+        return self._local.agent
+
+    def run(self, message: str, **kwargs):
+        """Ejecuta el agente esperando a que haya un hueco libre en su backend."""
+        agent = self.agent
+        deadline = case_deadline.get()
+        if not self.call_timeout and deadline is None:
+            with self._semaphore:
+                return agent.run(message, **kwargs)
+
+        if deadline is None:
+            self._semaphore.acquire()
+        elif not self._semaphore.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            raise CaseDeadlineExceeded(f"Tiempo máximo del caso agotado esperando a {agent.name}")
+        pending_call = Future()
+
+        def call():
+            # El hueco del backend se libera cuando la llamada termina de verdad, aunque ya se haya abandonado
+            try:
+                response = agent.run(message, **kwargs)
+            except Exception as e:
+                self._semaphore.release()
+                pending_call.set_exception(e)
+            else:
+                self._semaphore.release()
+                pending_call.set_result(response)
+
+        threading.Thread(target=call, name=f"llamada-{agent.name}", daemon=True).start()
+        timeouts = [t for t in (self.call_timeout, deadline - time.monotonic() if deadline is not None else None) if t is not None]
+        wait_seconds = max(min(timeouts), 0)
+        if not wait([pending_call], timeout=wait_seconds).done:
+            del self._local.agent
+            if self._timeout_stats is not None:
+                self._timeout_stats.record_call(agent.name)
+            if self.call_timeout and wait_seconds >= self.call_timeout:
+                raise AgentCallTimeout(f"{agent.name} no ha respondido en {self.call_timeout:g} s", pending_call)
+            raise CaseDeadlineExceeded(f"Tiempo máximo del caso agotado esperando a {agent.name}", pending_call)
+        return pending_call.result()
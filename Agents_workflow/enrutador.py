@@ -0,0 +1,128 @@
+import threading
+from contextvars import ContextVar
+from agentes import PROVIDERS
+from metricas import current_attempt
+
+# Ronda de la política de modelos en curso. Si no se fija, cada intento es una ronda; la anonimización
+# especulativa la fija para que los intentos que se lanzan a la vez usen el mismo nivel.
+current_round: ContextVar[int | None] = ContextVar("current_round", default=None)
+
+
+def parse_tiers(spec: str) -> list[tuple[str, str]]:
+    """
+    Convierte la política de modelos de una fase en la lista de (proveedor, modelo) de cada intento.
+
+    El formato es una lista de modelos separados por comas, cada uno como `proveedor:modelo`, con un
+    `*n` opcional para usarlo en `n` intentos seguidos. Por ejemplo:
+    "ollama:qwen3:4b*2,ollama:qwen3:14b,openai:gpt-4o-mini" usa qwen3:4b en los intentos 1 y 2,
+    qwen3:14b en el 3 y gpt-4o-mini en el 4 y siguientes.
+
+    Raises:
+        ValueError: Si la política está vacía o algún proveedor no está soportado.
+    """
+    tiers = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, repeat = item.partition("*")
+        provider, _, model_name = model.partition(":")
+        if provider not in PROVIDERS or not model_name:
+            raise ValueError(f"Modelo no válido en la política '{spec}': '{item}' (formato proveedor:modelo[*n])")
+        tiers.extend([(provider, model_name)] * (int(repeat) if repeat else 1))
+    if not tiers:
+        raise ValueError("La política de modelos está vacía")
+    return tiers
+
+
+class TierStats:
+    """Contadores de un nivel de la política de modelos."""
+    def __init__(self, label: str):
+        self.label = label
+        self.calls = 0
+        self.approved = 0
+        self.rejected = 0
+
+    def summary(self) -> dict:
+        judged = self.approved + self.rejected
+        return {
+            "modelo": self.label,
+            "llamadas": self.calls,
+            "aprobadas": self.approved,
+            "rechazadas": self.rejected,
+            "tasa_exito": round(self.approved / judged, 3) if judged else None,
+        }
+
+
+class TieredAgent:
+    """
+    Agente que elige el modelo según la ronda: la ronda k usa el nivel k de la política y, a partir del
+    último nivel, se sigue usando el último. La ronda es `current_round` si está fijada o, si no, el intento.
+
+    `tiers` es la lista de (etiqueta, agente) de cada intento, normalmente creada a partir de `parse_tiers`;
+    los intentos consecutivos con el mismo modelo comparten el mismo agente. Registra las llamadas por nivel y
+    las escaladas a un nivel superior y, con `record_verdict` y `record_exhausted`, los veredictos del juez por
+    nivel y los casos que agotan los reintentos.
+    """
+    def __init__(self, tiers: list):
+        if not tiers:
+            raise ValueError("TieredAgent necesita al menos un nivel")
+        self._tiers = tiers
+        self._stats = {}
+        for label, _ in tiers:
+            self._stats.setdefault(label, TierStats(label))
+        self.escalations = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _round() -> int:
+        tier_round = current_round.get()
+        return tier_round if tier_round is not None else current_attempt.get()
+
+    def _tier(self) -> tuple:
+        index = min(max(self._round(), 1), len(self._tiers)) - 1
+        return index, self._tiers[index]
+
+    @property
+    def name(self) -> str:
+        return getattr(self.agent, "name", None)
+
+    @property
+    def agent(self):
+        """Devuelve el agente de agno del nivel que corresponde al intento en curso."""
+        _, (_, agent) = self._tier()
+        return getattr(agent, "agent", agent)
+
+    def run(self, message: str, **kwargs):
+        """Ejecuta el agente del nivel que corresponde al intento en curso."""
+        index, (label, agent) = self._tier()
+        with self._lock:
+            self._stats[label].calls += 1
+            # Se cuenta una escalada cada vez que un intento pasa a un modelo distinto del anterior
+            if 0 < index and self._round() == index + 1 and self._tiers[index - 1][0] != label:
+                self.escalations += 1
+        return agent.run(message, **kwargs)
+
+    def record_verdict(self, approved: bool):
+        """Registra el veredicto del juez sobre el intento en curso."""
+        _, (label, _) = self._tier()
+        with self._lock:
+            if approved:
+                self._stats[label].approved += 1
+            else:
+                self._stats[label].rejected += 1
+
+    def record_exhausted(self):
+        """Registra un caso que ha agotado los reintentos sin ningún resultado aprobado."""
+        with self._lock:
+            self.exhausted += 1
+
+    def stats(self) -> dict:
+        """Devuelve las escaladas, los casos que agotaron los reintentos y el resumen por nivel."""
+        with self._lock:
+            return {
+                "escaladas": self.escalations,
+                "casos_agotados": self.exhausted,
+                "niveles": [stats.summary() for stats in self._stats.values()],
+            }
@@ -0,0 +1,122 @@
+import csv
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Callable
+
+
+class ResultWriter:
+    """
+    Escritor único de los resultados de los casos, seguro para varios hilos.
+
+    Las filas se acumulan en un buffer y se escriben en bloque cuando hay `flush_rows` filas pendientes o
+    cuando pasan `flush_seconds` segundos desde la última escritura. Cada escritura termina con `fsync`, y solo
+    entonces se llama a `on_flush` con las filas escritas (por ejemplo, para marcarlas como hechas en el journal).
+
+    Formatos:
+    -   `csv`: Añade las filas al CSV `path`, escribiendo la cabecera si el fichero no existe.
+    -   `parquet`: Escribe en el directorio `path` un fichero Parquet por cada escritura en bloque; el
+        directorio se lee como un único dataset. Requiere `pyarrow`.
+    """
+    def __init__(self, path: str, output_format: str = "csv", flush_rows: int = 50, flush_seconds: float = 5.0,
+                 on_flush: Callable[[list], None] | None = None):
+        if output_format not in ("csv", "parquet"):
+            raise ValueError(f"Formato de salida no soportado: {output_format}")
+        self.path = path
+        self.output_format = output_format
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.on_flush = on_flush
+        self.rows_written = 0
+        self._buffer = []
+        self._columns = None
+        self._run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+        self._parquet_part = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, name="escritor-resultados", daemon=True)
+        self._timer.start()
+
+    def write(self, row: dict):
+        """Añade una fila al buffer y lo escribe si se ha alcanzado `flush_rows`."""
+        with self._lock:
+            if self._closed.is_set():
+                raise RuntimeError("El escritor de resultados ya está cerrado")
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_rows:
+                self._flush_locked()
+
+    def flush(self):
+        """Escribe en disco todas las filas pendientes."""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """Escribe las filas pendientes y detiene la escritura periódica."""
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._flush_locked()
+            self._closed.set()
+        self._timer.join()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error al escribir los resultados: {e}")
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        rows = self._buffer
+        if self.output_format == "csv":
+            self._write_csv(rows)
+        else:
+            self._write_parquet(rows)
+        self._buffer = []
+        self.rows_written += len(rows)
+        if self.on_flush is not None:
+            self.on_flush(rows)
+
+    def _write_csv(self, rows: list):
+        exists = os.path.isfile(self.path) and os.path.getsize(self.path) > 0
+        if self._columns is None:
+            # Si el CSV ya existe se respeta el orden de sus columnas
+            if exists:
+                with open(self.path, "r", encoding="utf-8", newline="") as f:
+                    self._columns = next(csv.reader(f))
+            else:
+                self._columns = list(rows[0].keys())
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self._columns, lineterminator="\n")
+            if not exists:
+                writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_parquet(self, rows: list):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Un fichero Parquet no es legible hasta que se escribe su pie, así que cada escritura genera un fichero
+        # completo en el directorio de salida (se lee como un único dataset). Se escribe en un temporal y se
+        # renombra para que nunca quede un fichero a medias.
+        os.makedirs(self.path, exist_ok=True)
+        if self._columns is None:
+            self._columns = list(rows[0].keys())
+        table = pa.table({column: [None if row.get(column) is None else str(row.get(column)) for row in rows]
+                          for column in self._columns})
+        self._parquet_part += 1
+        file_name = f"part-{self._run_id}-{self._parquet_part:05d}.parquet"
+        tmp_path = os.path.join(self.path, f".{file_name}.tmp")
+        pq.write_table(table, tmp_path)
+        fd = os.open(tmp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, os.path.join(self.path, file_name))
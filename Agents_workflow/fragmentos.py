@@ -0,0 +1,52 @@
+import re
+from instrucciones import get_anonymizer_instructions
+
+# Etiquetas que el anonimizador puede usar, tomadas de sus instrucciones para que no se desincronicen
+ANONYMIZER_TAGS = frozenset(re.findall(r"\[[A-ZÁÉÍÓÚÑ ]+\]", get_anonymizer_instructions()))
+TAG_RE = re.compile(r"\[[A-ZÁÉÍÓÚÑ_ ]+\]")
+# Separadores de fragmentos: líneas en blanco entre párrafos o espacios tras el final de una frase
+BOUNDARY_RE = re.compile(r"(\n\s*\n|(?<=[.!?…])\s+)")
+
+
+def split_text(text: str, max_chars: int) -> list[tuple[str, str]]:
+    """
+    Divide un texto en fragmentos de como mucho `max_chars` caracteres, cortando solo entre párrafos o frases.
+
+    Una frase más larga que `max_chars` queda sola en su fragmento, sin cortarla.
+
+    Args:
+        text (str): El texto a dividir.
+        max_chars (int): Tamaño máximo orientativo de cada fragmento.
+
+    Returns:
+        list[tuple[str, str]]: Pares (fragmento, separador que le sigue en el texto original), de modo
+        que concatenar fragmentos y separadores devuelve el texto original.
+    """
+    parts = BOUNDARY_RE.split(text)
+    # re.split con un grupo devuelve [frase, separador, frase, separador, ..., frase]
+    units = [(parts[i], parts[i + 1] if i + 1 < len(parts) else "") for i in range(0, len(parts), 2)]
+
+    chunks = []
+    current, current_sep = "", ""
+    for content, sep in units:
+        if current and len(current) + len(current_sep) + len(content) > max_chars:
+            chunks.append((current, current_sep))
+            current, current_sep = "", ""
+        current = current + current_sep + content if current else content
+        current_sep = sep
+    if current or not chunks:
+        chunks.append((current, current_sep))
+    return chunks
+
+
+def stitch(chunks: list[str], separators: list[str]) -> str:
+    """Une los fragmentos anonimizados en orden con los separadores del texto original."""
+    return "".join(chunk.strip() + sep for chunk, sep in zip(chunks, separators))
+
+
+def unknown_tags(anonymized: str, original: str = "") -> set:
+    """
+    Devuelve las etiquetas entre corchetes del texto anonimizado que no están en `ANONYMIZER_TAGS`
+    (sin contar las que ya aparecían en el texto original).
+    """
+    return set(TAG_RE.findall(anonymized)) - ANONYMIZER_TAGS - set(TAG_RE.findall(original))
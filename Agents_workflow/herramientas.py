@@ -1,3 +1,4 @@
+import csv
 import json
 import os
 import pandas as pd
@@ -8,6 +9,52 @@ def load_json_file(file_path: str) -> dict:
             return json.load(f)
 
 
+def iter_cases(file_path: str, chunk_size: int = 1 << 20):
+    """
+    Lee los casos de un fichero de forma incremental, sin cargarlo entero en memoria.
+
+    Admite tanto un array JSON (`[{...}, {...}]`) como JSON Lines (un objeto por línea). El fichero se lee
+    en bloques de `chunk_size` caracteres y cada caso se decodifica en cuanto está completo en el buffer,
+    por lo que la memoria usada depende del tamaño del bloque y del caso más grande, no del fichero.
+
+    Args:
+        file_path (str): Ruta del fichero de casos.
+        chunk_size (int): Caracteres que se leen en cada bloque.
+
+    Yields:
+        dict: Cada uno de los casos del fichero, en orden.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        position = 0
+        eof = False
+        while True:
+            # Saltar separadores entre casos: espacios, saltos de línea, comas y los corchetes del array
+            while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+                position += 1
+            if position >= len(buffer):
+                if eof:
+                    return
+                buffer = f.read(chunk_size)
+                position = 0
+                eof = not buffer
+                continue
+            try:
+                case, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # El caso está cortado al final del buffer: se lee otro bloque y se vuelve a intentar
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            position = end
+            yield case
+
+
 def get_department_descriptions(file_path: str) -> str:
     """
     Carga los departamentos y devuelve una cadena de texto formateada con sus descripciones.
@@ -15,17 +62,17 @@ def get_department_descriptions(file_path: str) -> str:
     departments = load_json_file(file_path)
     return "\n".join([f"- {d['departmentID']}: {d['description']}" for d in departments])
 
-def get_processed_ids(csv_filepath: str) -> list:
+def get_processed_ids(csv_filepath: str) -> set:
     """
-    Lee un archivo CSV con pandas y devuelve una lista de los 'caseID' existentes.
+    Lee un archivo CSV fila a fila y devuelve un conjunto con los 'caseID' existentes.
     Los caseID se devuelven como strings de 3 dígitos (ej: "001", "002").
+    Solo se usa para inicializar el journal de casos procesados a partir de un CSV existente.
     """
     if not os.path.isfile(csv_filepath):
-        return []
-    df = pd.read_csv(csv_filepath)
-    #Pasar a lista el arry de pandas y aplicar map con zfill para asegurar formato de 3 dígitos
-    case_ids = list(map(lambda x: str(x).zfill(3),df['caseID'].to_list()))
-    return case_ids
+        return set()
+    with open(csv_filepath, 'r', encoding='utf-8', newline='') as f:
+        #Aplicar zfill para asegurar formato de 3 dígitos
+        return {str(row['caseID']).zfill(3) for row in csv.DictReader(f)}
 
 def save_to_csv(data, csv_filepath: str):
     """
@@ -52,4 +52,14 @@ Verifica si el análisis es preciso y lógico. Responde con un JSON con un únic
 **Respuesta**:
 - Si todo es correcto, 'is_correct' en true.
 - Si hay errores, 'is_correct' en false.
-""" 
\ No newline at end of file
+"""
+
+def get_batch_judge_instructions() -> list:
+    """Devuelve las instrucciones comunes de los jueces por lotes, que se añaden a las del juez individual."""
+    return [
+        "Recibirás varios elementos a evaluar, cada uno precedido de una cabecera '### Elemento <id>'.",
+        "Evalúa cada elemento por separado, con los mismos criterios que si fuera el único.",
+        "En lugar de un único 'is_correct', responde con un objeto JSON con un único campo 'decisiones': una lista con un objeto por elemento, "
+        "con los campos 'case_id' (el <id> de la cabecera, copiado exactamente) e 'is_correct' (booleano).",
+    ]
+
@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+
+# Estados posibles de un caso en el journal
+STATE_IN_PROGRESS = "in_progress"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATES = (STATE_IN_PROGRESS, STATE_DONE, STATE_FAILED)
+# Al cargar se guarda la constante del estado en vez de la cadena leída, para no tener una cadena nueva por caso
+_STATE_BY_NAME = {state: state for state in STATES}
+
+
+def _read_states(path: str, states: dict) -> int:
+    """Carga en `states` el último estado de cada caso del journal `path` y devuelve el número de líneas leídas."""
+    if not os.path.isfile(path):
+        return 0
+    lines = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            lines += 1
+            # Una línea sin salto final es una escritura cortada por una interrupción
+            if not line.endswith("\n"):
+                continue
+            state, _, case_id = line.rstrip("\n").partition("\t")
+            if state in _STATE_BY_NAME and case_id:
+                states[case_id] = _STATE_BY_NAME[state]
+    return lines
+
+
+def read_done_ids(path: str) -> set:
+    """Lee un journal sin abrirlo para escritura y devuelve los caseID de los casos hechos."""
+    states = {}
+    _read_states(path, states)
+    return {case_id for case_id, state in states.items() if state == STATE_DONE}
+
+
+class CaseJournal:
+    """
+    Journal de solo añadido con el estado de cada caso procesado.
+
+    Cada línea del fichero es `estado<TAB>caseID` y la última línea de un caso es la que vale. Al cargarlo
+    se recorre una sola vez, línea a línea, y se guarda en memoria un diccionario caseID -> estado, así
+    comprobar si un caso ya está hecho es una búsqueda en un hash. Cada cambio de estado se añade con una
+    única escritura y `fsync`, por lo que una ejecución interrumpida nunca deja el journal a medias:
+    como mucho se pierde la última línea, que se ignora al cargar.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._states = {}
+        self._lock = threading.Lock()
+        lines = self._load()
+        # Si el journal tiene muchas líneas repetidas de un mismo caso, se compacta antes de seguir añadiendo
+        if lines > 2 * len(self._states) + 1000:
+            self.compact()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _load(self) -> int:
+        return _read_states(self.path, self._states)
+
+    def compact(self):
+        """Reescribe el journal con una sola línea por caso, de forma atómica (fichero temporal y `os.replace`)."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for case_id, state in self._states.items():
+                f.write(f"{state}\t{case_id}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _append(self, case_id: str, state: str):
+        case_id = str(case_id)
+        line = f"{state}\t{case_id}\n".encode("utf-8")
+        with self._lock:
+            os.write(self._fd, line)
+            os.fsync(self._fd)
+            self._states[case_id] = state
+
+    def mark_in_progress(self, case_id: str):
+        """Registra que el caso ha empezado a procesarse."""
+        self._append(case_id, STATE_IN_PROGRESS)
+
+    def mark_done(self, case_id: str):
+        """Registra que el caso se ha procesado y guardado correctamente."""
+        self._append(case_id, STATE_DONE)
+
+    def mark_failed(self, case_id: str):
+        """Registra que el caso ha fallado en alguna de las fases."""
+        self._append(case_id, STATE_FAILED)
+
+    def state(self, case_id: str) -> str | None:
+        """Devuelve el último estado registrado del caso, o None si no aparece en el journal."""
+        return self._states.get(str(case_id))
+
+    def is_done(self, case_id: str) -> bool:
+        """Indica si el caso ya se procesó con éxito."""
+        return self._states.get(str(case_id)) == STATE_DONE
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def counts(self) -> dict:
+        """Devuelve el número de casos en cada estado."""
+        counts = dict.fromkeys(STATES, 0)
+        for state in self._states.values():
+            counts[state] += 1
+        return counts
+
+    def mark_done_batch(self, case_ids):
+        """Registra varios casos como hechos con una única escritura y un único `fsync`."""
+        case_ids = [str(case_id) for case_id in case_ids]
+        if not case_ids:
+            return
+        with self._lock:
+            os.write(self._fd, "".join(f"{STATE_DONE}\t{case_id}\n" for case_id in case_ids).encode("utf-8"))
+            os.fsync(self._fd)
+            for case_id in case_ids:
+                self._states[case_id] = STATE_DONE
+
+    def bootstrap(self, processed_ids):
+        """
+        Marca como hechos los casos de `processed_ids` que no estén ya en el journal.
+        Sirve para crear el journal a partir de un CSV de salida existente.
+        """
+        new_ids = [str(case_id) for case_id in processed_ids if str(case_id) not in self._states]
+        if not new_ids:
+            return
+        self.mark_done_batch(new_ids)
+        logging.info(f"Journal inicializado con {len(new_ids)} casos ya presentes en el CSV de salida.")
+
+    def include_done(self, case_ids) -> int:
+        """
+        Da por hechos en memoria, sin escribirlos en este journal, los casos hechos en otros journals
+        (por ejemplo, los de otras particiones). Devuelve cuántos casos nuevos se han dado por hechos.
+        """
+        added = 0
+        with self._lock:
+            for case_id in case_ids:
+                case_id = str(case_id)
+                if self._states.get(case_id) != STATE_DONE:
+                    self._states[case_id] = STATE_DONE
+                    added += 1
+        return added
+
+    def close(self):
+        """Cierra el fichero del journal."""
+        with self._lock:
+            os.close(self._fd)
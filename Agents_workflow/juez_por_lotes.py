@@ -0,0 +1,110 @@
+import logging
+import threading
+from agno.run.response import RunResponse
+from clases import BatchJudgeDecision, JudgeDecision
+from concurrencia import current_case_id
+
+
+class _PendingJudgement:
+    """Una petición de evaluación a la espera de entrar en un lote."""
+    def __init__(self, case_id: str, message: str):
+        self.case_id = case_id
+        self.message = message
+        self.key = case_id
+        self.decision = None
+        self.done = threading.Event()
+
+
+class BatchedJudge:
+    """
+    Juez que agrupa las evaluaciones de varios hilos en una sola llamada estructurada.
+
+    Cada llamada a `run` se queda esperando hasta `max_wait_seconds` a que lleguen otras; cuando el lote
+    alcanza `max_batch_size` o pasa la espera, uno de los hilos envía todos los mensajes a `batch_judge`,
+    que devuelve un `BatchJudgeDecision` con la decisión de cada elemento por caseID. Así las instrucciones
+    del juez (que en la revisión incluyen las descripciones de los departamentos) se envían una vez por lote
+    y no una vez por evaluación.
+
+    Los elementos que faltan en la respuesta, o todos si la llamada por lotes falla, se evalúan con el juez
+    individual `judge` desde el hilo que los pidió. Un lote de un solo elemento va directamente al juez individual.
+    """
+    def __init__(self, judge, batch_judge, max_batch_size: int = 8, max_wait_seconds: float = 0.2):
+        self._judge = judge
+        self._batch_judge = batch_judge
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.name = getattr(judge, "name", None) or getattr(judge, "agent").name
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def agent(self):
+        """Devuelve el agente de agno del juez individual."""
+        return getattr(self._judge, "agent", self._judge)
+
+    def _take_batch_locked(self) -> list:
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        # Un mismo caso puede tener varios intentos en el mismo lote (modo especulativo): las claves deben ser únicas
+        seen = {}
+        for item in batch:
+            seen[item.case_id] = seen.get(item.case_id, 0) + 1
+            item.key = item.case_id if seen[item.case_id] == 1 else f"{item.case_id}#{seen[item.case_id]}"
+        return batch
+
+    def run(self, message: str, **kwargs):
+        """Evalúa el mensaje dentro de un lote y devuelve una respuesta con un `JudgeDecision`."""
+        item = _PendingJudgement(current_case_id.get(), message)
+        with self._lock:
+            self._pending.append(item)
+            batch = self._take_batch_locked() if len(self._pending) >= self.max_batch_size else None
+        if batch is None and not item.done.wait(self.max_wait_seconds):
+            with self._lock:
+                batch = self._take_batch_locked() if item in self._pending else None
+        if batch is not None:
+            self._judge_batch(batch)
+        item.done.wait()
+
+        if item.decision is None:
+            # El lote no trajo decisión para este elemento: se evalúa con el juez individual
+            with self._lock:
+                self.fallbacks += 1
+            return self._judge.run(message, **kwargs)
+        return RunResponse(content=item.decision)
+
+    def _judge_batch(self, batch: list):
+        try:
+            if len(batch) == 1:
+                return
+            message = "Evalúa por separado cada uno de los siguientes elementos.\n\n" + "\n\n".join(
+                f"### Elemento {item.key}\n{item.message}" for item in batch
+            )
+            try:
+                response = self._batch_judge.run(message)
+            except Exception as e:
+                logging.warning(f"Error en la evaluación por lotes de {len(batch)} elementos, se evalúan uno a uno: {e}")
+                return
+            content = response.content
+            decisions = ({decision.case_id: decision.is_correct for decision in content.decisiones}
+                         if isinstance(content, BatchJudgeDecision) else {})
+            for item in batch:
+                if item.key in decisions:
+                    item.decision = JudgeDecision(is_correct=decisions[item.key])
+            with self._lock:
+                self.batches += 1
+                self.batched_items += sum(1 for item in batch if item.decision is not None)
+        finally:
+            for item in batch:
+                item.done.set()
+
+    def stats(self) -> dict:
+        """Devuelve los lotes enviados, los elementos resueltos en lote y los que se evaluaron uno a uno."""
+        with self._lock:
+            return {
+                "lotes": self.batches,
+                "elementos_en_lote": self.batched_items,
+                "elementos_medios_por_lote": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+                "evaluaciones_individuales": self.fallbacks,
+            }
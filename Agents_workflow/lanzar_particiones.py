@@ -0,0 +1,82 @@
+"""
+Lanza en esta máquina N particiones de `main.py`, cada una en su propio proceso, y al terminar combina sus
+salidas en la salida canónica (`main.py --combinar`).
+
+Cada proceso procesa solo los casos cuyo caseID cae en su partición y escribe su propia salida, journal,
+métricas y log; la caché de respuestas y los checkpoints se comparten. Los límites de llamadas simultáneas y
+de peticiones y tokens por minuto de `main.py` son de cada proceso, así que el lanzador los reparte entre las
+particiones para que juntas no los superen. Para repartir el trabajo entre varias máquinas,
+se ejecuta `main.py --particion i --particiones N` en cada una y después `main.py --combinar` con todos los
+ficheros de las particiones en el mismo directorio.
+
+Uso:
+    python lanzar_particiones.py --particiones 4
+    python lanzar_particiones.py --particiones 4 --reprocesar-fallidos revision --sin-combinar
+"""
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from checkpoints import STAGES
+from main import MAX_CONCURRENT_OLLAMA, MAX_CONCURRENT_OPENAI, OPENAI_RPM, OPENAI_TPM
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+# Límites de main.py que valen para un proceso y se reparten entre las particiones de la máquina
+SHARED_LIMITS = {
+    "MAX_CONCURRENT_OLLAMA": MAX_CONCURRENT_OLLAMA,
+    "MAX_CONCURRENT_OPENAI": MAX_CONCURRENT_OPENAI,
+    "OPENAI_RPM": OPENAI_RPM,
+    "OPENAI_TPM": OPENAI_TPM,
+}
+
+
+def shard_env(shard_count: int) -> dict:
+    """
+    Entorno de cada partición, con los límites de `SHARED_LIMITS` divididos entre `shard_count`.
+
+    Cada límite es como mínimo 1, así que si hay más particiones que el límite (por ejemplo, más particiones
+    que `MAX_CONCURRENT_OLLAMA`) las particiones juntas lo superan; en ese caso se avisa al lanzarlas.
+    """
+    env = dict(os.environ)
+    for name, value in SHARED_LIMITS.items():
+        env[name] = str(max(value // shard_count, 1))
+        if value < shard_count:
+            print(f"Aviso: {name}={value} es menor que el número de particiones; cada una usará 1 "
+                  f"y entre todas llegarán a {shard_count}.")
+    return env
+
+
+def run_shard(shard_index: int, shard_count: int, reprocess_stage: str | None = None, env: dict | None = None) -> int:
+    """Ejecuta una partición en un proceso nuevo y devuelve su código de salida."""
+    command = [sys.executable, MAIN_SCRIPT, "--particion", str(shard_index), "--particiones", str(shard_count)]
+    if reprocess_stage:
+        command += ["--reprocesar-fallidos", reprocess_stage]
+    return subprocess.run(command, env=env).returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lanza varias particiones de main.py en paralelo y combina sus salidas.")
+    parser.add_argument("--particiones", type=int, default=2,
+                        help="Número de procesos (particiones). Los límites de Ollama y OpenAI se reparten entre ellos.")
+    parser.add_argument("--reprocesar-fallidos", choices=STAGES, metavar="ETAPA",
+                        help=f"Procesa solo los casos que fallaron en la etapa indicada ({', '.join(STAGES)}).")
+    parser.add_argument("--sin-combinar", action="store_true", help="No combina las salidas al terminar.")
+    args = parser.parse_args()
+
+    # Cada partición es un proceso independiente: los hilos solo esperan a que terminen
+    env = shard_env(args.particiones)
+    with ThreadPoolExecutor(max_workers=args.particiones) as executor:
+        return_codes = list(executor.map(lambda index: run_shard(index, args.particiones, args.reprocesar_fallidos, env),
+                                         range(args.particiones)))
+    failed = [index for index, code in enumerate(return_codes) if code != 0]
+    if failed:
+        print(f"Particiones con error: {failed}. Se pueden relanzar con main.py --particion i --particiones {args.particiones}.")
+    if not args.sin_combinar:
+        # Se combinan también las particiones que terminaron bien aunque otras hayan fallado
+        subprocess.run([sys.executable, MAIN_SCRIPT, "--combinar"], check=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
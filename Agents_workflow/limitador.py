@@ -0,0 +1,239 @@
+import logging
+import random
+import threading
+import time
+from concurrencia import AgentCallTimeout, CaseDeadlineExceeded, case_deadline
+
+# Códigos HTTP que indican que el proveedor está saturado y la llamada se puede repetir más tarde
+THROTTLE_STATUS_CODES = (429,)
+
+
+class TokenBucket:
+    """
+    Cubo de tokens que se rellena de forma continua a razón de `per_minute` unidades por minuto,
+    con capacidad máxima `capacity` (por defecto, el presupuesto de un minuto).
+
+    `acquire` bloquea hasta que hay saldo suficiente o hasta el tiempo máximo del caso en curso. El saldo puede quedar negativo con `adjust`
+    cuando el consumo real supera al estimado; las siguientes llamadas esperan hasta recuperarlo.
+    `name` describe el límite en los mensajes de error (por ejemplo, "peticiones por minuto").
+    """
+    def __init__(self, per_minute: float, capacity: float | None = None, name: str = "peticiones por minuto"):
+        if per_minute <= 0:
+            raise ValueError("per_minute debe ser mayor que 0")
+        self.name = name
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Espera hasta poder consumir `amount` unidades y las consume. Devuelve los segundos esperados.
+
+        Raises:
+            CaseDeadlineExceeded: Si el saldo no alcanza antes del tiempo máximo del caso en curso.
+        """
+        deadline = case_deadline.get()
+        # Una petición mayor que la capacidad nunca cabría: se limita a la capacidad y se deja el saldo en negativo
+        amount_needed = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill_locked()
+                if self._tokens >= amount_needed:
+                    self._tokens -= amount
+                    return waited
+                wait_seconds = (amount_needed - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait_seconds > deadline:
+                raise CaseDeadlineExceeded(f"Tiempo máximo del caso agotado esperando al límite de {self.name}")
+            time.sleep(wait_seconds)
+            waited += wait_seconds
+
+    def adjust(self, amount: float):
+        """Corrige el saldo con la diferencia entre el consumo real y el estimado (positivo = se consumió más)."""
+        with self._lock:
+            self._refill_locked()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class AdaptiveConcurrency:
+    """
+    Límite de llamadas simultáneas que se ajusta con AIMD (aumento aditivo, disminución multiplicativa).
+
+    Cada llamada que termina bien suma 1/límite al límite (aproximadamente +1 por cada ronda de llamadas),
+    y cada señal de saturación (429 o timeout del cliente) lo multiplica por `decrease_factor`. Las señales que llegan
+    durante `cooldown_seconds` tras una reducción se ignoran, para que una ráfaga de 429 de llamadas que ya
+    estaban en vuelo no reduzca el límite varias veces.
+    """
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, decrease_factor: float = 0.5, cooldown_seconds: float = 5.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.throttles = 0
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Espera a que el número de llamadas en vuelo esté por debajo del límite actual.
+
+        Raises:
+            CaseDeadlineExceeded: Si se agota el tiempo máximo del caso en curso mientras espera.
+        """
+        deadline = case_deadline.get()
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CaseDeadlineExceeded("Tiempo máximo del caso agotado esperando un hueco de llamadas simultáneas")
+                self._condition.wait(remaining)
+            self._in_flight += 1
+
+    def release(self):
+        """Libera el hueco de una llamada terminada."""
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self):
+        """Aumento aditivo tras una llamada correcta."""
+        with self._condition:
+            previous = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            if int(self.limit) > previous:
+                self._condition.notify()
+
+    def on_throttle(self):
+        """Disminución multiplicativa tras un 429 o un timeout del cliente."""
+        with self._condition:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown_seconds:
+                return
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            logging.warning(f"Proveedor saturado: se reduce el límite de llamadas simultáneas a {int(self.limit)}.")
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    """Indica si el error es un 429 del proveedor, recorriendo también las causas encadenadas."""
+    while error is not None:
+        if getattr(error, "status_code", None) in THROTTLE_STATUS_CODES:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    """Indica si el error es un timeout del cliente del modelo, recorriendo también las causas encadenadas."""
+    while error is not None:
+        if isinstance(error, TimeoutError) or type(error).__name__ in ("APITimeoutError", "ReadTimeout", "ConnectTimeout"):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """Devuelve la espera indicada por la cabecera 'Retry-After' de la respuesta HTTP, si existe."""
+    while error is not None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers and headers.get("retry-after"):
+            try:
+                return float(headers.get("retry-after"))
+            except ValueError:
+                return None
+        error = error.__cause__ or error.__context__
+    return None
+
+
+class RateLimitedAgent:
+    """
+    Envoltorio de un agente que respeta los límites de peticiones y tokens por minuto de su modelo y
+    ajusta las llamadas simultáneas con `AdaptiveConcurrency`.
+
+    Antes de cada llamada se reserva una petición y una estimación de los tokens (prompt + salida esperada);
+    al terminar se corrige la reserva con los tokens reales que devuelve el modelo. Si el proveedor responde
+    con un 429, se reduce la concurrencia, se espera (respetando 'Retry-After') y se repite la llamada, hasta
+    `max_retries` veces y sin pasar del tiempo máximo del caso en curso. Un timeout del cliente también reduce
+    la concurrencia, pero no se repite: ya ha consumido el tiempo de la llamada y cuenta como un intento fallido.
+    Los demás errores se propagan sin reintentar.
+    """
+    def __init__(self, agent, requests_bucket: TokenBucket, tokens_bucket: TokenBucket, concurrency: AdaptiveConcurrency,
+                 expected_output_tokens: int = 500, max_retries: int = 8, base_delay: float = 1.0, max_delay: float = 60.0):
+        self._wrapped = agent
+        self._requests = requests_bucket
+        self._tokens = tokens_bucket
+        self._concurrency = concurrency
+        self.expected_output_tokens = expected_output_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.name = getattr(agent, "name", None) or getattr(agent, "agent").name
+
+    @property
+    def agent(self):
+        """Devuelve el agente de agno que hay debajo del envoltorio."""
+        return getattr(self._wrapped, "agent", self._wrapped)
+
+    def estimate_tokens(self, message: str) -> int:
+        """Estimación aproximada (4 caracteres por token) de los tokens de la llamada, incluidas las instrucciones."""
+        agent = self.agent
+        instructions = getattr(agent, "instructions", None) or ""
+        if isinstance(instructions, list):
+            instructions = "\n".join(str(item) for item in instructions)
+        prompt_chars = len(message) + len(str(instructions)) + len(str(getattr(agent, "description", None) or ""))
+        return prompt_chars // 4 + self.expected_output_tokens
+
+    def run(self, message: str, **kwargs):
+        """Ejecuta el agente dentro de los límites, esperando y reintentando si el proveedor está saturado."""
+        estimated = self.estimate_tokens(message)
+        for attempt in range(self.max_retries + 1):
+            self._requests.acquire(1)
+            self._tokens.acquire(estimated)
+            self._concurrency.acquire()
+            try:
+                response = self._wrapped.run(message, **kwargs)
+            except Exception as e:
+                if is_timeout_error(e):
+                    self._concurrency.on_throttle()
+                    raise AgentCallTimeout(f"{self.name} no ha respondido antes del timeout del cliente") from e
+                if not is_throttle_error(e) or attempt == self.max_retries:
+                    raise
+                error = e
+            else:
+                error = None
+            finally:
+                self._concurrency.release()
+
+            if error is not None:
+                # La espera se hace fuera del hueco de concurrencia para no bloquear a las demás llamadas
+                self._concurrency.on_throttle()
+                delay = max(retry_after_seconds(error) or 0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                # Jitter para que los hilos que recibieron el 429 a la vez no vuelvan todos en el mismo instante
+                delay *= random.uniform(0.5, 1.5)
+                deadline = case_deadline.get()
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise CaseDeadlineExceeded(f"Tiempo máximo del caso agotado esperando para reintentar {self.name}") from error
+                logging.warning(f"{self.name}: proveedor saturado ({error}). Reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s.")
+                time.sleep(delay)
+                continue
+
+            self._concurrency.on_success()
+            metrics = getattr(response, "metrics", None) or {}
+            used = sum(sum(v) if isinstance(v, list) else v for k, v in metrics.items() if k in ("input_tokens", "output_tokens"))
+            if used:
+                self._tokens.adjust(used - estimated)
+            return response
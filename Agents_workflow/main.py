@@ -1,36 +1,152 @@
 from dotenv import load_dotenv
 import os
+import argparse
+import contextvars
 import json
 import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from itertools import chain
 from datetime import datetime
 from clases import CaseStatus
-from agentes import create_anonymizer_agent, create_judge_agent, create_case_reviewer_agent, create_case_review_judge_agent
-from herramientas import load_json_file, save_to_csv, get_department_descriptions, get_processed_ids
+from agentes import (create_anonymizer_agent, create_judge_agent, create_case_reviewer_agent, create_case_review_judge_agent,
+                     create_batch_judge_agent, create_batch_case_review_judge_agent)
+from herramientas import iter_cases, get_department_descriptions, get_processed_ids
+from concurrencia import (AgentCallTimeout, CaseDeadlineExceeded, LimitedAgent, TimeoutStats, case_deadline,
+                          case_time_limit, current_case_id)
+from registro import setup_logging
+from cache import AgentCache, CachedAgent
+from limitador import AdaptiveConcurrency, RateLimitedAgent, TokenBucket
+from metricas import AgentMetrics, InstrumentedAgent, current_attempt
+from escritor import ResultWriter
+from checkpoints import STAGES, STAGE_ANONYMIZATION, STAGE_REVIEW, StageCheckpointStore
+from journal import CaseJournal
+from pipeline import run_pipeline
+from preanonimizador import pre_anonymize
+from verificador import ResidualPIIVerifier
+from fragmentos import split_text, stitch, unknown_tags
+from enrutador import TieredAgent, parse_tiers, current_round
+from juez_por_lotes import BatchedJudge
+from balanceador import OllamaPool, PooledOllamaAgent
+from particiones import done_ids_from_all_journals, merge_shards, shard_of, shard_path
 from agno.agent import Agent
 load_dotenv()
 
 # --- Constantes ---
 FILE_OUTPUT = "processed_cases.csv"
+FILE_OUTPUT_PARQUET = "processed_cases_parquet"
 FILE_INPUT = "cases.json"
+FILE_JOURNAL = "processed_cases.journal"
+FILE_CHECKPOINTS = "stage_checkpoints.sqlite"
 LOG_FILENAME = "sequential_workflow.log"
+# Formato del fichero de log ("json" = un objeto JSON por línea, o "texto"), tratamiento de los textos de los casos,
+# fracción de casos con registros INFO (los avisos y errores se registran siempre) y rotación por tamaño
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_PAYLOAD = os.getenv("LOG_PAYLOAD", "hash")
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "200"))
+LOG_SAMPLE_INFO = float(os.getenv("LOG_SAMPLE_INFO", "1.0"))
+LOG_MAX_MB = int(os.getenv("LOG_MAX_MB", "50"))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
 DEPARTMENTS_FILE = 'departments.json'
 MODEL_GPT_NAME = "gpt-4o-mini"
 MODEL_OLLAMA_NAME = "qwen3:4b"
+# Política de modelos de cada fase: el intento k usa el modelo k de la lista (formato proveedor:modelo[*n], ver enrutador.py).
+# Por ejemplo "ollama:qwen3:4b*2,ollama:qwen3:14b,openai:gpt-4o-mini". Los jueces usan siempre MODEL_OLLAMA_NAME y MODEL_GPT_NAME.
+ANONYMIZATION_MODELS = os.getenv("ANONYMIZATION_MODELS", f"ollama:{MODEL_OLLAMA_NAME}")
+REVIEW_MODELS = os.getenv("REVIEW_MODELS", f"openai:{MODEL_GPT_NAME}")
+# Formato de salida ("csv" o "parquet") y cada cuántas filas o segundos se escriben en disco
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "csv")
+FLUSH_ROWS = int(os.getenv("FLUSH_ROWS", "50"))
+FLUSH_SECONDS = float(os.getenv("FLUSH_SECONDS", "5"))
+# Caché en disco de las respuestas de los agentes
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_FILE = os.getenv("CACHE_FILE", "agent_cache.sqlite")
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", "512"))
+# Métricas por llamada a los agentes (JSONL) y resumen al final de la ejecución
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_FILE = os.getenv("METRICS_FILE", "agent_metrics.jsonl")
+# Pre-anonimización con reglas antes del agente anonimizador
+PRE_ANONYMIZATION = os.getenv("PRE_ANONYMIZATION", "true").lower() == "true"
+# Verificación rápida: si el escaneo de datos sensibles residuales alcanza el umbral de confianza, no se llama al juez
+FAST_VERIFICATION = os.getenv("FAST_VERIFICATION", "false").lower() == "true"
+FAST_VERIFICATION_THRESHOLD = float(os.getenv("FAST_VERIFICATION_THRESHOLD", "1.0"))
+# Modo especulativo de la fase 1: intentos de anonimización lanzados a la vez (1 = reintentos en serie),
+# temperaturas que se van alternando entre los intentos y máximo de llamadas al anonimizador por caso
+SPECULATIVE_ATTEMPTS = int(os.getenv("SPECULATIVE_ATTEMPTS", "1"))
+SPECULATIVE_TEMPERATURES = [float(t) for t in os.getenv("SPECULATIVE_TEMPERATURES", "0.2,0.6,1.0").split(",") if t.strip()]
+SPECULATIVE_MAX_CALLS = int(os.getenv("SPECULATIVE_MAX_CALLS", "5"))
+# Anonimización por fragmentos de los informes de más de CHUNK_THRESHOLD_CHARS caracteres (0 = desactivada)
+CHUNK_THRESHOLD_CHARS = int(os.getenv("CHUNK_THRESHOLD_CHARS", "0"))
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1500"))
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "4"))
+# Jueces por lotes: las evaluaciones de varios casos en paralelo se agrupan en una sola llamada
+BATCH_JUDGE = os.getenv("BATCH_JUDGE", "false").lower() == "true"
+BATCH_JUDGE_SIZE = int(os.getenv("BATCH_JUDGE_SIZE", "8"))
+BATCH_JUDGE_WAIT_MS = int(os.getenv("BATCH_JUDGE_WAIT_MS", "200"))
+# Casos que se procesan a la vez (1 = ejecución secuencial)
+MAX_CONCURRENT_CASES = int(os.getenv("MAX_CONCURRENT_CASES", "1"))
+# Llamadas simultáneas máximas a cada backend
+MAX_CONCURRENT_OLLAMA = int(os.getenv("MAX_CONCURRENT_OLLAMA", "2"))
+MAX_CONCURRENT_OPENAI = int(os.getenv("MAX_CONCURRENT_OPENAI", "8"))
+# Pool de servidores de Ollama (URLs separadas por comas; vacío = el servidor por defecto del cliente).
+# Con varios servidores, MAX_CONCURRENT_OLLAMA es el límite de llamadas simultáneas a cada uno.
+OLLAMA_HOSTS = [host.strip() for host in os.getenv("OLLAMA_HOSTS", "").split(",") if host.strip()]
+OLLAMA_HEALTH_INTERVAL_SECONDS = float(os.getenv("OLLAMA_HEALTH_INTERVAL_SECONDS", "10"))
+# Límites de OpenAI para MODEL_GPT_NAME (peticiones y tokens por minuto) y timeout de cada llamada.
+# Las llamadas que reciben un 429 o un timeout esperan y se reintentan en vez de fallar.
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "8"))
+# Tiempo máximo de cada llamada a un agente (también es el timeout del cliente de Ollama) y de cada caso, en segundos.
+# Una llamada que lo supera cuenta como un intento fallido; un caso que lo supera se da por fallido (0 = sin límite).
+AGENT_CALL_TIMEOUT_SECONDS = float(os.getenv("AGENT_CALL_TIMEOUT_SECONDS", "300"))
+CASE_TIMEOUT_SECONDS = float(os.getenv("CASE_TIMEOUT_SECONDS", "1800"))
+# Modo pipeline: la anonimización y la revisión se ejecutan como dos etapas separadas que se solapan
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "false").lower() == "true"
+ANONYMIZATION_WORKERS = int(os.getenv("ANONYMIZATION_WORKERS", "2"))
+REVIEW_WORKERS = int(os.getenv("REVIEW_WORKERS", "8"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
 
 # --- Logging Setup ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler(LOG_FILENAME, mode='a' if os.path.exists(LOG_FILENAME) else 'w', encoding='utf-8'),
-              logging.StreamHandler()]
-)
+# Los registros se escriben desde un hilo aparte (ver registro.py). Los textos de los casos se registran según
+# LOG_PAYLOAD ("completo", "truncado", "hash" u "omitir") para que el log no guarde los datos que se anonimizan.
+def configure_logging(filename: str = LOG_FILENAME):
+    """
+    Configura el log del workflow en `filename` y escribe el separador de la nueva ejecución.
+
+    Se llama al empezar la ejecución y no al importar el módulo, para que los benchmarks que importan
+    funciones de `main.py` no creen el fichero de log ni escriban en la consola.
+    """
+    setup_logging(
+        filename,
+        file_format=LOG_FORMAT,
+        payload_mode=LOG_PAYLOAD,
+        payload_max_chars=LOG_PAYLOAD_MAX_CHARS,
+        sample_rates={logging.INFO: LOG_SAMPLE_INFO},
+        max_bytes=LOG_MAX_MB * 1_000_000,
+        backup_count=LOG_BACKUPS,
+    )
 
-# Separador para cada nueva ejecución
-logging.info(f"\n{'='*50} NEW EXECUTION RUN - {datetime.now()} {'='*50}\n")
+    # Separador para cada nueva ejecución
+    logging.info(f"\n{'='*50} NEW EXECUTION RUN - {datetime.now()} {'='*50}\n")
 
 
 ######### FUNCIONES AUXILIARES #########
-def run_anonymization_process(text_to_anonymize: str, anonymizer_agent: Agent, judge_agent: Agent, max_retries: int = 5) -> str | None:
+def record_verdict(agent, approved: bool):
+    """Registra el veredicto del juez en la política de modelos del agente, si la tiene (ver `enrutador.py`)."""
+    if isinstance(agent, TieredAgent):
+        agent.record_verdict(approved)
+
+
+def record_exhausted(agent):
+    """Registra en la política de modelos del agente, si la tiene, un caso que ha agotado los reintentos."""
+    if isinstance(agent, TieredAgent):
+        agent.record_exhausted()
+
+
+def run_anonymization_process(text_to_anonymize: str, anonymizer_agent: Agent, judge_agent: Agent, max_retries: int = 5, use_rules: bool = True,
+                              verifier: ResidualPIIVerifier | None = None) -> str | None:
     """
     Orquesta el proceso de anonimización de un texto.
 
@@ -38,35 +154,82 @@ def run_anonymization_process(text_to_anonymize: str, anonymizer_agent: Agent, j
     1.  **Anonimizador**: Intenta anonimizar el texto.
     2.  **Juez**: Evalúa si la anonimización es correcta.
 
-    El proceso se reintenta hasta `max_retries` veces si el juez no aprueba el resultado.
+    Si `use_rules` está activo, antes de llamar al anonimizador se sustituyen con reglas los datos con formato
+    fijo (emails, teléfonos, DNI/NIE, IBAN y tarjetas), ver `preanonimizador.py`. El juez compara siempre
+    con el texto original.
+
+    Si se indica un `verifier`, cada anonimización se escanea antes en busca de datos sensibles residuales
+    y, si la confianza alcanza su umbral, se aprueba sin llamar al juez (ver `verificador.py`).
+    Una anonimización con etiquetas que no están en `get_anonymizer_instructions()` se rechaza sin llamar al juez.
+
+    El proceso se reintenta hasta `max_retries` veces si el juez no aprueba el resultado. Una llamada que supera
+    su tiempo máximo (`AgentCallTimeout`) cuenta como un intento fallido.
     Args:
         text_to_anonymize (str): El texto original que se va a anonimizar.
         anonymizer_agent (Agent): La instancia del agente que anonimiza.
         judge_agent (Agent): La instancia del agente que juzga.
         max_retries (int): El número máximo de intentos.
+        use_rules (bool): Si se aplica la pre-anonimización con reglas.
+        verifier (ResidualPIIVerifier | None): Verificación rápida previa al juez, o None para llamar siempre al juez.
 
     Returns:
         str | None: El texto anonimizado si el proceso tiene éxito, o None si falla.
+
+    Raises:
+        CaseDeadlineExceeded: Si se agota el tiempo máximo del caso.
     """
     logging.info("--- FASE 1: Iniciando Proceso Secuencial de Anonimización ---")
+    text_for_agent = text_to_anonymize
+    if use_rules:
+        text_for_agent, rule_counts = pre_anonymize(text_to_anonymize)
+        if rule_counts:
+            logging.info(f"Pre-anonimización con reglas: {rule_counts}")
     try:
         #Inicia el bucle de reintentos
         for attempt in range(max_retries):
 
             logging.info(f"\nIntento de anonimización {attempt + 1}/{max_retries}...")
+            current_attempt.set(attempt + 1)
             
             #1. Anonimizar texto
-            anon_response = anonymizer_agent.run(f"Anonimiza el siguiente texto: \n\n---\n{text_to_anonymize}\n---")
+            try:
+                anon_response = anonymizer_agent.run(f"Anonimiza el siguiente texto: \n\n---\n{text_for_agent}\n---")
+            except AgentCallTimeout as e:
+                logging.warning(f"{e}. Reintentando...")
+                record_verdict(anonymizer_agent, False)
+                continue
             anonymized_text = anon_response.content.texto_anonimizado
-            logging.info(f"Texto anonimizado (intento {attempt + 1}):\n{anonymized_text}")
+            logging.info(f"Texto anonimizado (intento {attempt + 1}):", extra={"payload": anonymized_text})
 
-            #2. Evaluar anonimización
-            judge_response = judge_agent.run(
-                f"Evalúa si la siguiente anonimización es correcta.\n"
-                f"Texto Original:\n---\n{text_to_anonymize}\n---\n\n"
-                f"Texto Anonimizado:\n---\n{anonymized_text}\n---"
-            )
-            #3. Validación de que la anonimización es correcta y se devuelve el texto anonimizado
+            #2. El texto solo puede usar las etiquetas de las instrucciones del anonimizador
+            invalid_tags = unknown_tags(anonymized_text, text_to_anonymize)
+            if invalid_tags:
+                logging.warning(f"El anonimizador ha usado etiquetas no válidas {sorted(invalid_tags)}. Reintentando...")
+                record_verdict(anonymizer_agent, False)
+                continue
+
+            #3. Verificación rápida: si no quedan datos sensibles evidentes no hace falta el juez
+            if verifier is not None:
+                approved, confidence, findings = verifier.approves(text_to_anonymize, anonymized_text)
+                if approved:
+                    logging.info(f"Verificación rápida aprobada (confianza {confidence:.2f}), se omite el juez.")
+                    record_verdict(anonymizer_agent, True)
+                    return anonymized_text
+                logging.info(f"Verificación rápida no concluyente (confianza {confidence:.2f}), {len(findings)} posibles datos sensibles:",
+                             extra={"payload": findings})
+
+            #4. Evaluar anonimización
+            try:
+                judge_response = judge_agent.run(
+                    f"Evalúa si la siguiente anonimización es correcta.\n"
+                    f"Texto Original:\n---\n{text_to_anonymize}\n---\n\n"
+                    f"Texto Anonimizado:\n---\n{anonymized_text}\n---"
+                )
+            except AgentCallTimeout as e:
+                logging.warning(f"{e}. Reintentando...")
+                continue
+            #5. Validación de que la anonimización es correcta y se devuelve el texto anonimizado
+            record_verdict(anonymizer_agent, judge_response.content.is_correct)
             if judge_response.content.is_correct:
                 logging.info("El Juez ha aprobado la anonimización.")
                 return anonymized_text
@@ -75,12 +238,187 @@ def run_anonymization_process(text_to_anonymize: str, anonymizer_agent: Agent, j
         
         #Si no se ha podido obtener una anonimización correcta, se devuelve None
         logging.error("No se pudo obtener una anonimización correcta después de 5 intentos.")
+        record_exhausted(anonymizer_agent)
         return None
+    except CaseDeadlineExceeded:
+        raise
     except Exception as e:
         logging.error(f"Error al anonimizar el texto: {e}")
         raise Exception(f"Error al anonimizar el texto: {e}")
 
 
+def _set_temperature(agent, temperature: float):
+    """Fija la temperatura del modelo de la instancia de agno del hilo actual (Ollama usa `options`, OpenAI `temperature`)."""
+    agent = getattr(agent, "agent", None)
+    model = getattr(agent, "model", None)
+    if model is None:
+        return
+    if hasattr(model, "options"):
+        model.options = {**(model.options or {}), "temperature": temperature}
+    elif hasattr(model, "temperature"):
+        model.temperature = temperature
+
+
+def run_speculative_anonymization(text_to_anonymize: str, anonymizer_agent: Agent, judge_agent: Agent, parallel_attempts: int = 3,
+                                  max_calls: int = 5, temperatures: list | None = None, use_rules: bool = True,
+                                  verifier: ResidualPIIVerifier | None = None) -> str | None:
+    """
+    Variante especulativa de `run_anonymization_process`: en vez de reintentar en serie, lanza
+    `parallel_attempts` intentos de anonimización a la vez y juzga cada uno en cuanto termina.
+
+    Se devuelve el primer intento aprobado y se cancelan los que aún no han empezado; los que están en curso
+    terminan su llamada al anonimizador pero ya no llaman al juez. Cada intento rechazado se sustituye por uno
+    nuevo mientras no se supere `max_calls` llamadas al anonimizador en total, que limita el coste extra.
+    Cada intento usa la siguiente temperatura de `temperatures` para que no devuelvan todos lo mismo.
+    Un intento cuya llamada supera su tiempo máximo cuenta como rechazado.
+
+    Con una política de modelos por intento (`ANONYMIZATION_MODELS`), los intentos se agrupan en rondas de
+    `parallel_attempts`: todos los de una ronda usan el mismo nivel y solo se pasa al siguiente nivel cuando
+    se lanzan los intentos de la ronda siguiente, así que el primer lote no llama a los modelos más caros.
+
+    Los intentos siguen sujetos al límite de llamadas simultáneas a Ollama (`MAX_CONCURRENT_OLLAMA`).
+
+    Args:
+        text_to_anonymize (str): El texto original que se va a anonimizar.
+        anonymizer_agent (Agent): La instancia del agente que anonimiza.
+        judge_agent (Agent): La instancia del agente que juzga.
+        parallel_attempts (int): Intentos que se ejecutan a la vez.
+        max_calls (int): Máximo de llamadas al anonimizador para el caso.
+        temperatures (list | None): Temperaturas que se asignan por turnos a los intentos, o None para no cambiarla.
+        use_rules (bool): Si se aplica la pre-anonimización con reglas.
+        verifier (ResidualPIIVerifier | None): Verificación rápida previa al juez.
+
+    Returns:
+        str | None: El primer texto anonimizado aprobado, o None si ninguno se aprueba.
+    """
+    logging.info(f"--- FASE 1: Iniciando Proceso Especulativo de Anonimización ({parallel_attempts} intentos a la vez) ---")
+    text_for_agent = text_to_anonymize
+    if use_rules:
+        text_for_agent, rule_counts = pre_anonymize(text_to_anonymize)
+        if rule_counts:
+            logging.info(f"Pre-anonimización con reglas: {rule_counts}")
+    finished = threading.Event()
+
+    def attempt(attempt_number: int, temperature: float | None) -> tuple[str | None, bool]:
+        current_attempt.set(attempt_number)
+        current_round.set((attempt_number - 1) // parallel_attempts + 1)
+        if finished.is_set():
+            return None, False
+        if temperature is not None:
+            _set_temperature(anonymizer_agent, temperature)
+        try:
+            anon_response = anonymizer_agent.run(f"Anonimiza el siguiente texto: \n\n---\n{text_for_agent}\n---")
+        except AgentCallTimeout as e:
+            logging.warning(f"{e} (intento {attempt_number}).")
+            record_verdict(anonymizer_agent, False)
+            return None, False
+        anonymized_text = anon_response.content.texto_anonimizado
+        if finished.is_set():
+            # Otro intento ya ha sido aprobado: no se gasta una llamada al juez
+            return anonymized_text, False
+        logging.info(f"Texto anonimizado (intento {attempt_number}, temperatura {temperature}):", extra={"payload": anonymized_text})
+        invalid_tags = unknown_tags(anonymized_text, text_to_anonymize)
+        if invalid_tags:
+            logging.warning(f"El anonimizador ha usado etiquetas no válidas {sorted(invalid_tags)}.")
+            record_verdict(anonymizer_agent, False)
+            return anonymized_text, False
+        if verifier is not None:
+            approved, confidence, findings = verifier.approves(text_to_anonymize, anonymized_text)
+            if approved:
+                logging.info(f"Verificación rápida aprobada (confianza {confidence:.2f}), se omite el juez.")
+                record_verdict(anonymizer_agent, True)
+                return anonymized_text, True
+            logging.info(f"Verificación rápida no concluyente (confianza {confidence:.2f}), {len(findings)} posibles datos sensibles:",
+                         extra={"payload": findings})
+        try:
+            judge_response = judge_agent.run(
+                f"Evalúa si la siguiente anonimización es correcta.\n"
+                f"Texto Original:\n---\n{text_to_anonymize}\n---\n\n"
+                f"Texto Anonimizado:\n---\n{anonymized_text}\n---"
+            )
+        except AgentCallTimeout as e:
+            logging.warning(f"{e} (intento {attempt_number}).")
+            return anonymized_text, False
+        record_verdict(anonymizer_agent, judge_response.content.is_correct)
+        return anonymized_text, bool(judge_response.content.is_correct)
+
+    executor = ThreadPoolExecutor(max_workers=parallel_attempts, thread_name_prefix="especulativo")
+    in_flight = set()
+    launched = 0
+
+    def launch():
+        nonlocal launched
+        temperature = temperatures[launched % len(temperatures)] if temperatures else None
+        launched += 1
+        # Cada intento se ejecuta en una copia del contexto para conservar el caseID de los logs
+        in_flight.add(executor.submit(contextvars.copy_context().run, attempt, launched, temperature))
+
+    try:
+        for _ in range(min(parallel_attempts, max_calls)):
+            launch()
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                anonymized_text, approved = future.result()
+                if approved:
+                    logging.info(f"El Juez ha aprobado la anonimización ({launched} intentos lanzados).")
+                    return anonymized_text
+                logging.warning("El Juez ha rechazado una anonimización.")
+                if launched < max_calls:
+                    launch()
+        logging.error(f"No se pudo obtener una anonimización correcta después de {launched} intentos.")
+        record_exhausted(anonymizer_agent)
+        return None
+    except CaseDeadlineExceeded:
+        raise
+    except Exception as e:
+        logging.error(f"Error al anonimizar el texto: {e}")
+        raise Exception(f"Error al anonimizar el texto: {e}")
+    finally:
+        # No se espera a los intentos que siguen en curso: sus resultados ya no se usan
+        finished.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_chunked_anonymization(text_to_anonymize: str, anonymize_chunk, max_chunk_chars: int = 1500, workers: int = 4) -> str | None:
+    """
+    Anonimiza un texto largo por fragmentos en paralelo.
+
+    El texto se divide entre párrafos o frases en fragmentos de hasta `max_chunk_chars` caracteres (ver
+    `fragmentos.py`). Cada fragmento se anonimiza y se juzga por separado con `anonymize_chunk` (por ejemplo
+    `run_anonymization_process`), de modo que solo se reintentan los fragmentos rechazados, y los resultados
+    se unen en orden con los separadores originales. Como las etiquetas son genéricas y no numeradas, el
+    texto unido es coherente con el que devolvería el anonimizador de una sola vez.
+
+    Args:
+        text_to_anonymize (str): El texto original que se va a anonimizar.
+        anonymize_chunk (Callable[[str], str | None]): Función que anonimiza y juzga un fragmento.
+        max_chunk_chars (int): Tamaño máximo de cada fragmento.
+        workers (int): Fragmentos que se anonimizan a la vez.
+
+    Returns:
+        str | None: El texto anonimizado completo, o None si algún fragmento no se aprueba.
+    """
+    chunks = split_text(text_to_anonymize, max_chunk_chars)
+    logging.info(f"--- FASE 1: Anonimización por fragmentos ({len(chunks)} fragmentos de hasta {max_chunk_chars} caracteres) ---")
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fragmento")
+    try:
+        # Cada fragmento se ejecuta en una copia del contexto para conservar el caseID de los logs
+        futures = [executor.submit(contextvars.copy_context().run, anonymize_chunk, chunk) if chunk.strip() else None
+                   for chunk, _ in chunks]
+        anonymized_chunks = []
+        for index, future in enumerate(futures):
+            anonymized_chunk = future.result() if future is not None else chunks[index][0]
+            if anonymized_chunk is None:
+                logging.error(f"No se pudo anonimizar el fragmento {index + 1}/{len(chunks)}.")
+                return None
+            anonymized_chunks.append(anonymized_chunk)
+        return stitch(anonymized_chunks, [sep for _, sep in chunks])
+    finally:
+        # Si un fragmento falla no se lanzan los que quedan pendientes
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 def run_case_review_process(anonymized_text: str, case_reviewer_agent: Agent, case_review_judge_agent: Agent, max_retries: int = 5) -> CaseStatus | None:
     """
     Orquesta el proceso de revisión y clasificación de un caso anonimizado.
@@ -89,7 +427,8 @@ def run_case_review_process(anonymized_text: str, case_reviewer_agent: Agent, ca
     1.  **Revisor de Casos**: Analiza el informe y extrae su estado, acciones, etc.
     2.  **Juez de Revisión**: Evalúa si la clasificación del revisor es correcta.
 
-    El proceso se reintenta hasta `max_retries` veces si el juez no aprueba el resultado.
+    El proceso se reintenta hasta `max_retries` veces si el juez no aprueba el resultado. Una llamada que supera
+    su tiempo máximo (`AgentCallTimeout`) cuenta como un intento fallido.
 
     Args:
         anonymized_text (str): El informe del caso ya anonimizado.
@@ -99,6 +438,9 @@ def run_case_review_process(anonymized_text: str, case_reviewer_agent: Agent, ca
 
     Returns:
         CaseStatus | None: Un objeto con el estado del caso si el proceso tiene éxito, o None si falla.
+
+    Raises:
+        CaseDeadlineExceeded: Si se agota el tiempo máximo del caso.
     """
     logging.info("--- FASE 2: Revisión de Caso ---")
     
@@ -106,52 +448,231 @@ def run_case_review_process(anonymized_text: str, case_reviewer_agent: Agent, ca
         #Inicia el bucle de reintentos
         for attempt in range(max_retries):
                 logging.info(f"Intento {attempt + 1}/{max_retries}")
+                current_attempt.set(attempt + 1)
             
                 #1. Analizar caso
-                review_response = case_reviewer_agent.run(f"Analiza el siguiente informe del caso: \n\n---\n{anonymized_text}\n---")
+                try:
+                    review_response = case_reviewer_agent.run(f"Analiza el siguiente informe del caso: \n\n---\n{anonymized_text}\n---")
+                except AgentCallTimeout as e:
+                    logging.warning(f"{e}. Reintentando...")
+                    record_verdict(case_reviewer_agent, False)
+                    continue
                 case_status = review_response.content
                 
                 #2. Evaluar revisión
-                judge_response = case_review_judge_agent.run(
-                    f"Evalúa si la siguiente revisión es correcta.\n"
-                    f"Informe del Caso:\n---\n{anonymized_text}\n---\n\n"
-                    f"Análisis del Revisor (JSON):\n---\n{case_status.model_dump_json()}\n---"
-                )
+                try:
+                    judge_response = case_review_judge_agent.run(
+                        f"Evalúa si la siguiente revisión es correcta.\n"
+                        f"Informe del Caso:\n---\n{anonymized_text}\n---\n\n"
+                        f"Análisis del Revisor (JSON):\n---\n{case_status.model_dump_json()}\n---"
+                    )
+                except AgentCallTimeout as e:
+                    logging.warning(f"{e}. Reintentando...")
+                    continue
                 
                 #3. Validación de que la revisión es correcta y se devuelve el caso
+                record_verdict(case_reviewer_agent, judge_response.content.is_correct)
                 if judge_response.content.is_correct:
                     logging.info("El Juez ha aprobado la revisión.")
                     return case_status
                 else:
                     logging.warning("El Juez ha rechazado la revisión. Reintentando...")
                     
+    except CaseDeadlineExceeded:
+        raise
     except Exception as e:
         logging.error(f"Error al analizar el caso: {e}")
         raise Exception(f"Error al analizar el caso: {e}")
 
     #Si no se ha podido obtener una revisión correcta, se devuelve None
     logging.error("No se pudo obtener una revisión correcta después de 5 intentos")
+    record_exhausted(case_reviewer_agent)
     return None
 
 
+def anonymize_case(case_to_process: dict, position: int, anonymizer, judge, journal: CaseJournal, checkpoints: StageCheckpointStore,
+                   verifier: ResidualPIIVerifier | None = None, timeout_stats: TimeoutStats | None = None) -> str | None:
+    """
+    Ejecuta la fase 1 (anonimización) de un caso.
+
+    Si la anonimización del caso ya se aprobó en una ejecución anterior, se recupera del checkpoint
+    en vez de volver a llamar a los agentes. Si se agota el tiempo máximo del caso, el caso se marca como fallido.
+
+    Args:
+        case_to_process (dict): El caso a procesar, con 'caseID' y 'report'.
+        position (int): Posición del caso en la ejecución (empezando en 1), solo para los logs.
+        anonymizer, judge: Los agentes de la fase 1.
+        journal (CaseJournal): Journal donde se registra el estado del caso.
+        checkpoints (StageCheckpointStore): Resultados intermedios por caso y etapa.
+        verifier (ResidualPIIVerifier | None): Verificación rápida previa al juez de anonimización.
+        timeout_stats (TimeoutStats | None): Contadores donde se registra el caso si agota su tiempo máximo.
+
+    Returns:
+        str | None: El texto anonimizado, o None si el caso no es válido o la anonimización falla.
+    """
+    #Extraer el texto a procesar y el ID del caso
+    text_to_process = case_to_process.get('report')
+    case_id = case_to_process.get('caseID')
+    current_case_id.set(str(case_id))
+    logging.info(f"\n--- Procesando caso {position} (ID: {case_id}) ---")
+
+    #Validación de que existe el texto a procesar y el ID del caso
+    if not text_to_process or not case_id:
+        logging.warning(f"Saltando caso {position} por falta de 'report' o 'caseID'.")
+        return None
+
+    journal.mark_in_progress(case_id)
+    checkpoint = checkpoints.get(case_id, STAGE_ANONYMIZATION)
+    if checkpoint:
+        logging.info("Anonimización recuperada del checkpoint de una ejecución anterior.")
+        return checkpoint["texto_anonimizado"]
+
+    try:
+        def anonymize_text(text: str) -> str | None:
+            if SPECULATIVE_ATTEMPTS > 1:
+                return run_speculative_anonymization(
+                    text, anonymizer, judge, parallel_attempts=SPECULATIVE_ATTEMPTS, max_calls=SPECULATIVE_MAX_CALLS,
+                    temperatures=SPECULATIVE_TEMPERATURES, use_rules=PRE_ANONYMIZATION, verifier=verifier,
+                )
+            return run_anonymization_process(text, anonymizer, judge, use_rules=PRE_ANONYMIZATION, verifier=verifier)
+
+        # Los informes largos se anonimizan por fragmentos en paralelo
+        if CHUNK_THRESHOLD_CHARS and len(text_to_process) > CHUNK_THRESHOLD_CHARS:
+            texto_anonimizado_resultado = run_chunked_anonymization(text_to_process, anonymize_text, max_chunk_chars=CHUNK_MAX_CHARS, workers=CHUNK_WORKERS)
+        else:
+            texto_anonimizado_resultado = anonymize_text(text_to_process)
+    except CaseDeadlineExceeded as e:
+        logging.error(f"{e}. Se da por fallido el caso ID: {case_id}.")
+        checkpoints.mark_failed(case_id, STAGE_ANONYMIZATION, str(e))
+        journal.mark_failed(case_id)
+        if timeout_stats is not None:
+            timeout_stats.record_case()
+        return None
+    except Exception as e:
+        checkpoints.mark_failed(case_id, STAGE_ANONYMIZATION, str(e))
+        raise
+    if not texto_anonimizado_resultado:
+        logging.error(f"Error en la fase de anonimización para el caso ID: {case_id}.")
+        checkpoints.mark_failed(case_id, STAGE_ANONYMIZATION, "El juez no aprobó ninguna anonimización")
+        journal.mark_failed(case_id)
+        return None
+    checkpoints.save(case_id, STAGE_ANONYMIZATION, {"texto_anonimizado": texto_anonimizado_resultado, "veredicto_juez": True})
+    return texto_anonimizado_resultado
+
+
+def review_case(case_to_process: dict, anonymized_text: str, case_reviewer, case_review_judge, journal: CaseJournal, checkpoints: StageCheckpointStore,
+                timeout_stats: TimeoutStats | None = None) -> dict | None:
+    """
+    Ejecuta la fase 2 (revisión) de un caso ya anonimizado y construye la fila de salida.
+
+    Si la revisión del caso ya se aprobó en una ejecución anterior (pero la fila no llegó a guardarse),
+    se recupera del checkpoint. Si se agota el tiempo máximo del caso, el caso se marca como fallido.
+
+    Args:
+        case_to_process (dict): El caso a procesar, con 'caseID' y 'report'.
+        anonymized_text (str): El informe del caso anonimizado en la fase 1.
+        case_reviewer, case_review_judge: Los agentes de la fase 2.
+        journal (CaseJournal): Journal donde se registra el estado del caso.
+        checkpoints (StageCheckpointStore): Resultados intermedios por caso y etapa.
+        timeout_stats (TimeoutStats | None): Contadores donde se registra el caso si agota su tiempo máximo.
+
+    Returns:
+        dict | None: La fila a guardar en el CSV, o None si la revisión falla.
+    """
+    case_id = case_to_process.get('caseID')
+    current_case_id.set(str(case_id))
+
+    checkpoint = checkpoints.get(case_id, STAGE_REVIEW)
+    if checkpoint:
+        logging.info("Revisión recuperada del checkpoint de una ejecución anterior.")
+        final_case_status = CaseStatus.model_validate(checkpoint["case_status"])
+    else:
+        try:
+            final_case_status = run_case_review_process(anonymized_text, case_reviewer, case_review_judge)
+        except CaseDeadlineExceeded as e:
+            logging.error(f"{e}. Se da por fallido el caso ID: {case_id}.")
+            checkpoints.mark_failed(case_id, STAGE_REVIEW, str(e))
+            journal.mark_failed(case_id)
+            if timeout_stats is not None:
+                timeout_stats.record_case()
+            return None
+        except Exception as e:
+            checkpoints.mark_failed(case_id, STAGE_REVIEW, str(e))
+            raise
+        if not final_case_status:
+            logging.error(f"Error en la fase de revisión para el caso ID: {case_id}.")
+            checkpoints.mark_failed(case_id, STAGE_REVIEW, "El juez no aprobó ninguna revisión")
+            journal.mark_failed(case_id)
+            return None
+        checkpoints.save(case_id, STAGE_REVIEW, {"case_status": final_case_status.model_dump(), "veredicto_juez": True})
+
+    #6. Formateo de la salida desde la clase Pydantic a JSON
+    json_output_final = json.loads(final_case_status.model_dump_json())
+
+    #7. Añadir el ID del caso al JSON
+    json_output_final["caseID"] = case_id
+
+    #Logs de la salida final para trazabilidad
+    logging.info("\n--- Proceso completado para el caso ---")
+    logging.info("\n--- Salida JSON Final ---", extra={"payload": json_output_final})
+    return json_output_final
+
+
+def process_case(case_to_process: dict, position: int, anonymizer, judge, case_reviewer, case_review_judge, journal: CaseJournal, checkpoints: StageCheckpointStore,
+                 verifier: ResidualPIIVerifier | None = None, timeout_stats: TimeoutStats | None = None) -> dict | None:
+    """
+    Ejecuta el flujo completo de dos fases (anonimización y revisión) para un único caso.
+    Las dos fases comparten el tiempo máximo del caso (`CASE_TIMEOUT_SECONDS`).
+
+    Returns:
+        dict | None: La fila a guardar en el CSV si el caso se procesa con éxito, o None si falla alguna fase.
+    """
+    # --- Ejecución del proceso completo para un caso ---
+    with case_time_limit(CASE_TIMEOUT_SECONDS):
+        texto_anonimizado_resultado = anonymize_case(case_to_process, position, anonymizer, judge, journal, checkpoints, verifier, timeout_stats)
+        if not texto_anonimizado_resultado:
+            return None
+        return review_case(case_to_process, texto_anonimizado_resultado, case_reviewer, case_review_judge, journal, checkpoints, timeout_stats)
+
+
 ######### FUNCIÓN PRINCIPAL #########
-def main():
+def main(reprocess_stage: str | None = None, shard_index: int = 0, shard_count: int = 1):
     """
     Función principal que orquesta el pipeline completo de procesamiento de casos.
 
+    Args:
+        reprocess_stage (str | None): Si se indica una etapa ("anonimizacion" o "revision"), solo se procesan
+            los casos cuya última ejecución de esa etapa falló.
+        shard_index (int): Partición que procesa esta ejecución (de 0 a `shard_count` - 1).
+        shard_count (int): Número de particiones. Con más de una, solo se procesan los casos cuyo caseID cae en
+            `shard_index` (ver `particiones.py`) y la salida, el journal y las métricas se escriben en ficheros
+            propios de la partición, que luego se combinan con `--combinar`.
+
     El proceso consiste en los siguientes pasos:
-    1.  Carga los casos de un fichero JSON de entrada.
-    2.  Comprueba qué casos ya han sido procesados previamente (revisando un CSV de salida).
-    3.  Filtra los casos para procesar únicamente los que son nuevos.
+    1.  Lee los casos de un fichero JSON o JSON Lines de entrada de forma incremental (`iter_cases`).
+    2.  Comprueba qué casos ya han sido procesados previamente (revisando el journal de casos procesados).
+    3.  Filtra los casos para procesar únicamente los que son nuevos, a medida que se leen.
     4.  Para cada caso nuevo, ejecuta un flujo de dos fases:
         a.  **Anonimización**: Se anonimiza el informe del caso.
         b.  **Revisión**: Se clasifica el caso anonimizado para determinar su estado y departamento.
-    5.  Guarda el resultado de cada caso procesado exitosamente en el fichero CSV de salida.
+    5.  Guarda el resultado de cada caso procesado exitosamente en el fichero de salida (CSV o Parquet).
+
+    Si `MAX_CONCURRENT_CASES` es mayor que 1, los casos se procesan en paralelo en un pool de hilos,
+    limitando las llamadas simultáneas a Ollama y a OpenAI con `MAX_CONCURRENT_OLLAMA` y `MAX_CONCURRENT_OPENAI`.
+    Si `PIPELINE_MODE` está activo, las dos fases se ejecutan como etapas de un pipeline con
+    `ANONYMIZATION_WORKERS` y `REVIEW_WORKERS` trabajadores unidos por una cola acotada (ver `pipeline.py`).
+    Los resultados se escriben con un único `ResultWriter` que los agrupa en bloques y, tras cada bloque,
+    marca sus casos como hechos en el journal.
     """
+    # El fichero rotativo no se puede compartir entre procesos: cada partición escribe su propio log
+    configure_logging(shard_path(LOG_FILENAME, shard_index, shard_count) if shard_count > 1 else LOG_FILENAME)
+
     #1 Conexión a fuentes de datos y carga de datos
     try:
-        #Carga los casos del fichero JSON de entrada
-        cases = load_json_file(FILE_INPUT)
+        #Los casos del fichero de entrada se leen de uno en uno, sin cargar el fichero entero en memoria
+        if not os.path.isfile(FILE_INPUT):
+            raise FileNotFoundError(f"No existe el fichero {FILE_INPUT}")
+        cases = iter_cases(FILE_INPUT)
     except Exception as e:
         logging.error(f"Error al cargar los casos: {e}")
         raise Exception(f"Error al cargar los casos: {e}")
@@ -163,19 +684,107 @@ def main():
         logging.error(f"Error al cargar las descripciones de los departamentos: {e}")
         raise Exception(f"Error al cargar las descripciones de los departamentos: {e}")
 
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Partición no válida: {shard_index} de {shard_count}")
+    sharded = shard_count > 1
+    journal_path = shard_path(FILE_JOURNAL, shard_index, shard_count) if sharded else FILE_JOURNAL
+    output_path = FILE_OUTPUT_PARQUET if OUTPUT_FORMAT == "parquet" else FILE_OUTPUT
+    if sharded:
+        output_path = shard_path(output_path, shard_index, shard_count)
+        logging.info(f"Procesando la partición {shard_index} de {shard_count} (salida en {output_path}).")
+
     try:
-        # Obtener IDs de los casos ya procesados para no repetirlos
-        processed_ids = get_processed_ids(FILE_OUTPUT)
+        # Cargar el journal con el estado de los casos ya procesados para no repetirlos.
+        # La primera vez se crea a partir de los caseID del CSV de salida.
+        journal_exists = os.path.isfile(journal_path)
+        journal = CaseJournal(journal_path)
+        if not journal_exists:
+            journal.bootstrap(get_processed_ids(FILE_OUTPUT))
+        # Los casos hechos en cualquier partición, de esta o de otra ejecución con otro número de particiones, no se repiten
+        included = journal.include_done(done_ids_from_all_journals(FILE_JOURNAL))
+        if included:
+            logging.info(f"{included} casos hechos en otros journals (canónico o de otras particiones).")
+        logging.info(f"Casos en el journal: {journal.counts()}")
+        # Resultados intermedios de cada etapa, para no repetir las etapas que ya terminaron
+        checkpoints = StageCheckpointStore(FILE_CHECKPOINTS)
     except Exception as e:
         logging.error(f"Error al obtener los IDs de los casos ya procesados: {e}")
         raise Exception(f"Error al obtener los IDs de los casos ya procesados: {e}")
 
-    # Crear todos los agentes
+    # Crear todos los agentes. Cada hilo crea sus propias instancias y los semáforos limitan las llamadas por backend.
     try:
-        anonymizer = create_anonymizer_agent(model_name=MODEL_OLLAMA_NAME)
-        judge = create_judge_agent(model_name=MODEL_OLLAMA_NAME)
-        case_reviewer = create_case_reviewer_agent(department_descriptions=department_descriptions, model_name=MODEL_GPT_NAME)
-        case_review_judge = create_case_review_judge_agent(department_descriptions=department_descriptions, model_name=MODEL_GPT_NAME)
+        # Con un pool de servidores de Ollama, cada llamada va al servidor con menos llamadas en curso
+        ollama_pool = None
+        if OLLAMA_HOSTS:
+            ollama_models = {MODEL_OLLAMA_NAME} | {model_name for provider, model_name in parse_tiers(ANONYMIZATION_MODELS) + parse_tiers(REVIEW_MODELS)
+                                                   if provider == "ollama"}
+            ollama_pool = OllamaPool(OLLAMA_HOSTS, max_per_host=MAX_CONCURRENT_OLLAMA, model_names=sorted(ollama_models),
+                                     timeout=AGENT_CALL_TIMEOUT_SECONDS or None, health_interval=OLLAMA_HEALTH_INTERVAL_SECONDS)
+            ollama_pool.start()
+            logging.info(f"Pool de Ollama: {ollama_pool.stats()}")
+        ollama_slots = threading.BoundedSemaphore(MAX_CONCURRENT_OLLAMA * max(len(OLLAMA_HOSTS), 1))
+        openai_slots = threading.BoundedSemaphore(MAX_CONCURRENT_OPENAI)
+        # Los agentes de OpenAI comparten el presupuesto de peticiones y tokens por minuto del modelo,
+        # y la concurrencia se ajusta (AIMD) por debajo de MAX_CONCURRENT_OPENAI según los 429 que se reciban
+        openai_requests = TokenBucket(OPENAI_RPM, name="peticiones por minuto")
+        openai_tokens = TokenBucket(OPENAI_TPM, name="tokens por minuto")
+        openai_concurrency = AdaptiveConcurrency(initial=MAX_CONCURRENT_OPENAI, maximum=MAX_CONCURRENT_OPENAI)
+        # Las respuestas se guardan en una caché en disco para no repetir llamadas al volver a procesar casos
+        agent_cache = AgentCache(CACHE_FILE, max_bytes=CACHE_MAX_MB * 1_000_000) if CACHE_ENABLED else None
+        # Cada llamada a un agente (también las resueltas por la caché) se registra en el fichero de métricas
+        agent_metrics = AgentMetrics(shard_path(METRICS_FILE, shard_index, shard_count) if sharded else METRICS_FILE) if METRICS_ENABLED else None
+        # Llamadas y casos que superan su tiempo máximo
+        timeout_stats = TimeoutStats()
+
+        def build_agent(create_agent, provider: str, model_name: str, instrument: bool = True, **kwargs):
+            # El cliente de OpenAI no reintenta por su cuenta: los 429 y timeouts los gestiona RateLimitedAgent
+            if provider == "openai":
+                kwargs.update(timeout=OPENAI_TIMEOUT_SECONDS, max_retries=0)
+            else:
+                kwargs.update(timeout=AGENT_CALL_TIMEOUT_SECONDS or None)
+            agent = LimitedAgent(lambda: create_agent(model_name=model_name, provider=provider, **kwargs),
+                                 openai_slots if provider == "openai" else ollama_slots,
+                                 call_timeout=AGENT_CALL_TIMEOUT_SECONDS or None, timeout_stats=timeout_stats)
+            # Se crea ya la instancia del hilo principal para detectar errores de configuración antes de empezar
+            agent.agent
+            if provider == "openai":
+                agent = RateLimitedAgent(agent, openai_requests, openai_tokens, openai_concurrency, max_retries=OPENAI_MAX_RETRIES)
+            elif ollama_pool is not None:
+                agent = PooledOllamaAgent(agent, ollama_pool)
+            if agent_cache is not None:
+                agent = CachedAgent(agent, agent_cache)
+            if agent_metrics is not None and instrument:
+                agent = InstrumentedAgent(agent, agent_metrics)
+            return agent
+
+        def build_judge(create_agent, create_batch_agent, provider: str, model_name: str, **kwargs):
+            if not BATCH_JUDGE:
+                return build_agent(create_agent, provider, model_name, **kwargs)
+            # Se instrumenta el juez por lotes completo (una entrada por evaluación, con su veredicto) y la llamada
+            # por lotes (tokens), pero no el juez individual de respaldo para no contar dos veces sus evaluaciones
+            judge = BatchedJudge(build_agent(create_agent, provider, model_name, instrument=False, **kwargs),
+                                 build_agent(create_batch_agent, provider, model_name, **kwargs),
+                                 max_batch_size=BATCH_JUDGE_SIZE, max_wait_seconds=BATCH_JUDGE_WAIT_MS / 1000)
+            batched_judges.append(judge)
+            return InstrumentedAgent(judge, agent_metrics) if agent_metrics is not None else judge
+
+        def build_tiered_agent(create_agent, models: str, **kwargs):
+            # Un agente por modelo distinto de la política; los intentos con el mismo modelo lo comparten
+            agents_by_model = {}
+            tiers = []
+            for provider, model_name in parse_tiers(models):
+                label = f"{provider}:{model_name}"
+                if label not in agents_by_model:
+                    agents_by_model[label] = build_agent(create_agent, provider, model_name, **kwargs)
+                tiers.append((label, agents_by_model[label]))
+            return TieredAgent(tiers)
+
+        batched_judges = []
+        anonymizer = build_tiered_agent(create_anonymizer_agent, ANONYMIZATION_MODELS)
+        judge = build_judge(create_judge_agent, create_batch_judge_agent, "ollama", MODEL_OLLAMA_NAME)
+        case_reviewer = build_tiered_agent(create_case_reviewer_agent, REVIEW_MODELS, department_descriptions=department_descriptions)
+        case_review_judge = build_judge(create_case_review_judge_agent, create_batch_case_review_judge_agent, "openai", MODEL_GPT_NAME,
+                                        department_descriptions=department_descriptions)
     except Exception as e:
         logging.error(f"Error al crear los agentes: {e}")
         raise Exception(f"Error al crear los agentes: {e}")
@@ -183,64 +792,145 @@ def main():
 
     
     #2 Seleccionar los casos que no han sido procesados
-    cases_to_process = [
+    # Los casos que quedaron en curso (ejecución interrumpida) o fallidos se vuelven a procesar.
+    # Es un generador: los casos se filtran a medida que se leen del fichero, junto con su posición.
+    # Con `reprocess_stage` solo se seleccionan los casos que fallaron en esa etapa.
+    failed_in_stage = checkpoints.failed_ids(reprocess_stage) if reprocess_stage else None
+    if failed_in_stage is not None:
+        logging.info(f"Reprocesando {len(failed_in_stage)} casos que fallaron en la etapa '{reprocess_stage}'.")
+    pending_cases = enumerate((
         case for case in cases 
-        if case.get('caseID') not in processed_ids
-    ]
+        if not journal.is_done(case.get('caseID'))
+        and (not sharded or shard_of(case.get('caseID'), shard_count) == shard_index)
+        and (failed_in_stage is None or str(case.get('caseID')) in failed_in_stage)
+    ), start=1)
     #Validación si no hay casos para procesar
-    if not cases_to_process:
+    first_case = next(pending_cases, None)
+    if first_case is None:
         logging.info("No hay casos nuevos para procesar.")
+        if agent_metrics is not None:
+            agent_metrics.close()
+        if ollama_pool is not None:
+            ollama_pool.close()
         return
+    pending_cases = chain([first_case], pending_cases)
 
     #3 Procesar los casos
+    agents = (anonymizer, judge, case_reviewer, case_review_judge)
+    verifier = ResidualPIIVerifier(FAST_VERIFICATION_THRESHOLD) if FAST_VERIFICATION else None
+    # Escritor de resultados: cuando un bloque de filas está en disco, sus casos se marcan como hechos en el journal
+    writer = ResultWriter(output_path, output_format=OUTPUT_FORMAT, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS,
+                          on_flush=lambda rows: journal.mark_done_batch(row["caseID"] for row in rows))
     try:
-        for i, case_to_process in enumerate(cases_to_process):
-            logging.info(f"\n--- Procesando caso {i+1}/{len(cases_to_process)} (ID: {case_to_process.get('caseID')}) ---")
-            #Extraer el texto a procesar y el ID del caso
-            text_to_process = case_to_process.get('report')
-            case_id = case_to_process.get('caseID')
-
-            #Validación de que existe el texto a procesar y el ID del caso
-            if not text_to_process or not case_id:
-                logging.warning(f"Saltando caso {i+1} por falta de 'report' o 'caseID'.")
-                continue
-
-            # --- Ejecución del proceso completo para un caso ---
-            texto_anonimizado_resultado = run_anonymization_process(text_to_process, anonymizer, judge)
-
-            if texto_anonimizado_resultado:
-                final_case_status = run_case_review_process(texto_anonimizado_resultado, case_reviewer, case_review_judge)
-
-                if final_case_status:
-                    #6. Formateo de la salida desde la clase Pydantic a JSON
-                    json_output_final = json.loads(final_case_status.model_dump_json())
-
-                    #7. Añadir el ID del caso al JSON
-                    json_output_final["caseID"] = case_id
-
-                    #Logs de la salida final para trazabilidad
-                    logging.info("\n--- Proceso completado para el caso ---")
-                    logging.info("\n--- Salida JSON Final ---")
-                    logging.info(json.dumps(json_output_final, indent=2, ensure_ascii=False))
-                    
-                    #8. Guardar el resultado del caso en un archivo CSV. Se guarda como una lista porque cada posicion de la lista es una fila del csv.
-                    save_to_csv([json_output_final], FILE_OUTPUT)
-
-                else:
-                    logging.error(f"Error en la fase de revisión para el caso ID: {case_id}.")
-
-            else:
-                logging.error(f"Error en la fase de anonimización para el caso ID: {case_id}.")
-
+        if PIPELINE_MODE:
+            logging.info(f"Procesando casos en modo pipeline (fase 1: {ANONYMIZATION_WORKERS} trabajadores, "
+                         f"fase 2: {REVIEW_WORKERS} trabajadores, cola de {PIPELINE_QUEUE_SIZE}).")
+            # En el pipeline las fases se ejecutan en hilos distintos: el tiempo máximo del caso se fija al empezar
+            # la fase 1 y la fase 2 continúa con el mismo instante límite, contando también la espera en la cola
+            deadlines = {}
+
+            def anonymize_stage(item):
+                with case_time_limit(CASE_TIMEOUT_SECONDS):
+                    deadlines[item[0]] = case_deadline.get()
+                    anonymized_text = anonymize_case(item[1], item[0], anonymizer, judge, journal, checkpoints, verifier, timeout_stats)
+                if anonymized_text is None:
+                    deadlines.pop(item[0], None)
+                return anonymized_text
 
+            def review_stage(item, text):
+                with case_time_limit(CASE_TIMEOUT_SECONDS, deadline=deadlines.pop(item[0], None)):
+                    return review_case(item[1], text, case_reviewer, case_review_judge, journal, checkpoints, timeout_stats)
+
+            pipeline_stats = run_pipeline(
+                pending_cases,
+                anonymize=anonymize_stage,
+                review=review_stage,
+                on_result=writer.write,
+                anonymization_workers=ANONYMIZATION_WORKERS,
+                review_workers=REVIEW_WORKERS,
+                queue_size=PIPELINE_QUEUE_SIZE,
+            )
+            current_case_id.set("-")
+            logging.info(f"Métricas del pipeline:\n{json.dumps(pipeline_stats, indent=2, ensure_ascii=False)}")
+        elif MAX_CONCURRENT_CASES <= 1:
+            for position, case_to_process in pending_cases:
+                json_output_final = process_case(case_to_process, position, *agents, journal, checkpoints, verifier, timeout_stats)
+                if json_output_final:
+                    #8. Guardar el resultado del caso en el fichero de salida.
+                    writer.write(json_output_final)
+        else:
+            logging.info(f"Procesando casos con {MAX_CONCURRENT_CASES} casos en paralelo "
+                         f"(Ollama: {MAX_CONCURRENT_OLLAMA}, OpenAI: {MAX_CONCURRENT_OPENAI} llamadas simultáneas).")
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CASES, thread_name_prefix="caso") as executor:
+                def collect(futures):
+                    for future in futures:
+                        json_output_final = future.result()
+                        if json_output_final:
+                            #8. Guardar el resultado del caso en el fichero de salida.
+                            writer.write(json_output_final)
+
+                in_flight = set()
+                try:
+                    for position, case_to_process in pending_cases:
+                        in_flight.add(executor.submit(process_case, case_to_process, position, *agents, journal, checkpoints, verifier, timeout_stats))
+                        # Se limita el número de casos en vuelo para no leer más del fichero de entrada de lo necesario
+                        if len(in_flight) >= 2 * MAX_CONCURRENT_CASES:
+                            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            collect(done)
+                    collect(as_completed(in_flight))
+                except Exception:
+                    # Si un caso falla se cancelan los casos que aún no han empezado, igual que en modo secuencial
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+
+        writer.close()
+        current_case_id.set("-")
+        logging.info(f"Filas escritas en {output_path}: {writer.rows_written}")
+        if agent_cache is not None:
+            logging.info(f"Caché de agentes: {agent_cache.stats()}")
+        if verifier is not None:
+            logging.info(f"Verificación rápida de la anonimización: {verifier.stats()}")
+        logging.info(f"Política de modelos de la anonimización: {anonymizer.stats()}")
+        logging.info(f"Política de modelos de la revisión: {case_reviewer.stats()}")
+        for batched_judge in batched_judges:
+            logging.info(f"Juez por lotes {batched_judge.name}: {batched_judge.stats()}")
+        logging.info(f"Tiempos máximos agotados: {timeout_stats.stats()}")
+        if ollama_pool is not None:
+            logging.info(f"Pool de Ollama: {ollama_pool.stats()}")
+        logging.info(f"Límite de OpenAI: {openai_concurrency.throttles} respuestas 429/timeout, "
+                     f"límite final de {int(openai_concurrency.limit)} llamadas simultáneas.")
+        if agent_metrics is not None:
+            logging.info(f"Resumen de métricas de los agentes:\n{json.dumps(agent_metrics.write_summary(), indent=2, ensure_ascii=False)}")
         logging.info(f"\n{'='*50} FIN DEL PROCESO - {datetime.now()} {'='*50}\n")
         return None
     
     except Exception as e:
         logging.error(f"Error en el flujo principal: {e}")
         raise Exception(f"Error en el flujo principal: {e}")
+    finally:
+        # Se escriben las filas pendientes también si la ejecución se interrumpe por un error
+        writer.close()
+        if agent_metrics is not None:
+            agent_metrics.close()
+        if ollama_pool is not None:
+            ollama_pool.close()
 
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Pipeline de anonimización y revisión de casos de soporte.")
+    parser.add_argument("--reprocesar-fallidos", choices=STAGES, metavar="ETAPA",
+                        help=f"Procesa solo los casos que fallaron en la etapa indicada ({', '.join(STAGES)}).")
+    parser.add_argument("--particion", type=int, default=0, metavar="INDICE",
+                        help="Partición de los casos que procesa esta ejecución (de 0 a --particiones - 1).")
+    parser.add_argument("--particiones", type=int, default=1, metavar="N",
+                        help="Número de particiones en que se reparten los casos por caseID (por defecto 1).")
+    parser.add_argument("--combinar", action="store_true",
+                        help="Combina las salidas de todas las particiones en la salida canónica, sin duplicados, y termina.")
+    args = parser.parse_args()
+    if args.combinar:
+        configure_logging()
+        merged_path = FILE_OUTPUT_PARQUET if OUTPUT_FORMAT == "parquet" else FILE_OUTPUT
+        logging.info(f"Filas añadidas a {merged_path}: {merge_shards(merged_path, FILE_JOURNAL, OUTPUT_FORMAT)}")
+    else:
+        main(reprocess_stage=args.reprocesar_fallidos, shard_index=args.particion, shard_count=args.particiones)
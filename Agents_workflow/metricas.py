@@ -0,0 +1,202 @@
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from concurrencia import AgentCallTimeout, CaseDeadlineExceeded, current_case_id
+
+# Errores que cuentan como timeouts en el resumen (el campo 'error' de cada registro empieza por el tipo)
+TIMEOUT_ERRORS = (AgentCallTimeout.__name__, CaseDeadlineExceeded.__name__)
+
+# Número de intento (empezando en 1) del bucle de reintentos en curso en el hilo actual
+current_attempt: ContextVar[int] = ContextVar("current_attempt", default=0)
+
+# Latencias que se guardan por agente para los percentiles; a partir de ahí se guarda una muestra uniforme
+LATENCY_RESERVOIR_SIZE = 10_000
+# Casos recientes de los que se guarda el último intento; los más antiguos se dan por terminados
+OPEN_CASES_PER_AGENT = 4_096
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Percentil `p` (0-100) por rango más cercano de una lista ya ordenada."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def _sum_metric(metrics: dict | None, name: str) -> int | None:
+    # agno guarda las métricas de la ejecución como listas (una entrada por llamada al modelo)
+    if not metrics or name not in metrics:
+        return None
+    value = metrics[name]
+    return sum(value) if isinstance(value, list) else value
+
+
+class _AgentAggregate:
+    """
+    Acumulados de las llamadas de un agente para el resumen, con memoria acotada.
+
+    Las latencias se guardan en una muestra uniforme (reservoir sampling) de `LATENCY_RESERVOIR_SIZE`
+    valores, así los percentiles son exactos hasta ese número de llamadas y aproximados a partir de ahí.
+    El último intento de cada caso se guarda solo para los `OPEN_CASES_PER_AGENT` casos más recientes.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cache_hits = 0
+        self.ms_total = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.verdicts = 0
+        self.rejections = 0
+        self.latencies = []
+        self.closed_cases = 0
+        self.closed_attempts = 0
+        self.open_cases = OrderedDict()
+        self._random = random.Random(0)
+
+    def add(self, record: dict):
+        self.calls += 1
+        error = record.get("error")
+        if error:
+            self.errors += 1
+            if str(error).startswith(TIMEOUT_ERRORS):
+                self.timeouts += 1
+        if record.get("cache"):
+            self.cache_hits += 1
+        self.ms_total += record["ms"]
+        self.input_tokens += record.get("tokens_entrada") or 0
+        self.output_tokens += record.get("tokens_salida") or 0
+        if record.get("veredicto") is not None:
+            self.verdicts += 1
+            self.rejections += record["veredicto"] is False
+
+        if len(self.latencies) < LATENCY_RESERVOIR_SIZE:
+            self.latencies.append(record["ms"])
+        else:
+            slot = self._random.randrange(self.calls)
+            if slot < LATENCY_RESERVOIR_SIZE:
+                self.latencies[slot] = record["ms"]
+
+        case = record["caso"]
+        self.open_cases[case] = max(self.open_cases.pop(case, 0), record["intento"] or 1)
+        if len(self.open_cases) > OPEN_CASES_PER_AGENT:
+            _, attempts = self.open_cases.popitem(last=False)
+            self.closed_cases += 1
+            self.closed_attempts += attempts
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        cases = self.closed_cases + len(self.open_cases)
+        attempts = self.closed_attempts + sum(self.open_cases.values())
+        summary = {
+            "llamadas": self.calls,
+            "errores": self.errors,
+            "timeouts": self.timeouts,
+            "aciertos_cache": self.cache_hits,
+            "ms_p50": round(percentile(latencies, 50), 1),
+            "ms_p95": round(percentile(latencies, 95), 1),
+            "ms_p99": round(percentile(latencies, 99), 1),
+            "ms_total": round(self.ms_total, 1),
+            "tokens_entrada": self.input_tokens,
+            "tokens_salida": self.output_tokens,
+            "intentos_medios_por_caso": round(attempts / cases, 2),
+        }
+        if self.verdicts:
+            summary["tasa_rechazo"] = round(self.rejections / self.verdicts, 3)
+        return summary
+
+
+class AgentMetrics:
+    """
+    Registro estructurado de las llamadas a los agentes.
+
+    Cada llamada se escribe como una línea JSON en `path` (agente, caso, intento, tiempo, tokens y veredicto
+    del juez), que es el registro completo, y en memoria solo se guardan acumulados por agente para el resumen
+    del final de la ejecución. Es seguro para varios hilos.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._aggregates = {}
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def record(self, record: dict):
+        """Añade el registro de una llamada al fichero JSONL y a los acumulados del resumen."""
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            aggregate = self._aggregates.get(record["agente"])
+            if aggregate is None:
+                aggregate = self._aggregates[record["agente"]] = _AgentAggregate()
+            aggregate.add(record)
+
+    def summary(self) -> dict:
+        """
+        Calcula el resumen de la ejecución: latencias p50/p95/p99, timeouts y tokens por agente, intentos medios
+        por caso de cada agente y tasa de rechazo de cada juez. Los percentiles son aproximados a partir de
+        `LATENCY_RESERVOIR_SIZE` llamadas de un agente; los valores exactos se pueden recalcular desde el JSONL.
+        """
+        with self._lock:
+            return {agent_name: aggregate.summary() for agent_name, aggregate in self._aggregates.items()}
+
+    def write_summary(self) -> dict:
+        """Añade el resumen al fichero JSONL como un registro de tipo 'resumen' y lo devuelve."""
+        summary = self.summary()
+        with self._lock:
+            self._file.write(json.dumps({"tipo": "resumen", "fecha": datetime.now().isoformat(), "agentes": summary},
+                                        ensure_ascii=False) + "\n")
+        return summary
+
+    def close(self):
+        """Cierra el fichero de métricas."""
+        with self._lock:
+            self._file.close()
+
+
+class InstrumentedAgent:
+    """
+    Envoltorio de un agente que registra cada llamada a `run` en un `AgentMetrics`: tiempo de reloj,
+    tokens de entrada y salida (si el modelo los devuelve), caso, número de intento y veredicto del juez.
+    """
+    def __init__(self, agent, metrics: AgentMetrics):
+        self._wrapped = agent
+        self._metrics = metrics
+        self.name = getattr(agent, "name", None) or getattr(agent, "agent").name
+
+    @property
+    def agent(self):
+        """Devuelve el agente de agno que hay debajo del envoltorio."""
+        return getattr(self._wrapped, "agent", self._wrapped)
+
+    def run(self, message: str, **kwargs):
+        """Ejecuta el agente y registra la llamada, también si termina con error."""
+        record = {
+            "tipo": "llamada",
+            "fecha": datetime.now().isoformat(),
+            "agente": self.name,
+            "modelo": getattr(getattr(self.agent, "model", None), "id", None),
+            "caso": current_case_id.get(),
+            "intento": current_attempt.get(),
+        }
+        start = time.perf_counter()
+        try:
+            response = self._wrapped.run(message, **kwargs)
+        except Exception as e:
+            record.update(ms=round((time.perf_counter() - start) * 1000, 1), error=f"{type(e).__name__}: {e}")
+            self._metrics.record(record)
+            raise
+        metrics = getattr(response, "metrics", None) or {}
+        record.update(
+            ms=round((time.perf_counter() - start) * 1000, 1),
+            tokens_entrada=_sum_metric(metrics, "input_tokens"),
+            tokens_salida=_sum_metric(metrics, "output_tokens"),
+            cache=bool(metrics.get("cache_hit")),
+            veredicto=getattr(response.content, "is_correct", None),
+        )
+        self._metrics.record(record)
+        return response
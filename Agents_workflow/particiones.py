@@ -0,0 +1,88 @@
+import csv
+import glob
+import hashlib
+import logging
+import os
+from escritor import ResultWriter
+from journal import CaseJournal, read_done_ids
+
+
+def shard_of(case_id, shard_count: int) -> int:
+    """
+    Devuelve la partición (de 0 a `shard_count` - 1) que corresponde al caso.
+
+    Se usa un hash estable del caseID (y no `hash()`, que cambia en cada proceso) para que todas las
+    máquinas y ejecuciones repartan los casos igual.
+    """
+    digest = hashlib.sha1(str(case_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def shard_path(path: str, shard_index: int, shard_count: int) -> str:
+    """Ruta de un fichero de salida o journal de una partición, por ejemplo `processed_cases.shard-1-of-4.csv`."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard_index}-of-{shard_count}{ext}"
+
+
+def shard_files(path: str) -> list[str]:
+    """Devuelve los ficheros de todas las particiones de `path`, con cualquier número de particiones."""
+    root, ext = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(root)}.shard-*-of-*{glob.escape(ext)}"))
+
+
+def done_ids_from_all_journals(journal_path: str) -> set:
+    """Casos hechos según el journal canónico y los journals de todas las particiones, con cualquier reparto."""
+    done = set()
+    for path in [journal_path] + shard_files(journal_path):
+        done |= read_done_ids(path)
+    return done
+
+
+def _read_rows(path: str, output_format: str):
+    if output_format == "parquet":
+        import pyarrow.parquet as pq
+
+        if os.path.isdir(path) and os.listdir(path):
+            yield from pq.read_table(path).to_pylist()
+        return
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+
+
+def merge_shards(output_path: str, journal_path: str, output_format: str = "csv") -> int:
+    """
+    Combina las salidas de todas las particiones en la salida canónica, sin duplicados.
+
+    Se añaden a `output_path` las filas de las particiones cuyo caseID aún no está en la salida canónica
+    (si un caso aparece en varias particiones se queda la primera fila), y se marcan como hechos en el journal
+    canónico. Los ficheros de las particiones no se borran, así que combinar dos veces no duplica filas.
+
+    Args:
+        output_path (str): Salida canónica (CSV o directorio Parquet).
+        journal_path (str): Journal canónico de casos procesados.
+        output_format (str): "csv" o "parquet".
+
+    Returns:
+        int: El número de filas añadidas a la salida canónica.
+    """
+    seen = {str(row["caseID"]) for row in _read_rows(output_path, output_format)}
+    journal = CaseJournal(journal_path)
+    # Los casos que ya están en la salida canónica deben constar como hechos aunque el journal se haya perdido
+    journal.mark_done_batch(case_id for case_id in seen if not journal.is_done(case_id))
+    writer = ResultWriter(output_path, output_format=output_format, on_flush=lambda rows: journal.mark_done_batch(row["caseID"] for row in rows))
+    try:
+        for path in shard_files(output_path):
+            added = 0
+            for row in _read_rows(path, output_format):
+                case_id = str(row["caseID"])
+                if case_id in seen:
+                    continue
+                seen.add(case_id)
+                writer.write(row)
+                added += 1
+            logging.info(f"Partición {path}: {added} filas nuevas.")
+    finally:
+        writer.close()
+        journal.close()
+    return writer.rows_written
@@ -0,0 +1,216 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+# Marcador que indica a los trabajadores de la fase 2 que no quedan más casos
+_FIN = object()
+
+
+class StageStats:
+    """Contadores de una etapa del pipeline, seguros para varios hilos."""
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, success: bool, seconds: float):
+        """Registra un caso terminado por la etapa."""
+        with self._lock:
+            self.busy_seconds += seconds
+            if success:
+                self.processed += 1
+            else:
+                self.failed += 1
+
+    def summary(self, elapsed: float) -> dict:
+        """Devuelve las métricas de la etapa para un tiempo total de ejecución `elapsed` (segundos)."""
+        total = self.processed + self.failed
+        return {
+            "etapa": self.name,
+            "trabajadores": self.workers,
+            "casos_ok": self.processed,
+            "casos_fallidos": self.failed,
+            "casos_por_minuto": round(60 * total / elapsed, 2) if elapsed > 0 else 0.0,
+            "segundos_medios_por_caso": round(self.busy_seconds / total, 2) if total else 0.0,
+            "ocupacion": round(self.busy_seconds / (elapsed * self.workers), 2) if elapsed > 0 else 0.0,
+        }
+
+
+class QueueStats:
+    """Profundidad de la cola entre etapas y tiempo que la fase 1 pasa bloqueada por contrapresión."""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.max_depth = 0
+        self.samples = 0
+        self.depth_sum = 0
+        self.blocked_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def sample(self, depth: int):
+        """Registra la profundidad de la cola en el momento de añadir un elemento."""
+        with self._lock:
+            self.samples += 1
+            self.depth_sum += depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def add_blocked(self, seconds: float):
+        """Suma el tiempo que un trabajador de la fase 1 ha esperado con la cola llena."""
+        with self._lock:
+            self.blocked_seconds += seconds
+
+    def summary(self) -> dict:
+        """Devuelve las métricas de la cola."""
+        return {
+            "capacidad": self.maxsize,
+            "profundidad_maxima": self.max_depth,
+            "profundidad_media": round(self.depth_sum / self.samples, 2) if self.samples else 0.0,
+            "segundos_bloqueado_fase_1": round(self.blocked_seconds, 2),
+        }
+
+
+def run_pipeline(cases: Iterable,
+                 anonymize: Callable[[Any], str | None],
+                 review: Callable[[Any, str], dict | None],
+                 on_result: Callable[[dict], None],
+                 anonymization_workers: int,
+                 review_workers: int,
+                 queue_size: int) -> dict:
+    """
+    Ejecuta las dos fases del workflow como un pipeline, de forma que la anonimización (Ollama)
+    y la revisión (OpenAI) de casos distintos se solapan en el tiempo.
+
+    Los trabajadores de la fase 1 toman casos de `cases` y dejan los textos anonimizados en una cola acotada
+    de tamaño `queue_size`; los trabajadores de la fase 2 la vacían. Si la cola está llena la fase 1 espera
+    (contrapresión), así el anonimizador no se adelanta demasiado a la revisión.
+
+    Args:
+        cases (Iterable): Casos a procesar. Se consumen de forma incremental y cada elemento se pasa tal cual a `anonymize` y `review`.
+        anonymize (Callable): Recibe un caso y devuelve el texto anonimizado, o None si falla.
+        review (Callable): Recibe el caso y su texto anonimizado y devuelve la fila de salida, o None si falla.
+        on_result (Callable): Se llama desde el hilo que ejecuta `run_pipeline` con cada fila de salida.
+        anonymization_workers (int): Número de trabajadores de la fase 1.
+        review_workers (int): Número de trabajadores de la fase 2.
+        queue_size (int): Número máximo de textos anonimizados pendientes de revisión.
+
+    Returns:
+        dict: Métricas de la ejecución: rendimiento de cada etapa y profundidad de la cola.
+
+    Raises:
+        Exception: La primera excepción lanzada por cualquiera de las etapas, tras detener el pipeline.
+    """
+    cases_iter = iter(cases)
+    cases_lock = threading.Lock()
+    anonymized_queue = queue.Queue(maxsize=queue_size)
+    results_queue = queue.Queue()
+    stop = threading.Event()
+    errors = []
+    anonymization_stats = StageStats("anonimizacion", anonymization_workers)
+    review_stats = StageStats("revision", review_workers)
+    queue_stats = QueueStats(queue_size)
+
+    def next_case():
+        with cases_lock:
+            return next(cases_iter, None)
+
+    def fail(e: Exception):
+        errors.append(e)
+        stop.set()
+
+    def anonymization_worker():
+        try:
+            while not stop.is_set():
+                case = next_case()
+                if case is None:
+                    return
+                start = time.perf_counter()
+                anonymized_text = anonymize(case)
+                anonymization_stats.record(anonymized_text is not None, time.perf_counter() - start)
+                if anonymized_text is None:
+                    continue
+                # Espera a que haya hueco en la cola, sin bloquearse si el pipeline se detiene
+                wait_start = time.perf_counter()
+                while not stop.is_set():
+                    try:
+                        anonymized_queue.put((case, anonymized_text), timeout=0.5)
+                        queue_stats.sample(anonymized_queue.qsize())
+                        break
+                    except queue.Full:
+                        continue
+                queue_stats.add_blocked(time.perf_counter() - wait_start)
+        except Exception as e:
+            fail(e)
+
+    def review_worker():
+        try:
+            while not stop.is_set():
+                try:
+                    item = anonymized_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is _FIN:
+                    return
+                case, anonymized_text = item
+                start = time.perf_counter()
+                row = review(case, anonymized_text)
+                review_stats.record(row is not None, time.perf_counter() - start)
+                if row is not None:
+                    results_queue.put(row)
+        except Exception as e:
+            fail(e)
+        finally:
+            results_queue.put(_FIN)
+
+    def close_anonymization():
+        # Cuando terminan todos los trabajadores de la fase 1 se avisa a cada trabajador de la fase 2
+        for thread in anonymization_threads:
+            thread.join()
+        for _ in range(review_workers):
+            while not stop.is_set():
+                try:
+                    anonymized_queue.put(_FIN, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    started = time.perf_counter()
+    anonymization_threads = [threading.Thread(target=anonymization_worker, name=f"anonimizacion-{i}", daemon=True)
+                             for i in range(anonymization_workers)]
+    review_threads = [threading.Thread(target=review_worker, name=f"revision-{i}", daemon=True)
+                      for i in range(review_workers)]
+    for thread in anonymization_threads + review_threads:
+        thread.start()
+    closer = threading.Thread(target=close_anonymization, name="cierre-fase-1", daemon=True)
+    closer.start()
+
+    # El hilo que llama consume los resultados hasta que terminan todos los trabajadores de la fase 2
+    finished_reviewers = 0
+    while finished_reviewers < review_workers:
+        row = results_queue.get()
+        if row is _FIN:
+            finished_reviewers += 1
+            continue
+        try:
+            on_result(row)
+        except Exception as e:
+            fail(e)
+
+    stop.set()
+    closer.join()
+    for thread in anonymization_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = {
+        "segundos_totales": round(elapsed, 2),
+        "etapas": [anonymization_stats.summary(elapsed), review_stats.summary(elapsed)],
+        "cola": queue_stats.summary(),
+    }
+    if errors:
+        logging.error(f"Pipeline detenido por un error: {errors[0]}")
+        raise errors[0]
+    return stats
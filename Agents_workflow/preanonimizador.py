@@ -0,0 +1,114 @@
+import re
+
+# Etiquetas de get_anonymizer_instructions() que se pueden detectar con reglas
+TAG_EMAIL = "[EMAIL]"
+TAG_TELEFONO = "[NÚMERO DE TELÉFONO]"
+TAG_IDENTIFICACION = "[NÚMERO DE IDENTIFICACIÓN]"
+TAG_BANCARIO = "[DATO BANCARIO]"
+
+DNI_LETTERS = "TRWAGMYFPDXBNJZSQVHLCKE"
+
+# --- Expresiones regulares (se compilan una sola vez al importar el módulo) ---
+EMAIL_RE = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[a-zA-Z]{2,}\b")
+# IBAN: código de país, dígitos de control y hasta 30 caracteres, admitiendo grupos separados por espacios.
+# Solo en mayúsculas: sin distinguir mayúsculas, los grupos opcionales se tragarían las palabras que siguen al IBAN.
+IBAN_RE = re.compile(r"\b[A-Z]{2}\d{2}(?:[ ]?[A-Z0-9]{4}){2,7}(?:[ ]?[A-Z0-9]{1,3})?\b")
+IBAN_GROUP_RE = re.compile(r"[ ]?[A-Z0-9]{1,4}")
+# Tarjetas: 13 a 19 dígitos, opcionalmente separados por espacios o guiones
+CARD_RE = re.compile(r"\b\d(?:[ -]?\d){12,18}\b")
+DNI_RE = re.compile(r"\b(\d{8})[ -]?([A-Z])\b", re.IGNORECASE)
+NIE_RE = re.compile(r"\b([XYZ])[ -]?(\d{7})[ -]?([A-Z])\b", re.IGNORECASE)
+# Teléfonos españoles: prefijo opcional (+34 / 0034) y 9 dígitos empezando por 6, 7, 8 o 9, con un separador
+# opcional después de cualquier dígito (móviles 612 345 678 y fijos 91 123 45 67 o 912 34 56 78)
+PHONE_RE = re.compile(r"(?<![\w+])(?:(?:\+|00)34[ .-]?)?[6789](?:[ .-]?\d){8}\b")
+
+
+def is_valid_dni(number: str, letter: str) -> bool:
+    """Comprueba la letra de control de un DNI."""
+    return DNI_LETTERS[int(number) % 23] == letter.upper()
+
+
+def is_valid_nie(prefix: str, number: str, letter: str) -> bool:
+    """Comprueba la letra de control de un NIE (la letra inicial X, Y, Z equivale a 0, 1, 2)."""
+    return is_valid_dni(str("XYZ".index(prefix.upper())) + number, letter)
+
+
+def is_valid_iban(iban: str) -> bool:
+    """Valida un IBAN con el algoritmo mod-97 (ISO 13616)."""
+    iban = iban.replace(" ", "").upper()
+    if len(iban) < 15 or len(iban) > 34:
+        return False
+    rearranged = iban[4:] + iban[:4]
+    digits = "".join(str(int(char, 36)) for char in rearranged)
+    return int(digits) % 97 == 1
+
+
+def valid_iban_prefix(candidate: str) -> str | None:
+    """
+    Devuelve el IBAN válido más largo al principio de `candidate` o None si no hay ninguno.
+
+    La expresión regular puede alargar un IBAN con lo que le sigue (otro número, una sigla en mayúsculas),
+    así que si el candidato completo no pasa el mod-97 se prueba quitando grupos del final.
+    """
+    groups = IBAN_GROUP_RE.findall(candidate[4:])
+    for n in range(len(groups), 1, -1):
+        prefix = candidate[:4] + "".join(groups[:n])
+        if is_valid_iban(prefix):
+            return prefix
+    return None
+
+
+def is_valid_card(number: str) -> bool:
+    """Valida un número de tarjeta con el algoritmo de Luhn."""
+    digits = [int(d) for d in number if d.isdigit()]
+    if not 13 <= len(digits) <= 19:
+        return False
+    checksum = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        checksum += digit
+    return checksum % 10 == 0
+
+
+# Reglas en orden de aplicación: (etiqueta, expresión regular, validador del match o None)
+# El validador devuelve si el match es un dato sensible o, si solo lo es su principio, el texto de ese principio.
+# Los datos bancarios van antes que los teléfonos para que un trozo de un IBAN o una tarjeta no se tome por un teléfono.
+RULES = [
+    (TAG_EMAIL, EMAIL_RE, None),
+    (TAG_BANCARIO, IBAN_RE, lambda m: valid_iban_prefix(m.group(0))),
+    (TAG_BANCARIO, CARD_RE, lambda m: is_valid_card(m.group(0))),
+    (TAG_IDENTIFICACION, NIE_RE, lambda m: is_valid_nie(m.group(1), m.group(2), m.group(3))),
+    (TAG_IDENTIFICACION, DNI_RE, lambda m: is_valid_dni(m.group(1), m.group(2))),
+    (TAG_TELEFONO, PHONE_RE, None),
+]
+
+
+def pre_anonymize(text: str) -> tuple[str, dict]:
+    """
+    Sustituye con reglas deterministas los datos sensibles con un formato fijo (emails, teléfonos,
+    DNI/NIE, IBAN y tarjetas) por las mismas etiquetas que usa el agente anonimizador.
+
+    Los DNI, NIE, IBAN y tarjetas solo se sustituyen si su dígito o letra de control es válido, para no
+    tocar otros números del informe (referencias, importes...). El resto de datos sensibles (nombres,
+    lugares, fechas...) los sigue anonimizando el agente.
+
+    Args:
+        text (str): El texto original.
+
+    Returns:
+        tuple[str, dict]: El texto con las sustituciones y el número de sustituciones por etiqueta.
+    """
+    counts = {}
+    for tag, pattern, validator in RULES:
+        def replace(match, tag=tag, validator=validator):
+            valid = validator(match) if validator is not None else True
+            if not valid:
+                return match.group(0)
+            counts[tag] = counts.get(tag, 0) + 1
+            # Si solo el principio del match es el dato, se conserva el resto
+            return tag + match.group(0)[len(valid):] if isinstance(valid, str) else tag
+        text = pattern.sub(replace, text)
+    return text, counts
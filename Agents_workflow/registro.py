@@ -0,0 +1,141 @@
+import atexit
+import hashlib
+import json
+import logging
+import queue
+import sys
+import zlib
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from concurrencia import CaseIdFilter
+
+# Formas de registrar los textos de los casos (el atributo 'payload' de los registros)
+PAYLOAD_MODES = ("completo", "truncado", "hash", "omitir")
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - [caso %(case_id)s] - %(message)s'
+
+
+def redact_payload(payload, mode: str, max_chars: int = 200) -> str | None:
+    """
+    Devuelve la versión del texto que se puede escribir en el log según `mode`:
+    completo, truncado a `max_chars` caracteres, un hash SHA-256 con su longitud (para poder comparar
+    textos entre registros sin guardarlos) u omitido (None).
+    """
+    if payload is None or mode == "omitir":
+        return None
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    if mode == "completo":
+        return text
+    if mode == "truncado":
+        return text if len(text) <= max_chars else f"{text[:max_chars]}… [{len(text)} caracteres]"
+    return f"sha256:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]} [{len(text)} caracteres]"
+
+
+class PayloadFilter(logging.Filter):
+    """Sustituye el texto adjunto a un registro (`extra={"payload": ...}`) por su versión redactada."""
+    def __init__(self, mode: str = "hash", max_chars: int = 200):
+        super().__init__()
+        if mode not in PAYLOAD_MODES:
+            raise ValueError(f"Modo de registro de textos no soportado: {mode} (opciones: {', '.join(PAYLOAD_MODES)})")
+        self.mode = mode
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # El mismo registro pasa por el fichero y por la consola: solo se redacta la primera vez
+        if hasattr(record, "payload") and not getattr(record, "payload_redacted", False):
+            record.payload = redact_payload(record.payload, self.mode, self.max_chars)
+            record.payload_redacted = True
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Muestreo de los registros por nivel: de cada nivel con una tasa en `rates` (0 a 1) solo se conservan los
+    registros de esa fracción de casos. La decisión depende del caseID, así que el log de un caso muestreado
+    está completo. Los niveles sin tasa y los registros sin caso se conservan siempre.
+    """
+    def __init__(self, rates: dict[int, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno)
+        case_id = getattr(record, "case_id", "-")
+        if rate is None or rate >= 1 or case_id == "-":
+            return True
+        return zlib.crc32(str(case_id).encode("utf-8")) % 1000 < rate * 1000
+
+
+class TextFormatter(logging.Formatter):
+    """Formato de texto de siempre, con el texto adjunto (ya redactado) en las líneas siguientes."""
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        payload = getattr(record, "payload", None)
+        return f"{message}\n{payload}" if payload is not None else message
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea con la fecha, el nivel, el caso, el hilo, el mensaje y el texto adjunto."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "fecha": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "caso": getattr(record, "case_id", "-"),
+            "hilo": record.threadName,
+            "mensaje": record.getMessage().strip(),
+        }
+        if getattr(record, "payload", None) is not None:
+            entry["payload"] = record.payload
+        if record.exc_info:
+            entry["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(filename: str, file_format: str = "json", payload_mode: str = "hash", payload_max_chars: int = 200,
+                  sample_rates: dict[int, float] | None = None, max_bytes: int = 50_000_000, backup_count: int = 5,
+                  level: int = logging.INFO, stream=None) -> QueueListener:
+    """
+    Configura el logging raíz para que no bloquee a los hilos que procesan casos.
+
+    Los registros se meten en una cola (`QueueHandler`) y un hilo aparte (`QueueListener`) los escribe en el
+    fichero, que rota al llegar a `max_bytes` y guarda `backup_count` copias, y en la consola. El caseID y el
+    muestreo se aplican al encolar, en el hilo del caso; la redacción de los textos y el formato, en el hilo
+    del listener. El fichero se escribe en JSONL (`file_format="json"`) o en el formato de texto de siempre;
+    la consola siempre en texto.
+
+    Args:
+        filename (str): Fichero de log.
+        file_format (str): "json" o "texto".
+        payload_mode (str): Cómo se escriben los textos de los casos (ver `PAYLOAD_MODES`).
+        payload_max_chars (int): Longitud máxima de los textos en el modo "truncado".
+        sample_rates (dict[int, float] | None): Fracción de casos que se registran en cada nivel, por ejemplo {logging.INFO: 0.1}.
+        max_bytes (int): Tamaño del fichero a partir del cual rota.
+        backup_count (int): Número de ficheros rotados que se conservan.
+        level (int): Nivel mínimo de los registros.
+        stream: Flujo de la consola (por defecto `sys.stderr`).
+
+    Returns:
+        QueueListener: El listener ya arrancado; se detiene al salir del programa, escribiendo los registros pendientes.
+    """
+    file_handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter() if file_format == "json" else TextFormatter(TEXT_FORMAT))
+    console_handler = logging.StreamHandler(stream or sys.stderr)
+    console_handler.setFormatter(TextFormatter(TEXT_FORMAT))
+    payload_filter = PayloadFilter(payload_mode, payload_max_chars)
+    for handler in (file_handler, console_handler):
+        handler.addFilter(payload_filter)
+
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(CaseIdFilter())
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,263 @@
+"""
+Servidor falso compatible con la API de OpenAI y con la de Ollama para probar el limitador de llamadas
+y el pool de servidores de Ollama sin gastar cuota ni necesitar modelos.
+
+Responde a `POST /v1/chat/completions` con un JSON que cumple el esquema de `response_format` que envía
+el agente (por ejemplo `CaseStatus` o `JudgeDecision`, o una decisión por elemento para los jueces por lotes),
+con una latencia configurable. Devuelve errores 429
+cuando se supera el límite de peticiones por minuto del servidor o, de forma aleatoria, con la
+probabilidad indicada.
+
+También responde como un servidor de Ollama: `POST /api/chat` con un JSON que cumple el esquema de `format`
+(sin errores 429) y `GET /api/tags` con los modelos de `--modelos-ollama`. Con `--paralelas` atiende como
+mucho ese número de peticiones de chat a la vez, como un servidor de Ollama con un solo modelo cargado.
+
+Con `--prob-timeout`, una fracción de las peticiones no se responde hasta pasados `--espera-timeout-s` segundos,
+para provocar timeouts en el cliente. Con `--semilla`, la latencia, los rechazos, los 429 y los timeouts de cada
+petición dependen solo de su contenido y de cuántas veces se ha recibido, así que dos ejecuciones con los
+mismos casos reciben las mismas respuestas aunque las peticiones lleguen en otro orden.
+
+Uso:
+    python servidor_llm_falso.py --puerto 8001 --rpm 60 --prob-429 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=falsa python main.py
+    python servidor_llm_falso.py --puerto 11435 --paralelas 1 & python servidor_llm_falso.py --puerto 11436 --paralelas 1 &
+    OLLAMA_HOSTS=http://127.0.0.1:11435,http://127.0.0.1:11436 python main.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Cabecera de cada elemento en los mensajes de los jueces por lotes (ver juez_por_lotes.py)
+BATCH_ITEM_RE = re.compile(r"^### Elemento (\S+)", re.MULTILINE)
+
+
+# Distribuciones de la latencia simulada, con media `latency_ms`
+LATENCY_DISTRIBUTIONS = ("exponencial", "constante", "lognormal")
+
+
+def example_from_schema(schema: dict, definitions: dict | None = None, reject_probability: float = 0.0, rng: random.Random = random):
+    """Genera un valor que cumple el esquema JSON (objetos, listas, enums y tipos básicos)."""
+    definitions = definitions if definitions is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return example_from_schema(definitions[schema["$ref"].split("/")[-1]], definitions, reject_probability, rng)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            return example_from_schema(schema[key][0], definitions, reject_probability, rng)
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type", "string")
+    if schema_type == "object":
+        return {name: (rng.random() >= reject_probability if name == "is_correct" else
+                       example_from_schema(prop, definitions, reject_probability, rng))
+                for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [example_from_schema(schema.get("items", {}), definitions, reject_probability, rng)]
+    if schema_type == "boolean":
+        return True
+    if schema_type in ("integer", "number"):
+        return 0
+    return "respuesta de prueba"
+
+
+class FakeLLMState:
+    """Configuración y contadores del servidor, compartidos entre los hilos que atienden las peticiones."""
+    def __init__(self, rpm: int, throttle_probability: float, latency_ms: float, reject_probability: float,
+                 ollama_models: list[str] | None = None, parallel: int = 0, latency_distribution: str = "exponencial",
+                 timeout_probability: float = 0.0, hang_seconds: float = 120.0, seed: int | None = None):
+        self.rpm = rpm
+        self.throttle_probability = throttle_probability
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.reject_probability = reject_probability
+        self.timeout_probability = timeout_probability
+        self.hang_seconds = hang_seconds
+        self.seed = seed
+        self.timeouts = 0
+        self._seen = {}
+        self.ollama_models = ollama_models or []
+        # Peticiones de chat que se atienden a la vez (0 = sin límite)
+        self.slots = threading.BoundedSemaphore(parallel) if parallel > 0 else None
+        self.requests = 0
+        self.throttled = 0
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def request_rng(self, messages: list) -> random.Random:
+        """
+        Generador aleatorio de una petición. Con semilla depende solo de los mensajes y de cuántas veces se han
+        recibido, no del orden en que llegan las peticiones de los distintos hilos.
+        """
+        if self.seed is None:
+            return random.Random()
+        key = hashlib.sha1(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        with self._lock:
+            occurrence = self._seen[key] = self._seen.get(key, 0) + 1
+        return random.Random(f"{self.seed}:{key}:{occurrence}")
+
+    def should_throttle(self, rng: random.Random) -> bool:
+        """Registra la petición y decide si se responde con un 429."""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            while self._window and now - self._window[0] > 60:
+                self._window.popleft()
+            throttle = (self.rpm > 0 and len(self._window) >= self.rpm) or rng.random() < self.throttle_probability
+            if throttle:
+                self.throttled += 1
+            else:
+                self._window.append(now)
+            return throttle
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def latency_seconds(self, rng: random.Random) -> float:
+        """Latencia simulada de una respuesta según la distribución configurada."""
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.latency_distribution == "constante":
+            return self.latency_ms / 1000
+        if self.latency_distribution == "lognormal":
+            # sigma = 1 da una cola larga; mu se ajusta para que la media sea latency_ms
+            return rng.lognormvariate(math.log(self.latency_ms) - 0.5, 1.0) / 1000
+        return rng.expovariate(1 / self.latency_ms) / 1000
+
+    def generate(self, schema: dict | None, messages: list, rng: random.Random) -> str:
+        """Simula la latencia del modelo y genera el contenido de la respuesta para el esquema pedido."""
+        if rng.random() < self.timeout_probability:
+            # Petición colgada: se responde cuando el cliente ya ha dejado de esperar
+            with self._lock:
+                self.timeouts += 1
+            time.sleep(self.hang_seconds)
+        if self.slots is not None:
+            self.slots.acquire()
+        try:
+            time.sleep(self.latency_seconds(rng))
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+        content = example_from_schema(schema, reject_probability=self.reject_probability, rng=rng) if schema else "respuesta de prueba"
+        if isinstance(content, dict) and "decisiones" in content:
+            # Juez por lotes: una decisión por cada elemento del mensaje
+            last_message = str((messages or [{}])[-1].get("content", ""))
+            content["decisiones"] = [{"case_id": key, "is_correct": rng.random() >= self.reject_probability}
+                                     for key in BATCH_ITEM_RE.findall(last_message)]
+        return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+def make_handler(state: FakeLLMState):
+    class FakeOpenAIHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: dict, headers: dict | None = None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # El cliente dejó de esperar (timeout) antes de la respuesta
+                pass
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/api/tags"):
+                self._send_json(200, {"models": [{"name": name, "model": name} for name in state.ollama_models]})
+            elif self.path.rstrip("/").endswith("/stats"):
+                self._send_json(200, {"peticiones": state.requests, "respuestas_429": state.throttled, "timeouts": state.timeouts})
+            else:
+                self._send_json(404, {"error": {"message": "Ruta no encontrada"}})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.rstrip("/").endswith("/api/chat"):
+                self._ollama_chat(request)
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "Ruta no encontrada"}})
+                return
+            rng = state.request_rng(request.get("messages"))
+            if state.should_throttle(rng):
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                                headers={"Retry-After": "1"})
+                return
+
+            response_format = request.get("response_format") or {}
+            schema = (response_format.get("json_schema") or {}).get("schema")
+            content = state.generate(schema, request.get("messages"), rng)
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4
+            completion_tokens = len(content) // 4
+            self._send_json(200, {
+                "id": f"chatcmpl-falso-{state.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "falso"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content, "refusal": None}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        def _ollama_chat(self, request: dict):
+            state.count_request()
+            schema = request.get("format") if isinstance(request.get("format"), dict) else None
+            content = state.generate(schema, request.get("messages"), state.request_rng(request.get("messages")))
+            self._send_json(200, {
+                "model": request.get("model", "falso"),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4,
+                "eval_count": len(content) // 4,
+            })
+
+    return FakeOpenAIHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor falso compatible con la API de OpenAI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8001)
+    parser.add_argument("--rpm", type=int, default=60, help="Peticiones por minuto antes de responder 429 (0 = sin límite).")
+    parser.add_argument("--prob-429", type=float, default=0.0, help="Probabilidad de responder 429 a cualquier petición.")
+    parser.add_argument("--latencia-ms", type=float, default=300, help="Latencia media de las respuestas.")
+    parser.add_argument("--distribucion-latencia", choices=LATENCY_DISTRIBUTIONS, default="exponencial", help="Distribución de la latencia.")
+    parser.add_argument("--prob-rechazo", type=float, default=0.0, help="Probabilidad de que un juez devuelva is_correct=false.")
+    parser.add_argument("--modelos-ollama", default="qwen3:4b", help="Modelos que devuelve /api/tags, separados por comas.")
+    parser.add_argument("--paralelas", type=int, default=0, help="Peticiones de chat atendidas a la vez (0 = sin límite).")
+    parser.add_argument("--prob-timeout", type=float, default=0.0, help="Probabilidad de que una petición se quede colgada.")
+    parser.add_argument("--espera-timeout-s", type=float, default=120, help="Segundos que tarda en responder una petición colgada.")
+    parser.add_argument("--semilla", type=int, default=None, help="Semilla para que las respuestas sean reproducibles.")
+    args = parser.parse_args()
+
+    state = FakeLLMState(args.rpm, args.prob_429, args.latencia_ms, args.prob_rechazo,
+                         ollama_models=[name.strip() for name in args.modelos_ollama.split(",") if name.strip()], parallel=args.paralelas,
+                         latency_distribution=args.distribucion_latencia, timeout_probability=args.prob_timeout,
+                         hang_seconds=args.espera_timeout_s, seed=args.semilla)
+    server = ThreadingHTTPServer((args.host, args.puerto), make_handler(state))
+    print(f"Servidor falso de OpenAI y Ollama escuchando en http://{args.host}:{args.puerto}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps({"peticiones": state.requests, "respuestas_429": state.throttled, "timeouts": state.timeouts}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import re
+import threading
+from preanonimizador import RULES
+
+# Palabras que suelen ir en mayúscula en los informes sin ser nombres propios
+COMMON_CAPITALIZED = {
+    "el", "la", "los", "las", "un", "una", "de", "del", "en", "y", "o", "que", "se", "por", "para", "con", "sin",
+    "su", "sus", "al", "lo", "le", "les", "es", "ha", "he", "hay", "no", "si", "sí", "tras", "desde", "según",
+    "cliente", "usuario", "usuaria", "caso", "ticket", "incidencia", "señor", "señora", "sr", "sra", "don", "doña",
+    "dr", "dra", "lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo",
+}
+MONTHS = "enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|setiembre|octubre|noviembre|diciembre"
+
+CAPITALIZED_RE = re.compile(r"\b[A-ZÁÉÍÓÚÑ][a-záéíóúñü]+\b")
+# Signos tras los que empieza una frase (la palabra siguiente va en mayúscula aunque no sea un nombre propio)
+SENTENCE_END_CHARS = ".!?:¿¡\n"
+# Números y códigos: tokens de al menos 4 caracteres con 3 dígitos o más (referencias, PIN, números de cliente...)
+CODE_RE = re.compile(r"\b(?=(?:[\w-]*\d){3})[\w-]{4,}\b")
+DATE_RE = re.compile(rf"\b\d{{1,2}}[/.-]\d{{1,2}}[/.-]\d{{2,4}}\b|\b\d{{1,2}} de (?:{MONTHS})(?: de \d{{4}})?\b|\b(?:{MONTHS}) de \d{{4}}\b",
+                     re.IGNORECASE)
+
+# Multiplicador de la confianza por cada dato dudoso que queda en el texto anonimizado
+SOFT_FINDING_PENALTY = 0.5
+# Si el texto anonimizado es mucho más corto que el original, el modelo puede haber resumido o cortado el texto
+MIN_LENGTH_RATIO = 0.5
+
+
+def _proper_noun_candidates(original: str) -> set:
+    """Palabras en mayúscula del original que no están al principio de una frase ni son palabras comunes."""
+    candidates = set()
+    for match in CAPITALIZED_RE.finditer(original):
+        word = match.group(0)
+        if word.lower() in COMMON_CAPITALIZED:
+            continue
+        before = original[:match.start()].rstrip(" \t\"'«(")
+        if not before or before[-1] in SENTENCE_END_CHARS:
+            continue
+        candidates.add(word)
+    return candidates
+
+
+def scan_residual_pii(original: str, anonymized: str) -> tuple[float, list]:
+    """
+    Busca en el texto anonimizado datos sensibles que hayan quedado sin sustituir.
+
+    -   Datos con formato fijo (emails, teléfonos, DNI/NIE, IBAN y tarjetas), con las mismas reglas y
+        validadores que `preanonimizador.py`. Si aparece alguno, la confianza es 0.
+    -   Palabras en mayúscula del original (posibles nombres, lugares o empresas), números y códigos, y
+        fechas que siguen en el texto anonimizado. Cada uno multiplica la confianza por `SOFT_FINDING_PENALTY`.
+    -   Un texto anonimizado mucho más corto que el original también reduce la confianza.
+
+    Las palabras al principio de una frase no se pueden distinguir de un nombre propio, por lo que un nombre
+    que solo aparece al principio de una frase no se detecta; el umbral se debe elegir con `benchmark_verificador.py`.
+
+    Args:
+        original (str): El texto original.
+        anonymized (str): El texto devuelto por el anonimizador.
+
+    Returns:
+        tuple[float, list]: La confianza (0-1) en que el texto está bien anonimizado y la lista de
+        hallazgos como pares (tipo, texto).
+    """
+    findings = []
+    for tag, pattern, validator in RULES:
+        for match in pattern.finditer(anonymized):
+            valid = validator(match) if validator is not None else True
+            if valid:
+                findings.append((tag, valid if isinstance(valid, str) else match.group(0)))
+    if findings:
+        return 0.0, findings
+
+    anonymized_words = set(CAPITALIZED_RE.findall(anonymized))
+    for word in sorted(_proper_noun_candidates(original) & anonymized_words):
+        findings.append(("posible nombre propio", word))
+    original_codes = set(CODE_RE.findall(original))
+    for code in sorted(original_codes & set(CODE_RE.findall(anonymized))):
+        findings.append(("número o código", code))
+    original_dates = {date.lower() for date in DATE_RE.findall(original)}
+    for date in sorted(original_dates & {date.lower() for date in DATE_RE.findall(anonymized)}):
+        findings.append(("fecha", date))
+
+    if len(anonymized.strip()) < MIN_LENGTH_RATIO * len(original.strip()):
+        findings.append(("texto recortado", f"{len(anonymized.strip())}/{len(original.strip())} caracteres"))
+    return SOFT_FINDING_PENALTY ** len(findings), findings
+
+
+class ResidualPIIVerifier:
+    """
+    Verificación rápida de la anonimización antes del juez.
+
+    Si la confianza de `scan_residual_pii` alcanza `threshold`, el resultado se da por aprobado sin llamar
+    al juez. En otro caso decide el juez. Cuenta las verificaciones y las llamadas al juez evitadas;
+    es seguro para varios hilos.
+    """
+    def __init__(self, threshold: float = 1.0):
+        self.threshold = threshold
+        self.checked = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def approves(self, original: str, anonymized: str) -> tuple[bool, float, list]:
+        """Devuelve si se puede omitir el juez, junto con la confianza y los hallazgos del escaneo."""
+        confidence, findings = scan_residual_pii(original, anonymized)
+        approved = confidence >= self.threshold
+        with self._lock:
+            self.checked += 1
+            if approved:
+                self.skipped += 1
+        return approved, confidence, findings
+
+    def stats(self) -> dict:
+        """Devuelve las verificaciones hechas y la fracción de llamadas al juez evitadas."""
+        with self._lock:
+            return {
+                "verificaciones": self.checked,
+                "juez_omitido": self.skipped,
+                "fraccion_juez_omitido": round(self.skipped / self.checked, 3) if self.checked else 0.0,
+            }
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Normaliza el texto de una consulta para que variantes triviales compartan entrada en la caché:
+    minúsculas y espacios repetidos o en los extremos eliminados.
+    """
+    return re.sub(r"\s+", " ", texto).strip().casefold()
+
+
+class EmbeddingCache:
+    """
+    Caché de embeddings de consultas en dos niveles:
+    - En memoria: LRU con caducidad (TTL), propia de cada proceso.
+    - En disco (opcional): SQLite compartido por todos los workers de gunicorn, con la misma caducidad.
+
+    La clave es el texto normalizado junto con el modelo y la dimensión del embedding, y los vectores
+    se guardan como arrays float32 (4 bytes por dimensión) en lugar de listas de Python. Las peticiones
+    simultáneas con la misma clave esperan al mismo cálculo en lugar de llamar cada una al modelo; el cálculo
+    se ejecuta en una tarea propia, así que si se cancela la petición que lo lanzó las demás siguen esperándolo.
+    """
+    def __init__(self, model_name: str, max_entries: int = 10000, ttl_seconds: float = 86400, disk_path: str | None = None):
+        """
+        Args:
+            model_name: Modelo de embeddings, forma parte de la clave
+            max_entries: Número máximo de embeddings en memoria
+            ttl_seconds: Segundos que un embedding es válido (en memoria y en disco)
+            disk_path: Fichero SQLite del nivel compartido (None para usar solo memoria)
+        """
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.compute_seconds = 0.0
+        self.saved_seconds = 0.0
+        if disk_path:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS embeddings (clave TEXT PRIMARY KEY, vector BLOB, caduca REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Varios workers escriben en el mismo fichero: se espera al bloqueo en vez de fallar
+        return sqlite3.connect(self.disk_path, timeout=30)
+
+    def key(self, texto: str, dimensiones: int) -> str:
+        """Clave de un texto para el modelo de la caché y la dimensión indicada."""
+        return hashlib.sha1(f"{self.model_name}|{dimensiones}|{normalizar_texto(texto)}".encode("utf-8")).hexdigest()
+
+    def _get_memory(self, clave: str) -> np.ndarray | None:
+        with self._lock:
+            entrada = self._memory.get(clave)
+            if entrada is None:
+                return None
+            caduca, vector = entrada
+            if caduca < time.time():
+                del self._memory[clave]
+                return None
+            self._memory.move_to_end(clave)
+            return vector
+
+    def _put_memory(self, clave: str, vector: np.ndarray, caduca: float):
+        with self._lock:
+            self._memory[clave] = (caduca, vector)
+            self._memory.move_to_end(clave)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _get_disk(self, clave: str) -> tuple[np.ndarray, float] | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT vector, caduca FROM embeddings WHERE clave = ?", (clave,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return np.frombuffer(row[0], dtype=np.float32), row[1]
+
+    def _put_disk(self, clave: str, vector: np.ndarray, caduca: float):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO embeddings (clave, vector, caduca) VALUES (?, ?, ?)",
+                         (clave, vector.tobytes(), caduca))
+            conn.execute("DELETE FROM embeddings WHERE caduca < ?", (time.time(),))
+
+    async def get_or_compute(self, texto: str, dimensiones: int, calcular) -> np.ndarray:
+        """
+        Devuelve el embedding del texto desde la caché o, si no está, lo calcula con `calcular` y lo guarda.
+
+        Args:
+            texto: Texto de la consulta
+            dimensiones: Dimensión del embedding
+            calcular: Función asíncrona sin argumentos que devuelve el embedding como lista de floats
+
+        Returns:
+            np.ndarray: Embedding como array float32 (de solo lectura, compartido entre peticiones)
+        """
+        clave = self.key(texto, dimensiones)
+        vector = self._get_memory(clave)
+        if vector is not None:
+            self.memory_hits += 1
+            self._add_saved()
+            return vector
+        tarea = self._pending.get(clave)
+        if tarea is not None:
+            vector = await asyncio.shield(tarea)
+            self.shared_hits += 1
+            self._add_saved()
+            return vector
+
+        # El cálculo no depende de la petición que lo lanza: si esta se cancela, la tarea sigue para las demás
+        tarea = asyncio.create_task(self._load_or_compute(clave, calcular))
+        self._pending[clave] = tarea
+        tarea.add_done_callback(lambda t: self._calculo_terminado(clave, t))
+        return await asyncio.shield(tarea)
+
+    def _calculo_terminado(self, clave: str, tarea: asyncio.Task):
+        if self._pending.get(clave) is tarea:
+            del self._pending[clave]
+        # Se marca el error como recuperado para que no se avise si ya nadie esperaba el cálculo
+        if not tarea.cancelled():
+            tarea.exception()
+
+    async def _load_or_compute(self, clave: str, calcular) -> np.ndarray:
+        """Busca el embedding en disco o lo calcula, y lo guarda en los dos niveles."""
+        if self.disk_path:
+            try:
+                encontrado = await asyncio.to_thread(self._get_disk, clave)
+            except sqlite3.Error as e:
+                logger.error(f"Error al leer la caché de embeddings en disco: {e}")
+                encontrado = None
+            if encontrado is not None:
+                vector, caduca = encontrado
+                self.disk_hits += 1
+                self._add_saved()
+                self._put_memory(clave, vector, caduca)
+                return vector
+
+        inicio = time.perf_counter()
+        vector = np.asarray(await calcular(), dtype=np.float32)
+        self.compute_seconds += time.perf_counter() - inicio
+        self.misses += 1
+        vector.setflags(write=False)
+        caduca = time.time() + self.ttl_seconds
+        self._put_memory(clave, vector, caduca)
+        if self.disk_path:
+            try:
+                await asyncio.to_thread(self._put_disk, clave, vector, caduca)
+            except sqlite3.Error as e:
+                logger.error(f"Error al escribir la caché de embeddings en disco: {e}")
+        return vector
+
+    def _add_saved(self):
+        # Cada acierto ahorra el tiempo medio de cálculo conocido en ese momento; el total solo puede crecer
+        if self.misses:
+            self.saved_seconds += self.compute_seconds / self.misses
+
+    def stats(self) -> dict:
+        """
+        Métricas de la caché. El tiempo ahorrado se acumula en cada acierto con el tiempo medio de calcular
+        un embedding en los fallos hasta ese momento, así que nunca disminuye.
+        """
+        aciertos = self.memory_hits + self.disk_hits + self.shared_hits
+        consultas = aciertos + self.misses
+        ms_por_calculo = self.compute_seconds / self.misses * 1000 if self.misses else 0.0
+        return {
+            "entradas_memoria": len(self._memory),
+            "aciertos_memoria": self.memory_hits,
+            "aciertos_disco": self.disk_hits,
+            "aciertos_calculo_en_curso": self.shared_hits,
+            "fallos": self.misses,
+            "tasa_aciertos": round(aciertos / consultas, 3) if consultas else 0.0,
+            "ms_medio_calculo": round(ms_por_calculo, 1),
+            "ms_ahorrados": round(self.saved_seconds * 1000, 1),
+        }
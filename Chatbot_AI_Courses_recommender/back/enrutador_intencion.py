@@ -0,0 +1,205 @@
+import json
+import logging
+import re
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BUSQUEDA_GENERAL = "busqueda general"
+BUSQUEDA_CURSOS = "busqueda de cursos"
+
+# Palabras sin contenido que se quitan al generar las keywords localmente (artículos, preposiciones,
+# pronombres y fórmulas de petición). Los interrogativos se conservan porque distinguen las preguntas generales.
+PALABRAS_VACIAS = {
+    "a", "al", "algo", "alguien", "algun", "algún", "alguna", "algunas", "alguno", "algunos", "ante", "bien", "busco",
+    "buscando", "con", "de", "del", "desde", "dame", "decirme", "dime", "el", "en", "entre", "es", "está",
+    "estoy", "favor", "gracias", "gustaria", "gustaría", "hacia", "hay", "la", "las", "le", "lo", "los", "me", "mi",
+    "mis", "muy", "necesito", "o", "os", "para", "podrias", "podrías", "por", "puedes", "quiero", "quisiera", "se",
+    "ser", "si", "sin", "sobre", "son", "soy", "su", "sus", "te", "tendrias", "tendrías", "tenéis", "teneis", "tienes",
+    "tu", "un", "una", "unas", "uno", "unos", "y", "ya", "yo",
+}
+
+# Palabras que indican que el mensaje continúa la conversación anterior ("Pero que sea de nivel avanzado",
+# "¿Cuántas empresas tiene?"): estos mensajes solo se entienden con el contexto y se envían a Gemini
+INICIOS_SEGUIMIENTO = {"pero", "y", "también", "tambien", "entonces", "vale", "ok", "además", "ademas", "mejor", "no"}
+REFERENCIAS_CONTEXTO = {
+    "ese", "esa", "eso", "esos", "esas", "este", "esta", "esto", "estos", "estas", "aquel", "aquella", "aquello",
+    "él", "ella", "ellos", "ellas", "anterior", "anteriores", "mismo", "misma", "mismos", "mismas",
+    "otro", "otra", "otros", "otras", "tiene", "tienen",
+}
+
+
+def palabras(texto: str) -> list:
+    """Palabras de un texto en minúsculas, sin signos de puntuación."""
+    return re.findall(r"\w+", texto.casefold())
+
+
+def keywords_locales(mensaje: str) -> str:
+    """
+    Genera las keywords de un mensaje sin llamar a Gemini: las palabras del mensaje sin las palabras vacías.
+    """
+    return " ".join(p for p in palabras(mensaje) if p not in PALABRAS_VACIAS)
+
+
+def depende_del_contexto(mensaje: str, contexto: list) -> bool:
+    """
+    Indica si el mensaje parece continuar la conversación anterior: hay algún mensaje previo del usuario y el
+    nuevo empieza como una continuación, hace referencia a algo ya dicho o tiene menos de dos palabras con contenido.
+    """
+    if not any(isinstance(m, dict) and m.get("role") == "user" for m in contexto or []):
+        return False
+    lista = palabras(mensaje)
+    if not lista:
+        return True
+    return (lista[0] in INICIOS_SEGUIMIENTO
+            or any(p in REFERENCIAS_CONTEXTO for p in lista)
+            or len([p for p in lista if p not in PALABRAS_VACIAS]) < 2)
+
+
+def cargar_consultas(ruta: str) -> list:
+    """
+    Carga las consultas etiquetadas: una lista de objetos con `consulta`, `busqueda` ("busqueda general" o
+    "busqueda de cursos") y, opcionalmente, `contexto` (conversación previa, en el formato de /chat).
+    """
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def normalizar(vectores) -> np.ndarray:
+    """Normaliza las filas de una matriz (o un vector) para que el producto escalar sea la similitud coseno."""
+    vectores = np.asarray(vectores, dtype=np.float32)
+    normas = np.linalg.norm(vectores, axis=-1, keepdims=True)
+    return vectores / np.where(normas == 0, 1, normas)
+
+
+class EnrutadorIntencion:
+    """
+    Clasificador local del tipo de búsqueda para evitar la llamada a Gemini de `search_keywords` en los casos claros.
+
+    Cada tipo de búsqueda se representa por el centroide de los embeddings de las keywords de sus consultas
+    etiquetadas. Un mensaje se clasifica localmente si la diferencia entre su similitud con el centroide de cursos
+    y con el de búsqueda general supera `margen`. Además, un mensaje no se responde como búsqueda general si se
+    parece a algún curso del catálogo tanto como las consultas de cursos etiquetadas (percentil
+    `percentil_catalogo` de su similitud máxima con el catálogo); el umbral se recalcula con
+    `actualizar_catalogo` cada vez que se recarga el índice de cursos. Los mensajes ambiguos y los que
+    dependen de la conversación anterior se dejan a Gemini.
+
+    El embedding se calcula sobre las keywords locales, que son las mismas que se usan después en la búsqueda
+    vectorial, así que con la caché de embeddings la búsqueda no vuelve a llamar a VertexAI.
+    """
+    def __init__(self, margen: float = 0.05, percentil_catalogo: float = 10):
+        """
+        Args:
+            margen: Diferencia mínima de similitud entre los dos centroides para decidir sin Gemini
+            percentil_catalogo: Percentil de la similitud con el catálogo de las consultas de cursos que fija
+                el umbral a partir del cual no se decide localmente una búsqueda general
+        """
+        self.margen = margen
+        self.percentil_catalogo = percentil_catalogo
+        self.centroides = {}
+        self.umbral_catalogo = None
+        self.ready = False
+        self._vectores_cursos = np.empty((0, 0), dtype=np.float32)
+
+    def ajustar(self, vectores, etiquetas: list, similitudes_catalogo: list | None = None):
+        """
+        Calcula los centroides y el umbral del catálogo a partir de consultas etiquetadas.
+
+        Args:
+            vectores: Embeddings de las keywords de las consultas
+            etiquetas: Tipo de búsqueda de cada consulta
+            similitudes_catalogo: Similitud máxima de cada consulta con el catálogo (None si no hay catálogo)
+        """
+        vectores = normalizar(vectores)
+        etiquetas = np.array(etiquetas)
+        for tipo in (BUSQUEDA_CURSOS, BUSQUEDA_GENERAL):
+            if not (etiquetas == tipo).any():
+                raise ValueError(f"No hay consultas etiquetadas como '{tipo}'")
+        self.centroides = {tipo: normalizar(vectores[etiquetas == tipo].mean(axis=0)) for tipo in (BUSQUEDA_CURSOS, BUSQUEDA_GENERAL)}
+        self._vectores_cursos = vectores[etiquetas == BUSQUEDA_CURSOS]
+        self.umbral_catalogo = None
+        if similitudes_catalogo is not None:
+            similitudes = np.asarray(similitudes_catalogo, dtype=np.float32)[etiquetas == BUSQUEDA_CURSOS]
+            self.umbral_catalogo = float(np.percentile(similitudes, self.percentil_catalogo))
+        self.ready = True
+
+    async def preparar(self, consultas: list, calcular_embeddings, course_index=None):
+        """
+        Ajusta el enrutador con las consultas etiquetadas que no dependen de una conversación previa.
+
+        Args:
+            consultas: Consultas etiquetadas (ver `cargar_consultas`)
+            calcular_embeddings: Función asíncrona que recibe una lista de textos y devuelve sus embeddings
+            course_index: Índice local de cursos (CourseIndex) para el umbral del catálogo; None para no usarlo
+        """
+        consultas = [c for c in consultas if not c.get("contexto")]
+        vectores = await calcular_embeddings([keywords_locales(c["consulta"]) for c in consultas])
+        self.ajustar(vectores, [c["busqueda"] for c in consultas])
+        self.actualizar_catalogo(course_index)
+        logger.info(f"Enrutador de intención ajustado con {len(consultas)} consultas (umbral del catálogo: {self.umbral_catalogo})")
+
+    def actualizar_catalogo(self, course_index=None):
+        """
+        Recalcula el umbral del catálogo con el índice de cursos actual. Se llama al ajustar el enrutador y
+        cada vez que se recarga el índice, para que el umbral siga al catálogo publicado.
+
+        Args:
+            course_index: Índice local de cursos (CourseIndex); None o sin cargar para no usar el umbral
+        """
+        if not self.ready:
+            return
+        if course_index is None or not course_index.ready:
+            self.umbral_catalogo = None
+            return
+        similitudes = [similitud_catalogo(v, course_index) for v in self._vectores_cursos]
+        self.umbral_catalogo = float(np.percentile(similitudes, self.percentil_catalogo))
+
+    def decidir(self, keywords: str, vector, similitud_cat: float | None = None) -> dict | None:
+        """
+        Decide el tipo de búsqueda a partir del embedding de las keywords.
+
+        Args:
+            keywords: Keywords locales del mensaje
+            vector: Embedding de las keywords
+            similitud_cat: Similitud máxima con el catálogo (None si no hay catálogo)
+
+        Returns:
+            dict | None: {"keywords", "busqueda", "margen"} como `search_keywords`, o None si se debe consultar a Gemini
+        """
+        vector = normalizar(vector)
+        diferencia = float(vector @ self.centroides[BUSQUEDA_CURSOS] - vector @ self.centroides[BUSQUEDA_GENERAL])
+        if diferencia >= self.margen:
+            tipo = BUSQUEDA_CURSOS
+        elif diferencia <= -self.margen and (self.umbral_catalogo is None or similitud_cat is None or similitud_cat < self.umbral_catalogo):
+            tipo = BUSQUEDA_GENERAL
+        else:
+            return None
+        return {"keywords": keywords, "busqueda": tipo, "margen": round(diferencia, 3)}
+
+    async def enrutar(self, mensaje: str, contexto: list, obtener_embedding, course_index=None) -> dict | None:
+        """
+        Clasifica un mensaje de /chat sin Gemini si es un caso claro.
+
+        Args:
+            mensaje: Mensaje del usuario
+            contexto: Conversación previa
+            obtener_embedding: Función asíncrona que recibe un texto y devuelve su embedding
+            course_index: Índice local de cursos (CourseIndex); None para no comparar con el catálogo
+
+        Returns:
+            dict | None: Keywords y tipo de búsqueda, o None si el mensaje se debe enviar a Gemini
+        """
+        if not self.ready or depende_del_contexto(mensaje, contexto):
+            return None
+        keywords = keywords_locales(mensaje)
+        if not keywords:
+            return None
+        vector = await obtener_embedding(keywords)
+        similitud_cat = similitud_catalogo(vector, course_index) if course_index is not None and course_index.ready else None
+        return self.decidir(keywords, vector, similitud_cat)
+
+
+def similitud_catalogo(vector, course_index) -> float:
+    """Similitud coseno entre un embedding y el curso más parecido del índice local."""
+    mejores = course_index.search(vector, limit=1)
+    return mejores[0].score if mejores else 0.0
@@ -0,0 +1,169 @@
+"""
+Evaluación del enrutador de intención local (`enrutador_intencion.py`) sobre las consultas etiquetadas.
+
+Calcula con VertexAI los embeddings de las keywords locales de todas las consultas y, si hay conexión con Qdrant,
+carga el catálogo en un índice local para el umbral del catálogo. Las consultas sin conversación previa se
+evalúan con validación cruzada (`--pliegues`): el enrutador se ajusta con el resto de pliegues y nunca ve la
+consulta que clasifica. Las consultas con conversación previa se evalúan con el enrutador ajustado con todas.
+
+Para cada margen de `--margenes` muestra:
+- llamadas_gemini_evitadas: proporción de consultas que el enrutador decide sin Gemini.
+- exactitud_local: aciertos entre las consultas decididas localmente.
+- exactitud_total: aciertos de todo el flujo, suponiendo que Gemini acierta en las consultas que se le envían
+  o, con `--gemini`, usando sus respuestas reales (y se muestra también la exactitud de Gemini sin enrutador).
+- errores: consultas decididas localmente con el tipo de búsqueda equivocado.
+
+Uso:
+    python evaluar_enrutador.py
+    python evaluar_enrutador.py --margenes 0.02 0.05 0.1 --gemini
+    python evaluar_enrutador.py --sin-catalogo --pliegues 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import numpy as np
+import vertexai
+from dotenv import load_dotenv
+from vertexai.language_models import TextEmbeddingModel
+from enrutador_intencion import EnrutadorIntencion, cargar_consultas, keywords_locales, depende_del_contexto, similitud_catalogo, BUSQUEDA_GENERAL, BUSQUEDA_CURSOS
+from operations import crear_embeddings, search_keywords
+
+load_dotenv(dotenv_path='chatbot.env')
+
+EMBEDDING_MODEL_NAME = "text-multilingual-embedding-002"
+
+
+def pliegues_estratificados(etiquetas: list, n_pliegues: int, semilla: int) -> list:
+    """Asigna cada consulta a un pliegue manteniendo la proporción de cada tipo de búsqueda."""
+    rng = random.Random(semilla)
+    pliegue = [0] * len(etiquetas)
+    for tipo in sorted(set(etiquetas)):
+        indices = [i for i, e in enumerate(etiquetas) if e == tipo]
+        rng.shuffle(indices)
+        for n, i in enumerate(indices):
+            pliegue[i] = n % n_pliegues
+    return pliegue
+
+
+def evaluar(consultas: list, vectores: np.ndarray, margen: float, n_pliegues: int, semilla: int,
+            similitudes: list | None = None, respuestas_gemini: list | None = None) -> dict:
+    """
+    Evalúa el enrutador con un margen dado.
+
+    Args:
+        consultas: Consultas etiquetadas
+        vectores: Embeddings de las keywords locales de cada consulta
+        margen: Margen del enrutador
+        n_pliegues: Pliegues de la validación cruzada
+        semilla: Semilla del reparto en pliegues
+        similitudes: Similitud máxima de cada consulta con el catálogo (None si no hay catálogo)
+        respuestas_gemini: Tipo de búsqueda que devuelve Gemini para cada consulta (None para suponer que acierta)
+
+    Returns:
+        dict: Métricas del enrutador
+    """
+    sin_contexto = [i for i, c in enumerate(consultas) if not c.get("contexto")]
+    con_contexto = [i for i, c in enumerate(consultas) if c.get("contexto")]
+    etiquetas = [c["busqueda"] for c in consultas]
+    pliegue = dict(zip(sin_contexto, pliegues_estratificados([etiquetas[i] for i in sin_contexto], n_pliegues, semilla)))
+
+    def ajustado(indices: list) -> EnrutadorIntencion:
+        enrutador = EnrutadorIntencion(margen=margen)
+        enrutador.ajustar(vectores[indices], [etiquetas[i] for i in indices],
+                          [similitudes[i] for i in indices] if similitudes is not None else None)
+        return enrutador
+
+    decisiones = {}
+    for p in range(n_pliegues):
+        enrutador = ajustado([i for i in sin_contexto if pliegue[i] != p])
+        for i in (i for i in sin_contexto if pliegue[i] == p):
+            decisiones[i] = enrutador.decidir(keywords_locales(consultas[i]["consulta"]), vectores[i],
+                                              similitudes[i] if similitudes is not None else None)
+    enrutador = ajustado(sin_contexto)
+    for i in con_contexto:
+        if depende_del_contexto(consultas[i]["consulta"], consultas[i]["contexto"]):
+            decisiones[i] = None
+        else:
+            decisiones[i] = enrutador.decidir(keywords_locales(consultas[i]["consulta"]), vectores[i],
+                                              similitudes[i] if similitudes is not None else None)
+
+    locales = [i for i, d in decisiones.items() if d is not None]
+    aciertos_locales = [i for i in locales if decisiones[i]["busqueda"] == etiquetas[i]]
+    if respuestas_gemini is None:
+        aciertos_gemini = [i for i, d in decisiones.items() if d is None]
+    else:
+        aciertos_gemini = [i for i, d in decisiones.items() if d is None and respuestas_gemini[i] == etiquetas[i]]
+    return {
+        "margen": margen,
+        "consultas": len(consultas),
+        "llamadas_gemini_evitadas": round(len(locales) / len(consultas), 3),
+        "exactitud_local": round(len(aciertos_locales) / len(locales), 3) if locales else None,
+        "exactitud_total": round((len(aciertos_locales) + len(aciertos_gemini)) / len(consultas), 3),
+        "consultas_con_contexto_enviadas_a_gemini": f"{sum(decisiones[i] is None for i in con_contexto)}/{len(con_contexto)}",
+        "errores": [{"consulta": consultas[i]["consulta"], "esperado": etiquetas[i], "enrutador": decisiones[i]["busqueda"],
+                     "margen": decisiones[i]["margen"]} for i in locales if i not in aciertos_locales],
+    }
+
+
+async def similitudes_catalogo(vectores: np.ndarray) -> list | None:
+    """Carga el catálogo de Qdrant en un índice local y devuelve la similitud máxima de cada vector con él."""
+    from qdrant_client import AsyncQdrantClient
+    from indice_cursos import CourseIndex
+    qdrant_client = AsyncQdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    try:
+        course_index = CourseIndex("cursos")
+        await course_index.refresh(qdrant_client)
+    finally:
+        await qdrant_client.close()
+    if not course_index.ready:
+        return None
+    return [similitud_catalogo(v, course_index) for v in vectores]
+
+
+async def respuestas_de_gemini(consultas: list) -> list:
+    """Clasifica todas las consultas con Gemini, con el mismo prompt que /chat."""
+    from tools import generar_modelo
+    from instrucciones import instrucciones_keywords
+    gemini_keywords = generar_modelo(instrucciones_keywords)
+    respuestas = []
+    for c in consultas:
+        prompt = f"###Conversación previa que debes tener en cuenta para responder: {str(c.get('contexto', []))}\n###Consulta actual: {c['consulta']}"
+        resultado = await search_keywords(prompt=prompt, gemini_keywords=gemini_keywords)
+        respuestas.append(BUSQUEDA_GENERAL if resultado["busqueda"] == BUSQUEDA_GENERAL else BUSQUEDA_CURSOS)
+    return respuestas
+
+
+async def main_async(args) -> dict:
+    consultas = cargar_consultas(args.consultas)
+    vertexai.init(project=os.getenv("VERTEXAI_PROJECT"), location=os.getenv("VERTEXAI_LOCATION"))
+    embedding_model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)
+    vectores = np.asarray(await crear_embeddings([keywords_locales(c["consulta"]) for c in consultas], embedding_model), dtype=np.float32)
+    similitudes = None if args.sin_catalogo else await similitudes_catalogo(vectores)
+    respuestas_gemini = await respuestas_de_gemini(consultas) if args.gemini else None
+
+    resultado = {"catalogo": similitudes is not None}
+    if respuestas_gemini is not None:
+        aciertos = sum(r == c["busqueda"] for r, c in zip(respuestas_gemini, consultas))
+        resultado["exactitud_gemini_sin_enrutador"] = round(aciertos / len(consultas), 3)
+    resultado["margenes"] = [evaluar(consultas, vectores, m, args.pliegues, args.semilla, similitudes, respuestas_gemini)
+                             for m in args.margenes]
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evalúa el enrutador de intención local sobre consultas etiquetadas.")
+    parser.add_argument("--consultas", default="consultas_etiquetadas.json", help="Fichero JSON con las consultas etiquetadas.")
+    parser.add_argument("--margenes", type=float, nargs="+", default=[0.0, 0.02, 0.05, 0.08, 0.1], help="Márgenes a evaluar.")
+    parser.add_argument("--pliegues", type=int, default=5, help="Pliegues de la validación cruzada.")
+    parser.add_argument("--semilla", type=int, default=0, help="Semilla del reparto en pliegues.")
+    parser.add_argument("--sin-catalogo", action="store_true", help="No cargar el catálogo de Qdrant.")
+    parser.add_argument("--gemini", action="store_true", help="Clasificar también todas las consultas con Gemini.")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(main_async(args)), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import json
+import logging
+import numpy as np
+from qdrant_client.http.models import Record, ScoredPoint
+
+logger = logging.getLogger(__name__)
+
+
+class CourseIndex:
+    """
+    Copia en memoria de la colección de cursos de Qdrant para buscar sin llamadas de red.
+
+    Los vectores se guardan en una matriz float32 contigua con las filas normalizadas, de modo que la
+    similitud coseno con una consulta es un producto matriz-vector. Qdrant sigue siendo la fuente de verdad:
+    en cada comprobación se leen los puntos de la colección y el índice se recarga si cambia su versión (la
+    colección a la que apunta el alias y un hash de los IDs, payloads y vectores, de modo que también se
+    detectan los upserts que no cambian el número de puntos). No se carga si la colección supera
+    `max_courses`, en cuyo caso las búsquedas van a Qdrant.
+
+    Los resultados usan los mismos tipos que el cliente de Qdrant (`ScoredPoint` y `Record`), así que el
+    código que los formatea no cambia.
+    """
+    def __init__(self, collection_name: str, max_courses: int = 1000):
+        """
+        Args:
+            collection_name: Colección (o alias) de Qdrant con los cursos
+            max_courses: Número máximo de cursos para usar el índice local
+        """
+        self.collection_name = collection_name
+        self.max_courses = max_courses
+        self.version = None
+        self.ready = False
+        self._ids = []
+        self._payloads = []
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._payload_ids = np.empty(0, dtype=np.int64)
+        self._rows = {}
+        self._masks = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    async def _current_collection(self, qdrant_client) -> tuple:
+        """La colección real a la que apunta el alias en Qdrant y su número de puntos (None si Qdrant no lo conoce)."""
+        aliases = await qdrant_client.get_aliases()
+        target = next((a.collection_name for a in aliases.aliases if a.alias_name == self.collection_name), self.collection_name)
+        info = await qdrant_client.get_collection(target)
+        return target, info.points_count
+
+    @staticmethod
+    def _digest(records: list) -> str:
+        """Hash de los IDs, payloads y vectores de los puntos, para detectar cambios sin reconstruir el índice."""
+        digest = hashlib.sha1()
+        for r in records:
+            digest.update(json.dumps([r.id, r.payload or {}], sort_keys=True, default=str).encode("utf-8"))
+            digest.update(np.asarray(r.vector, dtype=np.float32).tobytes())
+        return digest.hexdigest()
+
+    async def refresh(self, qdrant_client) -> bool:
+        """
+        Recarga el índice si la versión de la colección ha cambiado.
+
+        Args:
+            qdrant_client: Cliente asíncrono de Qdrant
+
+        Returns:
+            bool: True si el índice se ha recargado
+        """
+        target, points_count = await self._current_collection(qdrant_client)
+        if points_count is not None and points_count > self.max_courses:
+            return self._disable(target, points_count)
+
+        # Si Qdrant no informa del número de puntos, se cuenta al leerlos y se deja de leer al pasar del máximo
+        records, offset = [], None
+        while True:
+            batch, offset = await qdrant_client.scroll(
+                collection_name=target,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            records.extend(batch)
+            if len(records) > self.max_courses:
+                return self._disable(target, f"más de {self.max_courses}")
+            if offset is None:
+                break
+        version = (target, self._digest(records))
+        if version == self.version:
+            return False
+        self._load(records)
+        self.version, self.ready = version, True
+        logger.info(f"Índice de cursos cargado desde {target}: {len(records)} cursos")
+        return True
+
+    def _disable(self, target: str, points_count) -> bool:
+        """Vacía el índice porque la colección supera `max_courses`; devuelve True si no lo estaba ya."""
+        version = (target, points_count)
+        if version == self.version:
+            return False
+        logger.info(f"La colección {target} tiene {points_count} cursos (máximo {self.max_courses}): las búsquedas irán a Qdrant")
+        self.version, self.ready = version, False
+        self._load([])
+        return True
+
+    def _load(self, records: list):
+        """Construye la matriz normalizada y las tablas de búsqueda a partir de los puntos de Qdrant."""
+        ids = [r.id for r in records]
+        payloads = [r.payload or {} for r in records]
+        vectors = np.ascontiguousarray([r.vector for r in records], dtype=np.float32) if records else np.empty((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True) if records else np.empty((0, 1), dtype=np.float32)
+        matrix = vectors / np.where(norms == 0, 1, norms)
+        # No hay ningún await entre la construcción y la sustitución: las búsquedas ven el índice anterior o el nuevo
+        self._ids, self._payloads, self._vectors, self._matrix = ids, payloads, vectors, matrix
+        self._payload_ids = np.array([p.get("id", -1) for p in payloads], dtype=np.int64)
+        self._rows = {point_id: row for row, point_id in enumerate(ids)}
+        self._masks = {}
+
+    def _mask(self, field: str, value) -> np.ndarray:
+        """Máscara de los cursos cuyo payload tiene `field` igual a `value` (se calcula una vez por índice)."""
+        key = (field, value)
+        if key not in self._masks:
+            self._masks[key] = np.array([p.get(field) == value for p in self._payloads], dtype=bool)
+        return self._masks[key]
+
+    def search(self, vector, limit: int = 10, exclude_ids: list | None = None, filters: dict | None = None) -> list:
+        """
+        Busca los cursos más similares a un vector por similitud coseno.
+
+        Args:
+            vector: Embedding de la consulta
+            limit: Número máximo de resultados
+            exclude_ids: IDs de curso (campo `id` del payload) que no se devuelven
+            filters: Condiciones de igualdad sobre el payload, por ejemplo {"nivel": "Avanzado"}
+
+        Returns:
+            list: Cursos como `ScoredPoint`, ordenados de mayor a menor similitud
+        """
+        matrix = self._matrix
+        if len(matrix) == 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = matrix @ (query / norm if norm else query)
+
+        allowed = np.ones(len(scores), dtype=bool)
+        if exclude_ids:
+            allowed &= ~np.isin(self._payload_ids, [int(i) for i in exclude_ids])
+        for field, value in (filters or {}).items():
+            allowed &= self._mask(field, value)
+        candidates = np.flatnonzero(allowed)
+        if len(candidates) == 0:
+            return []
+
+        k = min(limit, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [ScoredPoint(id=self._ids[row], version=0, score=float(scores[row]), payload=self._payloads[row]) for row in top]
+
+    def retrieve(self, ids: list, with_vectors: bool = False) -> list:
+        """
+        Devuelve los cursos con los IDs de punto indicados, en el mismo orden y omitiendo los que no existen.
+
+        Args:
+            ids: IDs de punto de Qdrant
+            with_vectors: Si se incluye el vector original de cada curso
+
+        Returns:
+            list: Cursos como `Record`
+        """
+        rows = [self._rows[i] for i in ids if i in self._rows]
+        return [Record(id=self._ids[row], payload=self._payloads[row],
+                       vector=self._vectors[row].tolist() if with_vectors else None) for row in rows]
+
+    async def refresh_loop(self, qdrant_client, interval_seconds: float, on_reload=None):
+        """
+        Comprueba la colección cada `interval_seconds` y recarga el índice si ha cambiado.
+
+        Args:
+            qdrant_client: Cliente asíncrono de Qdrant
+            interval_seconds: Segundos entre comprobaciones
+            on_reload: Función sin argumentos que se llama después de cada recarga (None para ninguna)
+        """
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if await self.refresh(qdrant_client) and on_reload is not None:
+                    on_reload()
+            except Exception as e:
+                logger.error(f"Error al actualizar el índice de cursos: {e}")
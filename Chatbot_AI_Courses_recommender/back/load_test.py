@@ -0,0 +1,95 @@
+"""
+Prueba de carga de los endpoints `/chat` y `/recommended_courses`.
+
+Lanza `--usuarios` usuarios concurrentes contra la API; cada uno envía `--peticiones` peticiones seguidas
+al endpoint indicado (o alterna entre los dos con `--endpoint ambos`). Todas las peticiones comparten un
+único cliente HTTP asíncrono con un pool de conexiones del tamaño del número de usuarios.
+
+Al terminar muestra, para cada endpoint, el número de peticiones, el rendimiento (peticiones por segundo),
+las latencias p50, p95 y p99 y los errores por tipo (código HTTP o excepción).
+
+Uso:
+    python load_test.py --url http://localhost:8000 --usuarios 100 --peticiones 10 --email usuario@ejemplo.com
+    python load_test.py --endpoint chat --usuarios 200 --mensaje "Busco un curso de Python"
+"""
+import argparse
+import asyncio
+import json
+import time
+import httpx
+
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil `p` (0-100) por rango más cercano de una lista ya ordenada."""
+    if not valores:
+        return 0.0
+    rango = max(0, min(len(valores) - 1, round(p / 100 * len(valores) + 0.5) - 1))
+    return valores[rango]
+
+
+async def peticion(cliente: httpx.AsyncClient, endpoint: str, args) -> tuple[str, float, str | None]:
+    """
+    Envía una petición al endpoint y devuelve el endpoint, la latencia en segundos y el error (None si terminó bien).
+    """
+    if endpoint == "chat":
+        cuerpo = {"message": args.mensaje, "contexto": [], "email": args.email}
+    else:
+        cuerpo = {"email": args.email}
+    inicio = time.perf_counter()
+    try:
+        respuesta = await cliente.post(f"/{endpoint}", json=cuerpo)
+        error = None if respuesta.status_code == 200 else f"HTTP {respuesta.status_code}"
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    return endpoint, time.perf_counter() - inicio, error
+
+
+async def usuario(cliente: httpx.AsyncClient, indice: int, args, resultados: list):
+    """Simula un usuario que envía sus peticiones una detrás de otra."""
+    endpoints = ["chat", "recommended_courses"] if args.endpoint == "ambos" else [args.endpoint]
+    for i in range(args.peticiones):
+        resultados.append(await peticion(cliente, endpoints[(indice + i) % len(endpoints)], args))
+
+
+async def prueba_carga(args) -> dict:
+    """
+    Ejecuta la prueba de carga y devuelve las estadísticas por endpoint.
+    """
+    resultados = []
+    limites = httpx.Limits(max_connections=args.usuarios, max_keepalive_connections=args.usuarios)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limites) as cliente:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(usuario(cliente, i, args, resultados) for i in range(args.usuarios)))
+        duracion = time.perf_counter() - inicio
+
+    estadisticas = {"usuarios": args.usuarios, "segundos": round(duracion, 2), "endpoints": {}}
+    for endpoint in sorted({r[0] for r in resultados}):
+        latencias = sorted(r[1] * 1000 for r in resultados if r[0] == endpoint)
+        errores = [r[2] for r in resultados if r[0] == endpoint and r[2] is not None]
+        estadisticas["endpoints"][endpoint] = {
+            "peticiones": len(latencias),
+            "errores": {tipo: errores.count(tipo) for tipo in sorted(set(errores))},
+            "peticiones_por_segundo": round(len(latencias) / duracion, 1),
+            "p50_ms": round(percentil(latencias, 50), 1),
+            "p95_ms": round(percentil(latencias, 95), 1),
+            "p99_ms": round(percentil(latencias, 99), 1),
+        }
+    return estadisticas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de /chat y /recommended_courses.")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL base de la API.")
+    parser.add_argument("--endpoint", choices=["chat", "recommended_courses", "ambos"], default="ambos", help="Endpoint a probar.")
+    parser.add_argument("--usuarios", type=int, default=100, help="Usuarios concurrentes.")
+    parser.add_argument("--peticiones", type=int, default=10, help="Peticiones por usuario.")
+    parser.add_argument("--email", default="usuario@ejemplo.com", help="Email del usuario de prueba (debe existir en Supabase y Firestore).")
+    parser.add_argument("--mensaje", default="Quiero aprender análisis de datos con Python", help="Mensaje enviado a /chat.")
+    parser.add_argument("--timeout", type=float, default=60, help="Timeout de cada petición en segundos.")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(prueba_carga(args)), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,24 @@
-from fastapi import FastAPI, status, HTTPException
+from fastapi import FastAPI, status, HTTPException, Request, Response
 from instrucciones import *
 from tools import generar_modelo
 from clases import *
 from operations import *
+from cache_embeddings import EmbeddingCache
+from indice_cursos import CourseIndex
+from enrutador_intencion import EnrutadorIntencion, cargar_consultas
+from metricas import etapa, traza_actual, cabecera_server_timing, ColectorEstado, PETICION_SEGUNDOS, RAMA_TOTAL, ENRUTADOR_TOTAL
+from prometheus_client import REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+import asyncio
 import logging
 import json
 import vertexai
 from vertexai.language_models import TextEmbeddingModel
-from qdrant_client import QdrantClient
-from supabase import create_client
-from firebase_admin import credentials, firestore
+from qdrant_client import AsyncQdrantClient
+from supabase._async.client import create_client as create_async_client
+from firebase_admin import credentials, firestore, firestore_async
 import firebase_admin
 import os
+import time
 from dotenv import load_dotenv
 
 # Configuración de logging
@@ -30,13 +37,36 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 CREDENCIALES_FIRESTORE = os.getenv("CREDENCIALES_FIRESTORE")
 COLLECTION_NAME = "cursos"
+EMBEDDING_MODEL_NAME = "text-multilingual-embedding-002"
 
-def arranque():
+# Caché de embeddings de las consultas: LRU en memoria con caducidad y, si se indica un fichero,
+# un nivel en disco (SQLite) compartido por todos los workers
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", "")
+
+# Índice de cursos en memoria: búsquedas locales mientras el catálogo no supere COURSE_INDEX_MAX_COURSES,
+# comprobando cada COURSE_INDEX_REFRESH_SECONDS si la colección de Qdrant ha cambiado
+COURSE_INDEX_ENABLED = os.getenv("COURSE_INDEX_ENABLED", "true").lower() == "true"
+COURSE_INDEX_MAX_COURSES = int(os.getenv("COURSE_INDEX_MAX_COURSES", "1000"))
+COURSE_INDEX_REFRESH_SECONDS = float(os.getenv("COURSE_INDEX_REFRESH_SECONDS", "60"))
+
+# Enrutador de intención local: decide sin Gemini el tipo de búsqueda de los mensajes claros, comparando el embedding
+# de sus keywords con los centroides de las consultas etiquetadas de INTENT_ROUTER_QUERIES_FILE
+# Desactivado por defecto hasta medir su precisión con embeddings reales de VertexAI (ver evaluar_enrutador.py)
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "false").lower() == "true"
+INTENT_ROUTER_QUERIES_FILE = os.getenv("INTENT_ROUTER_QUERIES_FILE", "consultas_etiquetadas.json")
+INTENT_ROUTER_MARGIN = float(os.getenv("INTENT_ROUTER_MARGIN", "0.05"))
+
+async def arranque():
     """
     Inicializa todos los modelos y clientes necesarios para la aplicación.
     - Inicializa VertexAI y carga los modelos de Gemini
     - Crea el modelo de embeddings
-    - Inicializa clientes para Qdrant y Supabase
+    - Inicializa clientes asíncronos para Qdrant, Supabase y Firestore
+    
+    Los clientes se crean una sola vez y se comparten entre peticiones para reutilizar las conexiones.
     
     Returns:
         None, pero establece variables globales para toda la aplicación
@@ -45,7 +75,7 @@ def arranque():
         ValueError: Si hay errores durante la inicialización de los servicios
     """
     try:
-        global gemini_keywords, gemini_revision, text_embedding_model, gemini_general, qdrant_client, sup, db
+        global gemini_keywords, gemini_revision, text_embedding_model, gemini_general, qdrant_client, sup, db, embedding_cache, course_index, course_index_task, intent_router
         
         # Inicializar servicio de VertexAI
         logger.info("Inicializando VertexAI...")
@@ -59,18 +89,55 @@ def arranque():
         
         # Cargar modelo de embeddings
         logger.info("Cargando modelo de embeddings...")
-        text_embedding_model = TextEmbeddingModel.from_pretrained("text-multilingual-embedding-002")
+        text_embedding_model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)
+        embedding_cache = EmbeddingCache(
+            EMBEDDING_MODEL_NAME,
+            max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+            ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+            disk_path=EMBEDDING_CACHE_FILE or None
+        ) if EMBEDDING_CACHE_ENABLED else None
         
         # Inicializar cliente Qdrant para búsqueda vectorial
         logger.info("Conectando a Qdrant...")
-        qdrant_client = QdrantClient(
+        qdrant_client = AsyncQdrantClient(
             url=QDRANT_URL, 
             api_key=QDRANT_API_KEY,
         )
         
+        # Cargar el catálogo de cursos en memoria; si falla, las búsquedas van a Qdrant hasta la siguiente comprobación
+        course_index, course_index_task = None, None
+        if COURSE_INDEX_ENABLED:
+            logger.info("Cargando índice de cursos...")
+            course_index = CourseIndex(COLLECTION_NAME, max_courses=COURSE_INDEX_MAX_COURSES)
+            try:
+                await course_index.refresh(qdrant_client)
+            except Exception as e:
+                logger.error(f"Error al cargar el índice de cursos, se usará Qdrant: {e}")
+            # Tras cada recarga del índice, el enrutador de intención recalcula su umbral con el catálogo nuevo
+            course_index_task = asyncio.create_task(course_index.refresh_loop(
+                qdrant_client,
+                COURSE_INDEX_REFRESH_SECONDS,
+                on_reload=lambda: intent_router.actualizar_catalogo(course_index) if intent_router is not None else None
+            ))
+        
+        # Ajustar el enrutador de intención; si falla, todas las consultas van a Gemini
+        intent_router = None
+        if INTENT_ROUTER_ENABLED:
+            logger.info("Ajustando enrutador de intención...")
+            try:
+                intent_router = EnrutadorIntencion(margen=INTENT_ROUTER_MARGIN)
+                await intent_router.preparar(
+                    cargar_consultas(INTENT_ROUTER_QUERIES_FILE),
+                    lambda textos: crear_embeddings(textos, text_embedding_model),
+                    course_index
+                )
+            except Exception as e:
+                logger.error(f"Error al ajustar el enrutador de intención, se usará Gemini: {e}")
+                intent_router = None
+        
         # Inicializar cliente Supabase para gestión de usuarios
         logger.info("Conectando a Supabase...")
-        sup = create_client(
+        sup = await create_async_client(
             SUPABASE_URL,
             SUPABASE_KEY
         )
@@ -79,37 +146,102 @@ def arranque():
         logger.info("Conectando a Firebase...")
         cred = credentials.Certificate(CREDENCIALES_FIRESTORE)  #Este archivo se descarga entero en la pestaña "Cuentas de servicio", haz clic en "Generar nueva clave privada"
         firebase_admin.initialize_app(cred)
-        db = firestore.client()
+        db = firestore_async.client()
+        
+        # Exponer en /metrics el estado de la caché de embeddings y del índice de cursos (una sola vez por proceso)
+        global colector_estado
+        if colector_estado is None:
+            colector_estado = ColectorEstado(lambda: embedding_cache, lambda: course_index)
+            REGISTRY.register(colector_estado)
         logger.info("Inicialización completada con éxito")
     except Exception as e:
         logger.error(f"Error durante la inicialización: {e}")
         raise ValueError(f"Error al iniciar las conexiones: {e}")
 
-# Crear la aplicación FastAPI con función de arranque
-app = FastAPI(on_startup=[arranque])
+async def cierre():
+    """
+    Cierra las conexiones de los clientes de Qdrant, Supabase y Firestore al parar la aplicación.
+    """
+    try:
+        if course_index_task is not None:
+            course_index_task.cancel()
+        await qdrant_client.close()
+        await sup.postgrest.aclose()
+        db.close()
+        logger.info("Conexiones cerradas")
+    except Exception as e:
+        logger.error(f"Error al cerrar las conexiones: {e}")
+
+colector_estado = None
+
+# Crear la aplicación FastAPI con funciones de arranque y cierre
+app = FastAPI(on_startup=[arranque], on_shutdown=[cierre])
+
+
+@app.middleware("http")
+async def medir_peticion(request: Request, call_next):
+    """
+    Mide cada petición: guarda la duración en el histograma de peticiones (por ruta, método y código)
+    y devuelve en la cabecera Server-Timing la duración de cada etapa registrada con `etapa` y el total.
+    """
+    traza = []
+    token = traza_actual.set(traza)
+    inicio = time.perf_counter()
+    codigo = 500
+    try:
+        response = await call_next(request)
+        codigo = response.status_code
+    finally:
+        total = time.perf_counter() - inicio
+        traza_actual.reset(token)
+        # Se usa la plantilla de la ruta (/get_history/{email}) para no crear una serie por usuario
+        route = request.scope.get("route")
+        ruta = route.path if route is not None else "desconocida"
+        PETICION_SEGUNDOS.labels(ruta, request.method, str(codigo)).observe(total)
+    response.headers["Server-Timing"] = cabecera_server_timing(traza, total)
+    return response
 
 
 @app.get("/get_history/{email}")
-def extraer_historial(email:str) -> dict: 
+async def extraer_historial(email:str) -> dict: 
     """
     Llama a la base de datos de histórico de conversaciones, filtra por usuario.
     Devuelve las conversaciones en un diccionario.
     """
     #Histórico de las conversaciones
-    docs = db.collection("chat_history").document(email).get()
-    print("docctype:",type(docs))
-    print("docs: ",docs)
+    with etapa("historial"):
+        docs = await db.collection("chat_history").document(email).get()
     return {docs.id:docs.to_dict()}
 
 @app.delete("/clear_history/{email}")
-def clear_history(email: str):
+async def clear_history(email: str):
     try:
-        db.collection("chat_history").document(email).update({"hist": [{"role": "assistant", "content": "¡Hola! ¿En qué puedo ayudarte hoy?"}]})
+        await db.collection("chat_history").document(email).update({"hist": [{"role": "assistant", "content": "¡Hola! ¿En qué puedo ayudarte hoy?"}]})
         return {"content": "Historial borrado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/cache_stats")
+async def cache_stats() -> dict:
+    """
+    Devuelve las métricas de la caché de embeddings de este worker: aciertos en memoria y en disco,
+    fallos, tasa de aciertos y tiempo ahorrado estimado.
+    """
+    if embedding_cache is None:
+        return {"activa": False}
+    return {"activa": True, **embedding_cache.stats()}
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Métricas de este worker en formato Prometheus: histogramas de latencia por etapa y por ruta,
+    ramas de /chat, origen del tipo de búsqueda (enrutador local o Gemini), errores por etapa, caché de embeddings
+    e índice de cursos.
+    """
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
 
 def handle_error(e: Exception, operation: str, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR):
     """
@@ -127,7 +259,7 @@ def handle_error(e: Exception, operation: str, status_code=status.HTTP_500_INTER
     raise HTTPException(status_code=status_code, detail=f"Error en {operation}")
 
 @app.post("/chat")
-def chat(message: Mensaje):
+async def chat(message: Mensaje):
     """
     Endpoint para procesar mensajes del usuario y devolver cursos relevantes.
     Sigue un pipeline de procesamiento:
@@ -153,10 +285,29 @@ def chat(message: Mensaje):
     except Exception as e:
         return handle_error(e, "preparación del mensaje")
 
+    # Clasificar localmente los mensajes claros; los ambiguos o que dependen de la conversación van a Gemini
+    search_result = None
+    if intent_router is not None:
+        try:
+            with etapa("enrutador"):
+                search_result = await intent_router.enrutar(
+                    mensaje,
+                    contexto,
+                    lambda texto: embedding_consulta(texto, text_embedding_model, embedding_cache),
+                    course_index
+                )
+        except Exception as e:
+            logger.error(f"Error en el enrutador de intención, se usará Gemini: {e}")
+        ENRUTADOR_TOTAL.labels("local" if search_result is not None else "gemini").inc()
+
     try:
         # Extraer keywords y determinar tipo de búsqueda con Gemini
-        logger.info("Extrayendo keywords y tipo de búsqueda...")
-        search_result = search_keywords(prompt=prompt, gemini_keywords=gemini_keywords)
+        if search_result is None:
+            logger.info("Extrayendo keywords y tipo de búsqueda...")
+            with etapa("keywords"):
+                search_result = await search_keywords(prompt=prompt, gemini_keywords=gemini_keywords)
+        else:
+            logger.info(f"Tipo de búsqueda decidido localmente (margen {search_result['margen']})")
         keywords = search_result["keywords"]
         tipo_busqueda = search_result["busqueda"]
         logger.info(f"Keywords extraídas: {keywords}")
@@ -166,29 +317,36 @@ def chat(message: Mensaje):
 
     # Si es búsqueda general, usar modelo general sin búsqueda vectorial
     if tipo_busqueda == "busqueda general":
+        RAMA_TOTAL.labels("general").inc()
         logger.info("Ejecutando búsqueda general con Gemini...")
         try:
-            respuesta = gemini_general.generate_content([prompt])
+            with etapa("general"):
+                respuesta = await gemini_general.generate_content_async([prompt])
+                respuesta_general = json.loads(respuesta.text)
             # Actualizar historial, incluye la pregunta actual del usuario y la respuesta del LLM
-            nuevos_mensajes = [ {"role": "user", "content": mensaje}, {"role": "assistant", "content":json.loads(respuesta.text)["respuesta"]}]
+            nuevos_mensajes = [ {"role": "user", "content": mensaje}, {"role": "assistant", "content":respuesta_general["respuesta"]}]
             doc_ref = db.collection("chat_history").document(email)
-            doc_ref.update({"hist": firestore.ArrayUnion(nuevos_mensajes)})
-            print("Historial actualizado") 
-            return json.loads(respuesta.text)
+            with etapa("historial"):
+                await doc_ref.update({"hist": firestore.ArrayUnion(nuevos_mensajes)})
+            logger.info("Historial actualizado")
+            return respuesta_general
         except Exception as e:
             return handle_error(e, "generación de respuesta general")
 
     try:
         # Buscar cursos relevantes mediante búsqueda vectorial
         logger.info("Realizando búsqueda vectorial...")
-        resultados = busqueda_vectorial(
+        resultados = await busqueda_vectorial(
             keywords=keywords, 
             embedding_model=text_embedding_model, 
-            qdrant_client=qdrant_client
+            qdrant_client=qdrant_client,
+            embedding_cache=embedding_cache,
+            course_index=course_index
         )
         
         if not resultados:
             logger.info("No se encontraron cursos relevantes")
+            RAMA_TOTAL.labels("sin_cursos").inc()
             return FinalOutput(coursesCount=0, courses=[])
     except Exception as e:
         return handle_error(e, "búsqueda de cursos")
@@ -196,18 +354,21 @@ def chat(message: Mensaje):
     try:
         # Revisar resultados con LLM para filtrar los más relevantes
         logger.info("Revisando resultados con LLM...")
-        cursos_seleccionados = revision_llm(
-            prompt=prompt,
-            productos=resultados,
-            gemini_revision=gemini_revision
-        )
+        with etapa("revision"):
+            cursos_seleccionados = await revision_llm(
+                prompt=prompt,
+                productos=resultados,
+                gemini_revision=gemini_revision
+            )
         
         if not cursos_seleccionados:
             logger.info("No se seleccionaron cursos después de la revisión")
+            RAMA_TOTAL.labels("sin_cursos").inc()
             nuevos_mensajes = [ {"role": "user", "content": mensaje}, {"role": "assistant", "content":"Lo siento pero no he encontrado cursos que puedan ayudarte"}]
             doc_ref = db.collection("chat_history").document(email)
-            doc_ref.update({"hist": firestore.ArrayUnion(nuevos_mensajes)})
-            print("Historial actualizado") 
+            with etapa("historial"):
+                await doc_ref.update({"hist": firestore.ArrayUnion(nuevos_mensajes)})
+            logger.info("Historial actualizado")
             return FinalOutput(coursesCount=0, courses=[])
     except Exception as e:
         return handle_error(e, "revisión de cursos con LLM")
@@ -239,17 +400,19 @@ def chat(message: Mensaje):
     )
     
     logger.info(f"Respuesta generada con {len(salida_final)} cursos")
+    RAMA_TOTAL.labels("cursos" if salida_final else "sin_cursos").inc()
     salida_final_str = str([f"Curso: {i.name}" for i in salida_final])
      # Actualizar historial, incluye la pregunta actual del usuario y la respuesta del LLM
     nuevos_mensajes = [ {"role": "user", "content": mensaje}, {"role": "assistant", "content": salida_final_str}]
     doc_ref = db.collection("chat_history").document(email)
-    doc_ref.update({"hist": firestore.ArrayUnion(nuevos_mensajes)})
+    with etapa("historial"):
+        await doc_ref.update({"hist": firestore.ArrayUnion(nuevos_mensajes)})
 
     return salida_adaptada
 
 
 @app.post("/login")
-def log_in(user: User):
+async def log_in(user: User):
     """
     Autentica a un usuario verificando sus credenciales en Supabase.
     
@@ -271,7 +434,7 @@ def log_in(user: User):
     
     try:
         # Verificar credenciales en Supabase
-        user_exists = verify_user_in_supabase(email, password, sup)
+        user_exists = await verify_user_in_supabase(email, password, sup)
         if not user_exists:
             logger.warning(f"Intento de login fallido para: {email}")
             raise HTTPException(
@@ -289,7 +452,7 @@ def log_in(user: User):
 
 
 @app.post("/register")
-def register(user: User):
+async def register(user: User):
     """
     Registra un nuevo usuario en Supabase.
     
@@ -311,8 +474,8 @@ def register(user: User):
     
     try:
         # Crear nuevo usuario en Supabase
-        user_created = create_user_in_supabase(email, password, sup)
-        conversation_created  = create_conversation_in_firestore(email, db)
+        user_created = await create_user_in_supabase(email, password, sup)
+        conversation_created  = await create_conversation_in_firestore(email, db)
         if not user_created:
             logger.warning(f"Error al crear usuario: {email}")
             raise HTTPException(
@@ -343,7 +506,7 @@ def register(user: User):
 
 
 @app.post("/recommended_courses")
-def get_recommended_courses(user: User):
+async def get_recommended_courses(user: User):
     """
     Obtiene cursos recomendados para un usuario específico basados en su embedding.
     
@@ -361,7 +524,7 @@ def get_recommended_courses(user: User):
     
     try:
         # Obtener recomendaciones basadas en embedding del usuario
-        resultados = recommended(email, qdrant_client, sup)
+        resultados = await recommended(email, qdrant_client, sup, course_index)
         logger.info(f"Se encontraron {len(resultados)} cursos recomendados")
         
         # Convertir resultados al formato esperado por el cliente
@@ -392,7 +555,7 @@ def get_recommended_courses(user: User):
 
 
 @app.post("/update_embeddings_user")
-def update(user: User):
+async def update(user: User):
     """
     Actualiza el embedding de un usuario basado en un curso seleccionado.
     Esto mejora las recomendaciones futuras.
@@ -412,7 +575,7 @@ def update(user: User):
     
     try:
         # Actualizar embedding del usuario basado en el curso seleccionado
-        success = update_embedding_user(email, id_curso, qdrant_client, sup)
+        success = await update_embedding_user(email, id_curso, qdrant_client, sup, course_index)
         if success:
             logger.info(f"Embedding actualizado con éxito para: {email}")
             return True
@@ -424,7 +587,7 @@ def update(user: User):
 
 
 @app.post("/update_courses_user")
-def update_courses_user(user: User):
+async def update_courses_user(user: User):
     """
     Añade un curso a la lista de cursos inscritos de un usuario.
     
@@ -443,7 +606,7 @@ def update_courses_user(user: User):
     
     try:
         # Añadir curso a la lista de cursos del usuario
-        success = update_course_user(email, id_curso, sup)
+        success = await update_course_user(email, id_curso, sup)
         if success:
             logger.info(f"Curso añadido con éxito para usuario: {email}")
             return True
@@ -455,7 +618,7 @@ def update_courses_user(user: User):
 
 
 @app.post("/my_courses")
-def my__courses(user: User):
+async def my__courses(user: User):
     """
     Obtiene la lista de cursos en los que está inscrito un usuario.
     
@@ -473,7 +636,7 @@ def my__courses(user: User):
     
     try:
         # Obtener lista de cursos del usuario
-        cursos = my_courses(email, qdrant_client, sup)
+        cursos = await my_courses(email, qdrant_client, sup, course_index)
         logger.info(f"Se encontraron {len(cursos)} cursos para usuario: {email}")
         return {"courses": cursos}
     except Exception as e:
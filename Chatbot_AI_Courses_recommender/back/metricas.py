@@ -0,0 +1,86 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Límites de los histogramas en segundos: desde búsquedas locales (ms) hasta llamadas lentas a Gemini
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+
+ETAPA_SEGUNDOS = Histogram("chat_etapa_segundos", "Duración de cada etapa de las peticiones", ["etapa"], buckets=BUCKETS)
+ETAPA_ERRORES = Counter("chat_etapa_errores_total", "Etapas que terminaron con una excepción", ["etapa"])
+RAMA_TOTAL = Counter("chat_rama_total", "Consultas de /chat por rama: general, cursos o sin_cursos (búsqueda de cursos sin resultados)", ["rama"])
+ENRUTADOR_TOTAL = Counter("chat_enrutador_total", "Consultas de /chat por quién decide el tipo de búsqueda: local o gemini", ["origen"])
+PETICION_SEGUNDOS = Histogram("http_peticion_segundos", "Duración de las peticiones HTTP", ["ruta", "metodo", "codigo"], buckets=BUCKETS)
+
+# Etapas de la petición en curso (nombre, segundos); la crea el middleware de main.py
+traza_actual: ContextVar[list | None] = ContextVar("traza_actual", default=None)
+
+
+@contextmanager
+def etapa(nombre: str):
+    """
+    Mide una etapa de la petición en curso: la añade al histograma de etapas, a la traza de la petición
+    (para la cabecera Server-Timing) y, si termina con una excepción, al contador de errores.
+
+    Args:
+        nombre: Nombre de la etapa, sin espacios (se usa como etiqueta y en Server-Timing)
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ETAPA_ERRORES.labels(nombre).inc()
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        ETAPA_SEGUNDOS.labels(nombre).observe(segundos)
+        traza = traza_actual.get()
+        if traza is not None:
+            traza.append((nombre, segundos))
+
+
+def cabecera_server_timing(traza: list, total_segundos: float) -> str:
+    """
+    Construye la cabecera Server-Timing con las etapas de una petición y su duración total en milisegundos.
+    Si una etapa se repite, se suman sus duraciones.
+    """
+    duraciones = {}
+    for nombre, segundos in traza:
+        duraciones[nombre] = duraciones.get(nombre, 0.0) + segundos
+    partes = [f"{nombre};dur={segundos * 1000:.1f}" for nombre, segundos in duraciones.items()]
+    partes.append(f"total;dur={total_segundos * 1000:.1f}")
+    return ", ".join(partes)
+
+
+class ColectorEstado:
+    """
+    Colector de Prometheus que lee en cada consulta a /metrics el estado de la caché de embeddings
+    y del índice de cursos, sin que esos módulos dependan de Prometheus.
+    """
+    def __init__(self, obtener_cache, obtener_indice):
+        """
+        Args:
+            obtener_cache: Función que devuelve la caché de embeddings (o None si está desactivada)
+            obtener_indice: Función que devuelve el índice de cursos (o None si está desactivado)
+        """
+        self.obtener_cache = obtener_cache
+        self.obtener_indice = obtener_indice
+
+    def collect(self):
+        cache = self.obtener_cache()
+        if cache is not None:
+            stats = cache.stats()
+            aciertos = CounterMetricFamily("embedding_cache_aciertos", "Aciertos de la caché de embeddings por nivel", labels=["nivel"])
+            aciertos.add_metric(["memoria"], stats["aciertos_memoria"])
+            aciertos.add_metric(["disco"], stats["aciertos_disco"])
+            aciertos.add_metric(["calculo_en_curso"], stats["aciertos_calculo_en_curso"])
+            yield aciertos
+            yield CounterMetricFamily("embedding_cache_fallos", "Fallos de la caché de embeddings", value=stats["fallos"])
+            yield CounterMetricFamily("embedding_cache_segundos_ahorrados", "Tiempo estimado ahorrado por la caché de embeddings",
+                                      value=stats["ms_ahorrados"] / 1000)
+            yield GaugeMetricFamily("embedding_cache_entradas", "Embeddings en la caché en memoria", value=stats["entradas_memoria"])
+        indice = self.obtener_indice()
+        if indice is not None:
+            yield GaugeMetricFamily("indice_cursos_activo", "1 si las búsquedas usan el índice local de cursos", value=int(indice.ready))
+            yield GaugeMetricFamily("indice_cursos_cursos", "Cursos cargados en el índice local", value=len(indice))
@@ -1,13 +1,15 @@
+import asyncio
 import json
 import logging
 from qdrant_client.http.models import Filter, FieldCondition, MatchValue
 from vertexai.language_models import TextEmbeddingInput
 from datetime import datetime
+from metricas import etapa
 # Configuración de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def search_keywords(prompt: str, gemini_keywords) -> dict:
+async def search_keywords(prompt: str, gemini_keywords) -> dict:
     """
     Extrae palabras clave y tipo de búsqueda de un prompt utilizando el modelo Gemini.
     
@@ -24,7 +26,7 @@ def search_keywords(prompt: str, gemini_keywords) -> dict:
     try:
         logger.debug(f"Enviando prompt a Gemini para extracción de keywords: {prompt[:50]}...")
         content = [prompt]
-        response = gemini_keywords.generate_content(content)
+        response = await gemini_keywords.generate_content_async(content)
         
         # Convertir la respuesta a formato JSON
         result = json.loads(response.text)
@@ -34,7 +36,7 @@ def search_keywords(prompt: str, gemini_keywords) -> dict:
         logger.error(f"Error en search_keywords: {e}")
         raise
 
-def revision_llm(prompt: str, productos: list, gemini_revision) -> list:
+async def revision_llm(prompt: str, productos: list, gemini_revision) -> list:
     """
     Revisa una lista de productos y filtra los más relevantes para la consulta del usuario
     utilizando el modelo Gemini para tomar decisiones inteligentes.
@@ -54,7 +56,7 @@ def revision_llm(prompt: str, productos: list, gemini_revision) -> list:
         logger.debug(f"Enviando {len(productos)} productos a Gemini para revisión...")
         # Crear un único contenido combinando la consulta y los productos
         content = [f"#Conversacion previa y consulta:\n{prompt}\n#Productos a elegir:\n{productos}"]
-        response = gemini_revision.generate_content(content)
+        response = await gemini_revision.generate_content_async(content)
         
         # Convertir la respuesta a lista de IDs
         result = json.loads(response.text)
@@ -64,7 +66,118 @@ def revision_llm(prompt: str, productos: list, gemini_revision) -> list:
         logger.error(f"Error en revision_llm: {e}")
         raise
 
-def busqueda_vectorial(keywords: str, embedding_model, qdrant_client) -> list:
+async def crear_embedding(texto: str, embedding_model, dimensiones: int = 768) -> list:
+    """
+    Calcula el embedding de un texto con el modelo de VertexAI.
+    
+    Args:
+        texto: Texto a convertir en vector
+        embedding_model: Modelo de embeddings
+        dimensiones: Dimensión del embedding
+    
+    Returns:
+        list: Vector de embedding
+    """
+    input_text = [TextEmbeddingInput(text=texto, task_type="SEMANTIC_SIMILARITY")]
+    embeddings = await embedding_model.get_embeddings_async(input_text, output_dimensionality=dimensiones, auto_truncate=False)
+    return list(embeddings[0].values)
+
+async def crear_embeddings(textos: list, embedding_model, dimensiones: int = 768, tam_lote: int = 100) -> list:
+    """
+    Calcula los embeddings de varios textos con el modelo de VertexAI, en lotes de `tam_lote` textos por llamada.
+    
+    Args:
+        textos: Textos a convertir en vectores
+        embedding_model: Modelo de embeddings
+        dimensiones: Dimensión de los embeddings
+        tam_lote: Textos por llamada al modelo
+    
+    Returns:
+        list: Vectores de embedding, en el mismo orden que los textos
+    """
+    vectores = []
+    for inicio in range(0, len(textos), tam_lote):
+        input_text = [TextEmbeddingInput(text=texto, task_type="SEMANTIC_SIMILARITY") for texto in textos[inicio:inicio + tam_lote]]
+        embeddings = await embedding_model.get_embeddings_async(input_text, output_dimensionality=dimensiones, auto_truncate=False)
+        vectores.extend(list(e.values) for e in embeddings)
+    return vectores
+
+async def embedding_consulta(texto: str, embedding_model, embedding_cache=None) -> list:
+    """
+    Devuelve el embedding de una consulta desde la caché si ya se calculó o, si no, lo calcula con VertexAI.
+    
+    Args:
+        texto: Texto de la consulta
+        embedding_model: Modelo de embeddings
+        embedding_cache: Caché de embeddings de consultas (EmbeddingCache); None para calcularlo siempre
+    
+    Returns:
+        list: Vector de embedding
+    """
+    if embedding_cache is not None:
+        vector = await embedding_cache.get_or_compute(texto, 768, lambda: crear_embedding(texto, embedding_model))
+        return vector.tolist()
+    return await crear_embedding(texto, embedding_model)
+
+async def buscar_cursos(vector: list, qdrant_client, limit: int, course_index=None, exclude_ids: list | None = None) -> list:
+    """
+    Busca los cursos más similares a un vector en el índice local si está cargado o, si no, en Qdrant.
+    
+    Args:
+        vector: Embedding de la consulta o del usuario
+        qdrant_client: Cliente asíncrono de Qdrant
+        limit: Número máximo de cursos
+        course_index: Índice local de cursos (CourseIndex); None para buscar siempre en Qdrant
+        exclude_ids: IDs de curso que no se deben devolver
+    
+    Returns:
+        list: Cursos encontrados (con `score` y `payload`) ordenados por similitud
+    """
+    if course_index is not None and course_index.ready:
+        return course_index.search(vector, limit=limit, exclude_ids=exclude_ids)
+    query_filter = Filter(
+        must_not=[
+            FieldCondition(
+                key='id',
+                match=MatchValue(
+                    value=int(curso_id)
+                )
+            ) for curso_id in exclude_ids
+        ]
+    ) if exclude_ids else None
+    search_result = await qdrant_client.query_points(
+        collection_name="cursos",
+        query=vector,
+        limit=limit,
+        # score_threshold=0.4,  # Umbral de similaridad mínima (comentado)
+        with_payload=True,  # Incluir los metadatos de cada curso
+        query_filter=query_filter
+    )
+    return search_result.points
+
+async def recuperar_cursos(ids: list, qdrant_client, course_index=None, with_vectors: bool = False) -> list:
+    """
+    Obtiene cursos por ID del índice local si está cargado o, si no, de Qdrant.
+    
+    Args:
+        ids: IDs de los cursos
+        qdrant_client: Cliente asíncrono de Qdrant
+        course_index: Índice local de cursos (CourseIndex); None para leer siempre de Qdrant
+        with_vectors: Si se incluye el vector de cada curso
+    
+    Returns:
+        list: Cursos encontrados (con `payload` y, si se piden, `vector`)
+    """
+    if course_index is not None and course_index.ready:
+        return course_index.retrieve(ids, with_vectors=with_vectors)
+    return await qdrant_client.retrieve(
+        collection_name="cursos",
+        ids=ids,
+        with_vectors=with_vectors,
+        with_payload=True
+    )
+
+async def busqueda_vectorial(keywords: str, embedding_model, qdrant_client, embedding_cache=None, course_index=None) -> list:
     """
     Realiza una búsqueda vectorial en Qdrant utilizando embeddings para encontrar
     cursos semánticamente similares a las keywords proporcionadas.
@@ -72,7 +185,9 @@ def busqueda_vectorial(keywords: str, embedding_model, qdrant_client) -> list:
     Args:
         keywords: Texto con palabras clave para la búsqueda
         embedding_model: Modelo de embeddings para convertir texto a vectores
-        qdrant_client: Cliente de Qdrant para realizar la búsqueda
+        qdrant_client: Cliente asíncrono de Qdrant para realizar la búsqueda
+        embedding_cache: Caché de embeddings de consultas (EmbeddingCache); None para calcularlo siempre
+        course_index: Índice local de cursos (CourseIndex); None para buscar siempre en Qdrant
     
     Returns:
         list: Lista de cursos similares ordenados por relevancia
@@ -83,22 +198,13 @@ def busqueda_vectorial(keywords: str, embedding_model, qdrant_client) -> list:
     try:
         logger.info(f"Realizando búsqueda vectorial para: '{keywords}'")
         
-        # Crear embedding de la consulta (convertir texto a vector)
-        input_text = [TextEmbeddingInput(text=keywords, task_type="SEMANTIC_SIMILARITY")]
-        embedding_user = list(embedding_model.get_embeddings(input_text, output_dimensionality=768, auto_truncate=False)[0].values)
-        
-        # Nombre de la colección donde se encuentran los cursos
-        collection_name = "cursos"
-        logger.debug(f"Colecciones disponibles: {qdrant_client.get_collections()}")
-        
-        # Realizar la búsqueda vectorial usando el embedding generado
-        search_result = qdrant_client.search(
-            collection_name=collection_name,
-            query_vector=embedding_user,
-            limit=10,  # Limitar a 10 resultados más similares
-            # score_threshold=0.4,  # Umbral de similaridad mínima (comentado)
-            with_payload=True  # Incluir los metadatos de cada curso
-        )
+        # Crear embedding de la consulta (convertir texto a vector), desde la caché si ya se calculó
+        with etapa("embedding"):
+            embedding_user = await embedding_consulta(keywords, embedding_model, embedding_cache)
+        
+        # Realizar la búsqueda vectorial usando el embedding generado (10 resultados más similares)
+        with etapa("busqueda"):
+            search_result = await buscar_cursos(embedding_user, qdrant_client, limit=10, course_index=course_index)
         
         # Formatear resultados para devolverlos en un formato consistente
         resultados = []
@@ -121,14 +227,14 @@ def busqueda_vectorial(keywords: str, embedding_model, qdrant_client) -> list:
         logger.error(f"Error en busqueda_vectorial: {e}")
         raise
 
-def verify_user_in_supabase(email: str, password: str, supabase_client) -> bool:
+async def verify_user_in_supabase(email: str, password: str, supabase_client) -> bool:
     """
     Verifica si existe un usuario con el email y contraseña proporcionados.
     
     Args:
         email: Email del usuario
         password: Contraseña del usuario
-        supabase_client: Cliente de Supabase para realizar la consulta
+        supabase_client: Cliente asíncrono de Supabase para realizar la consulta
     
     Returns:
         bool: True si el usuario existe y las credenciales son correctas
@@ -139,7 +245,7 @@ def verify_user_in_supabase(email: str, password: str, supabase_client) -> bool:
     try:
         logger.info(f"Verificando usuario: {email}")
         # Consultar la tabla 'users' filtrando por email y password
-        response = (supabase_client.table("users")
+        response = await (supabase_client.table("users")
                     .select("*")
                     .eq("email", email)
                     .eq("password", password)
@@ -153,14 +259,14 @@ def verify_user_in_supabase(email: str, password: str, supabase_client) -> bool:
         logger.error(f"Error al verificar usuario {email}: {e}")
         raise
 
-def create_user_in_supabase(email: str, password: str, supabase_client) -> bool:
+async def create_user_in_supabase(email: str, password: str, supabase_client) -> bool:
     """
     Crea un nuevo usuario en Supabase con un embedding inicial.
     
     Args:
         email: Email del nuevo usuario
         password: Contraseña del nuevo usuario
-        supabase_client: Cliente de Supabase para realizar operaciones
+        supabase_client: Cliente asíncrono de Supabase para realizar operaciones
     
     Returns:
         bool: True si el usuario fue creado exitosamente
@@ -172,7 +278,7 @@ def create_user_in_supabase(email: str, password: str, supabase_client) -> bool:
     try:
         logger.info(f"Verificando si ya existe el usuario: {email}")
         # Comprobar si el email ya existe
-        check_response = (supabase_client.table("users")
+        check_response = await (supabase_client.table("users")
                          .select("email")
                          .eq("email", email)
                          .execute())
@@ -183,7 +289,7 @@ def create_user_in_supabase(email: str, password: str, supabase_client) -> bool:
         
         logger.info(f"Creando nuevo usuario: {email}")
         # Si no existe, crear el usuario con un embedding inicial de zeros
-        response = (supabase_client.table("users")
+        response = await (supabase_client.table("users")
                    .insert({"email": email, "password": password, "embeddings": [float(0.0)]*768})
                    .execute())
         
@@ -197,13 +303,13 @@ def create_user_in_supabase(email: str, password: str, supabase_client) -> bool:
         logger.error(f"Error al crear usuario {email}: {e}")
         raise
 
-def search_embedding_user(email: str, supabase_client) -> list:
+async def search_embedding_user(email: str, supabase_client) -> list:
     """
     Obtiene el embedding de un usuario almacenado en Supabase.
     
     Args:
         email: Email del usuario
-        supabase_client: Cliente de Supabase para realizar la consulta
+        supabase_client: Cliente asíncrono de Supabase para realizar la consulta
     
     Returns:
         list: Vector de embedding del usuario
@@ -213,7 +319,7 @@ def search_embedding_user(email: str, supabase_client) -> list:
     """
     try:
         logger.info(f"Obteniendo embedding para usuario: {email}")
-        response = (supabase_client.table("users")
+        response = await (supabase_client.table("users")
                    .select("embeddings")
                    .eq("email", email)
                    .execute())
@@ -229,15 +335,16 @@ def search_embedding_user(email: str, supabase_client) -> list:
         logger.error(f"Error al buscar embedding para {email}: {e}")
         raise
 
-def recommended(email: str, qdrant_client, supabase_client) -> list:
+async def recommended(email: str, qdrant_client, supabase_client, course_index=None) -> list:
     """
     Obtiene cursos recomendados para un usuario basados en su embedding,
     excluyendo los cursos en los que ya está inscrito.
     
     Args:
         email: Email del usuario
-        qdrant_client: Cliente de Qdrant para la búsqueda vectorial
-        supabase_client: Cliente de Supabase para obtener datos del usuario
+        qdrant_client: Cliente asíncrono de Qdrant para la búsqueda vectorial
+        supabase_client: Cliente asíncrono de Supabase para obtener datos del usuario
+        course_index: Índice local de cursos (CourseIndex); None para buscar siempre en Qdrant
     
     Returns:
         list: Lista de cursos recomendados
@@ -247,49 +354,28 @@ def recommended(email: str, qdrant_client, supabase_client) -> list:
     """
     try:
         logger.info(f"Generando recomendaciones para: {email}")
-        # Obtener cursos inscritos para excluirlos de recomendaciones
-        response = (supabase_client.table("users")
-                   .select("cursos_inscritos")
-                   .eq("email", email)
-                   .execute())
+        # Obtener a la vez los cursos inscritos (para excluirlos de las recomendaciones)
+        # y el embedding del usuario (para buscar cursos similares)
+        response, user_embedding = await asyncio.gather(
+            supabase_client.table("users")
+            .select("cursos_inscritos")
+            .eq("email", email)
+            .execute(),
+            search_embedding_user(email, supabase_client)
+        )
         
         cursos_inscritos = response.data[0].get("cursos_inscritos", []) if response.data else []
         logger.info(f"Usuario {email} tiene {len(cursos_inscritos) if cursos_inscritos else 0} cursos inscritos")
         
-        collection_name = "cursos"
-        logger.debug(f"Colecciones disponibles: {qdrant_client.get_collections()}")
-        
-        # Recuperar el embedding del usuario para buscar cursos similares
-        user_embedding = search_embedding_user(email, supabase_client)
-        
         # Si el usuario tiene cursos inscritos, excluirlos de la búsqueda
         if cursos_inscritos and cursos_inscritos != []:
             logger.info(f"Excluyendo {len(cursos_inscritos)} cursos ya inscritos de las recomendaciones")
-            search_result = qdrant_client.search(
-                collection_name=collection_name,
-                query_vector=user_embedding,
-                limit=5,  # Limitar a 5 recomendaciones
-                with_payload=True,
-                query_filter=Filter(
-                    must_not=[
-                        FieldCondition(
-                            key='id',
-                            match=MatchValue(
-                                value=int(curso_id)
-                            )
-                        ) for curso_id in cursos_inscritos
-                    ]
-                )
-            )
         else:
             # Si no tiene cursos inscritos, recomendar los más similares a su embedding
             logger.info("No hay cursos inscritos, recomendando basado solo en el embedding")
-            search_result = qdrant_client.search(
-                collection_name=collection_name,
-                query_vector=user_embedding,
-                limit=5,
-                with_payload=True
-            )
+        # Limitar a 5 recomendaciones
+        search_result = await buscar_cursos(user_embedding, qdrant_client, limit=5, course_index=course_index,
+                                            exclude_ids=cursos_inscritos or None)
             
         # Formatear resultados
         resultados = []
@@ -312,7 +398,7 @@ def recommended(email: str, qdrant_client, supabase_client) -> list:
         logger.error(f"Error al generar recomendaciones para {email}: {e}")
         raise
 
-def update_embedding_user(email: str, id_curso: str, qdrant_client, supabase_client) -> bool:
+async def update_embedding_user(email: str, id_curso: str, qdrant_client, supabase_client, course_index=None) -> bool:
     """
     Actualiza el embedding de un usuario combinándolo con el embedding de un curso seleccionado.
     Esto permite mejorar futuras recomendaciones basándose en los intereses del usuario.
@@ -320,8 +406,9 @@ def update_embedding_user(email: str, id_curso: str, qdrant_client, supabase_cli
     Args:
         email: Email del usuario
         id_curso: ID del curso seleccionado
-        qdrant_client: Cliente de Qdrant para obtener el embedding del curso
-        supabase_client: Cliente de Supabase para actualizar el embedding del usuario
+        qdrant_client: Cliente asíncrono de Qdrant para obtener el embedding del curso
+        supabase_client: Cliente asíncrono de Supabase para actualizar el embedding del usuario
+        course_index: Índice local de cursos (CourseIndex); None para leer siempre de Qdrant
     
     Returns:
         bool: True si la actualización fue exitosa
@@ -333,12 +420,11 @@ def update_embedding_user(email: str, id_curso: str, qdrant_client, supabase_cli
     try:
         logger.info(f"Actualizando embedding de {email} con curso ID {id_curso}")
         
-        # Obtener el curso por ID junto con su vector de embedding
-        points = qdrant_client.retrieve(
-            collection_name="cursos",
-            ids=[int(id_curso)],
-            with_vectors=True,
-            with_payload=True
+        # Obtener a la vez el curso por ID junto con su vector de embedding (índice local o Qdrant)
+        # y el embedding actual del usuario (Supabase)
+        points, user_response = await asyncio.gather(
+            recuperar_cursos([int(id_curso)], qdrant_client, course_index, with_vectors=True),
+            supabase_client.table("users").select("embeddings").eq("email", email).execute()
         )
         
         if not points:
@@ -349,9 +435,6 @@ def update_embedding_user(email: str, id_curso: str, qdrant_client, supabase_cli
         curso_embedding = points[0].vector
         logger.debug(f"Embedding del curso obtenido: {len(curso_embedding)} dimensiones")
         
-        # Obtener el embedding actual del usuario
-        user_response = supabase_client.table("users").select("embeddings").eq("email", email).execute()
-        
         if not user_response.data:
             logger.warning(f"No se encontró el usuario con email {email}")
             raise ValueError(f"No se encontró el usuario con email {email}")
@@ -365,7 +448,7 @@ def update_embedding_user(email: str, id_curso: str, qdrant_client, supabase_cli
         logger.debug(f"Nuevo embedding calculado: {len(new_embedding)} dimensiones")
         
         # Actualizar el embedding del usuario en Supabase
-        update_response = supabase_client.table("users").update({"embeddings": new_embedding}).eq("email", email).execute()
+        update_response = await supabase_client.table("users").update({"embeddings": new_embedding}).eq("email", email).execute()
         
         success = update_response.data is not None
         logger.info(f"Embedding de {email} {'actualizado con éxito' if success else 'falló al actualizarse'}")
@@ -374,14 +457,14 @@ def update_embedding_user(email: str, id_curso: str, qdrant_client, supabase_cli
         logger.error(f"Error al actualizar embedding para {email}: {e}")
         raise
 
-def update_course_user(email: str, id_curso: str, supabase_client) -> bool:
+async def update_course_user(email: str, id_curso: str, supabase_client) -> bool:
     """
     Añade un curso a la lista de cursos inscritos del usuario.
     
     Args:
         email: Email del usuario
         id_curso: ID del curso a añadir
-        supabase_client: Cliente de Supabase para actualizar los datos
+        supabase_client: Cliente asíncrono de Supabase para actualizar los datos
     
     Returns:
         bool: True si la actualización fue exitosa
@@ -393,7 +476,7 @@ def update_course_user(email: str, id_curso: str, supabase_client) -> bool:
         logger.info(f"Añadiendo curso {id_curso} a los cursos de usuario {email}")
         
         # Obtener la lista actual de cursos inscritos
-        response = (supabase_client.table("users")
+        response = await (supabase_client.table("users")
                    .select("cursos_inscritos")
                    .eq("email", email)
                    .execute())
@@ -404,13 +487,13 @@ def update_course_user(email: str, id_curso: str, supabase_client) -> bool:
         # Actualizar la lista de cursos añadiendo el nuevo
         if cursos_inscritos is not None and cursos_inscritos != []:
             # Si ya tiene cursos, añadir el nuevo a la lista existente
-            update_response = (supabase_client.table("users")
+            update_response = await (supabase_client.table("users")
                              .update({"cursos_inscritos": cursos_inscritos + [int(id_curso)]})
                              .eq("email", email)
                              .execute())
         else:
             # Si no tiene cursos, crear una nueva lista con este curso
-            update_response = (supabase_client.table("users")
+            update_response = await (supabase_client.table("users")
                              .update({"cursos_inscritos": [int(id_curso)]})
                              .eq("email", email)
                              .execute())
@@ -422,14 +505,15 @@ def update_course_user(email: str, id_curso: str, supabase_client) -> bool:
         logger.error(f"Error al añadir curso {id_curso} para {email}: {e}")
         raise
 
-def my_courses(email: str, qdrant_client, supabase_client) -> list:
+async def my_courses(email: str, qdrant_client, supabase_client, course_index=None) -> list:
     """
     Obtiene información detallada de los cursos en los que está inscrito un usuario.
     
     Args:
         email: Email del usuario
-        qdrant_client: Cliente de Qdrant para obtener detalles de los cursos
-        supabase_client: Cliente de Supabase para obtener IDs de cursos inscritos
+        qdrant_client: Cliente asíncrono de Qdrant para obtener detalles de los cursos
+        supabase_client: Cliente asíncrono de Supabase para obtener IDs de cursos inscritos
+        course_index: Índice local de cursos (CourseIndex); None para leer siempre de Qdrant
     
     Returns:
         list: Lista de cursos inscritos con todos sus detalles
@@ -441,7 +525,7 @@ def my_courses(email: str, qdrant_client, supabase_client) -> list:
         logger.info(f"Obteniendo cursos inscritos para: {email}")
         
         # Obtener IDs de cursos inscritos desde Supabase
-        user_courses = supabase_client.table("users").select("cursos_inscritos").eq("email", email).execute()
+        user_courses = await supabase_client.table("users").select("cursos_inscritos").eq("email", email).execute()
         
         cursos_id = user_courses.data[0]["cursos_inscritos"] if user_courses.data else None
         
@@ -452,13 +536,8 @@ def my_courses(email: str, qdrant_client, supabase_client) -> list:
         
         logger.info(f"Usuario {email} tiene {len(cursos_id)} cursos inscritos")
         
-        # Obtener detalles de los cursos desde Qdrant
-        points = qdrant_client.retrieve(
-            collection_name="cursos",
-            ids=cursos_id,
-            with_vectors=True,
-            with_payload=True
-        )
+        # Obtener detalles de los cursos desde el índice local o desde Qdrant (sin vectores, no se usan)
+        points = await recuperar_cursos(cursos_id, qdrant_client, course_index)
         
         # Formatear resultados
         resultados = []
@@ -481,13 +560,13 @@ def my_courses(email: str, qdrant_client, supabase_client) -> list:
         raise
 
 
-def create_conversation_in_firestore(email: str, db) -> bool:
+async def create_conversation_in_firestore(email: str, db) -> bool:
     """
     Crea un nuevo documento de conversación en Firestore para un usuario.
     
     Args:
         email: Email del usuario
-        db: Cliente de Firestore
+        db: Cliente asíncrono de Firestore
     
     Returns:
         bool: True si la conversación se creó exitosamente
@@ -495,7 +574,7 @@ def create_conversation_in_firestore(email: str, db) -> bool:
     try:
         logger.info(f"Creando conversación para: {email}")
         # Crear nuevo documento de conversación
-        db.collection("chat_history").document(email).set({
+        await db.collection("chat_history").document(email).set({
             "email": email,
             "fecha": datetime.now(),
             "hist": [{"role": "assistant", "content": "¡Hola! ¿En qué puedo ayudarte hoy?"}]